@@ -0,0 +1,83 @@
+"""Admission control for requests that write.
+
+Every client (by remote address) gets a token bucket: WRITE_BURST writes at
+once, refilled at WRITE_RATE per second. On top of that only
+MAX_PENDING_WRITES write requests may be in progress in a worker at a time;
+they queue on the single writer connection, so anything beyond that would
+just wait out the busy timeout. Requests over either limit are turned away
+straight away with a Retry-After (429 for the client's own limit, 503 when
+the worker is saturated), which keeps the wait for admitted writes short
+during bursts.
+
+Limits are per worker process. The counters behind /api/admission show how
+often each limit kicks in.
+"""
+import math
+import os
+import threading
+import time
+
+WRITE_RATE = float(os.environ.get('TRACKER_WRITE_RATE', 5))
+WRITE_BURST = int(os.environ.get('TRACKER_WRITE_BURST', 20))
+MAX_PENDING_WRITES = int(os.environ.get('TRACKER_MAX_PENDING_WRITES', 16))
+
+# Seconds a client is told to wait when the worker is saturated
+BUSY_RETRY_SECONDS = 1
+
+# Buckets kept before idle (full) ones are forgotten
+MAX_CLIENTS = 10000
+
+
+class Admission:
+    """Per-client token buckets plus a bounded count of writes in progress"""
+
+    def __init__(self, rate=WRITE_RATE, burst=WRITE_BURST, max_pending=MAX_PENDING_WRITES):
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._pending = 0
+        self._counters = {'admitted': 0, 'rate_limited': 0, 'saturated': 0, 'peak_pending': 0}
+
+    def _refill(self, client, now):
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _forget_idle(self, now):
+        """Drop buckets that have refilled completely - they behave like new clients"""
+        for client in [client for client in self._buckets if self._refill(client, now) >= self.burst]:
+            del self._buckets[client]
+
+    def admit(self, client):
+        """None if the write may go ahead (call release() when done), else (status, retry seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(client, now)
+            if tokens < 1:
+                self._counters['rate_limited'] += 1
+                self._buckets[client] = (tokens, now)
+                return 429, math.ceil((1 - tokens) / self.rate)
+
+            if self._pending >= self.max_pending:
+                self._counters['saturated'] += 1
+                return 503, BUSY_RETRY_SECONDS
+
+            if client not in self._buckets and len(self._buckets) >= MAX_CLIENTS:
+                self._forget_idle(now)
+            self._buckets[client] = (tokens - 1, now)
+            self._pending += 1
+            self._counters['admitted'] += 1
+            self._counters['peak_pending'] = max(self._counters['peak_pending'], self._pending)
+            return None
+
+    def release(self):
+        """Mark an admitted write as finished"""
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self):
+        """Counters since the worker started, plus what is in progress now"""
+        with self._lock:
+            return dict(self._counters, pending=self._pending, clients=len(self._buckets),
+                        max_pending=self.max_pending, rate=self.rate, burst=self.burst)
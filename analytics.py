@@ -0,0 +1,390 @@
+import itertools
+from datetime import date
+
+import numpy as np
+
+import database
+
+# Keyword -> muscle group, checked in order against the lowercased exercise name
+MUSCLE_GROUPS = [
+    ('bench', 'Chest'),
+    ('chest', 'Chest'),
+    ('fly', 'Chest'),
+    ('push up', 'Chest'),
+    ('pushup', 'Chest'),
+    ('dip', 'Chest'),
+    ('squat', 'Legs'),
+    ('leg', 'Legs'),
+    ('lunge', 'Legs'),
+    ('calf', 'Legs'),
+    ('hamstring', 'Legs'),
+    ('quad', 'Legs'),
+    ('deadlift', 'Back'),
+    ('row', 'Back'),
+    ('pull', 'Back'),
+    ('chin', 'Back'),
+    ('lat', 'Back'),
+    ('shrug', 'Back'),
+    ('shoulder', 'Shoulders'),
+    ('overhead', 'Shoulders'),
+    ('military', 'Shoulders'),
+    ('raise', 'Shoulders'),
+    ('press', 'Shoulders'),
+    ('curl', 'Arms'),
+    ('bicep', 'Arms'),
+    ('tricep', 'Arms'),
+    ('extension', 'Arms'),
+    ('skull', 'Arms'),
+    ('plank', 'Core'),
+    ('crunch', 'Core'),
+    ('sit up', 'Core'),
+    ('situp', 'Core'),
+    ('ab', 'Core'),
+]
+OTHER_GROUP = 'Other'
+
+# Column cache - reloaded only when workouts change or a year is archived
+_columns = None
+_columns_key = None
+# Bumped on every full reload; appends keep it, so row positions stay valid within a generation
+_generations = itertools.count(1)
+
+# Strength forecasts: a least-squares line per exercise through its recent sessions
+FORECAST_WINDOW_DAYS = 120
+FORECAST_HORIZON_DAYS = 28
+MIN_FORECAST_SESSIONS = 3
+WEIGHT_INCREMENT = 2.5
+
+# Fitted parameters, refit only for exercises that gained rows since the last fit
+_forecast = None
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def muscle_group_for(exercise_name):
+    """Map an exercise name to a muscle group"""
+    name = exercise_name.lower()
+    for keyword, group in MUSCLE_GROUPS:
+        if keyword in name:
+            return group
+    return OTHER_GROUP
+
+
+def _build_columns(rows, previous=None):
+    """Turn (id, date, exercise, weight, reps, sets, volume) rows into NumPy columns, appending to previous"""
+    if rows:
+        ids, dates, names, weights, reps, sets, volumes = zip(*rows)
+    else:
+        ids, dates, names, weights, reps, sets, volumes = (), (), (), (), (), (), ()
+
+    exercise_names = list(previous['exercise_names']) if previous else []
+    exercise_index = {name: i for i, name in enumerate(exercise_names)}
+    for name in names:
+        if name not in exercise_index:
+            exercise_index[name] = len(exercise_names)
+            exercise_names.append(name)
+
+    group_names = sorted({group for _, group in MUSCLE_GROUPS} | {OTHER_GROUP})
+    new_columns = {
+        'day': np.array(dates, dtype='datetime64[D]').astype(np.int64) + _EPOCH_ORDINAL,
+        'exercise_id': np.array([exercise_index[name] for name in names], dtype=np.int64),
+        'weight': np.array(weights, dtype=np.float64),
+        'reps': np.array(reps, dtype=np.float64),
+        'sets': np.array(sets, dtype=np.float64),
+        'volume': np.array(volumes, dtype=np.float64),
+    }
+    for key in ('weight', 'reps', 'sets', 'volume'):
+        np.nan_to_num(new_columns[key], copy=False)
+
+    if previous:
+        for key in new_columns:
+            new_columns[key] = np.concatenate((previous[key], new_columns[key]))
+
+    new_columns['exercise_names'] = exercise_names
+    new_columns['group_names'] = group_names
+    new_columns['group_of_exercise'] = np.array(
+        [group_names.index(muscle_group_for(name)) for name in exercise_names], dtype=np.int64)
+    new_columns['max_id'] = max(ids) if ids else (previous['max_id'] if previous else 0)
+    new_columns['generation'] = previous['generation'] if previous else next(_generations)
+    return new_columns
+
+
+def load_workout_columns():
+    """Load all workouts (archived years included) into NumPy columns, reusing the cached copy if unchanged"""
+    global _columns, _columns_key
+
+    conn = database.connect_reader()
+    cursor = conn.cursor()
+
+    # Archiving bumps the 'archive' version, which forces a full reload through the archives
+    cursor.execute('''
+        SELECT COUNT(*), MAX(id), (SELECT version FROM log_versions WHERE name = 'archive')
+        FROM workouts
+        WHERE date_logged IS NOT NULL
+    ''')
+    hot_rows, hot_max_id, archive_version = cursor.fetchone()
+    key = (database.DATABASE_NAME, archive_version, hot_rows, hot_max_id)
+    if _columns is not None and key == _columns_key:
+        conn.close()
+        return _columns
+
+    # Rows only appended to the hot table since the last load - extend the cached columns.
+    # Sets are written in the same transaction as their workout, so appended rows come complete
+    if _columns is not None and _columns_key[:2] == key[:2]:
+        cursor.execute(f'''
+            SELECT id, date_logged, exercise_name, weight, reps, sets,
+                   {database.WORKOUT_VOLUME.format(sets='workout_sets', workouts='workouts')}
+            FROM workouts
+            WHERE date_logged IS NOT NULL AND id > ?
+            ORDER BY id
+        ''', (_columns['max_id'],))
+        rows = cursor.fetchall()
+        if _columns_key[2] + len(rows) == hot_rows:
+            _columns = _build_columns(rows, _columns)
+            _columns_key = key
+            conn.close()
+            return _columns
+    conn.close()
+
+    # Set volume is summed once per workout - a correlated lookup would scan the history view per row
+    conn = database.connect_history(read_only=True)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT w.id, w.date_logged, w.exercise_name, w.weight, w.reps, w.sets,
+               COALESCE(s.volume, w.weight * w.reps * w.sets)
+        FROM history_workouts w
+        LEFT JOIN (
+            SELECT workout_id, SUM(weight * reps) AS volume
+            FROM history_workout_sets
+            GROUP BY workout_id
+        ) s ON s.workout_id = w.id
+        WHERE w.date_logged IS NOT NULL
+        ORDER BY w.id
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+
+    _columns = _build_columns(rows)
+    _columns_key = key
+    return _columns
+
+
+def _daily_volume(columns, start_day, end_day):
+    """Total volume per calendar day in [start_day, end_day] as a dense array"""
+    mask = (columns['day'] >= start_day) & (columns['day'] <= end_day)
+    return np.bincount(columns['day'][mask] - start_day,
+                       weights=columns['volume'][mask],
+                       minlength=end_day - start_day + 1)
+
+
+def _rolling_sum(values, window):
+    """Trailing rolling sum over a 1-D array"""
+    totals = np.cumsum(values)
+    totals[window:] = totals[window:] - totals[:-window]
+    return totals
+
+
+def get_rolling_volume(days=90, window=7):
+    """Daily volume and trailing rolling volume for the last N days"""
+    columns = load_workout_columns()
+    end_day = database.get_today_date().toordinal()
+    start_day = end_day - days + 1
+
+    # Include the window before the range so the first points are complete
+    daily = _daily_volume(columns, start_day - window + 1, end_day)
+    rolling = _rolling_sum(daily, window)[window - 1:]
+    daily = daily[window - 1:]
+
+    return [{
+        'date': date.fromordinal(start_day + i).strftime('%Y-%m-%d'),
+        'volume': float(daily[i]),
+        'rolling_volume': float(rolling[i])
+    } for i in range(days)]
+
+
+def get_weekly_progression(weeks=12):
+    """Weekly volume with week-over-week change for the last N weeks"""
+    columns = load_workout_columns()
+    today = database.get_today_date()
+    end_day = today.toordinal()
+    # Align buckets on Mondays
+    start_day = end_day - today.weekday() - 7 * (weeks - 1)
+
+    daily = _daily_volume(columns, start_day, end_day)
+    daily = np.pad(daily, (0, weeks * 7 - len(daily)))
+    weekly = daily.reshape(weeks, 7).sum(axis=1)
+
+    previous = np.concatenate(([0.0], weekly[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (weekly - previous) / previous * 100, 0.0)
+
+    return [{
+        'week_start': date.fromordinal(start_day + 7 * i).strftime('%Y-%m-%d'),
+        'volume': float(weekly[i]),
+        'change_percent': float(change[i]) if i > 0 else None
+    } for i in range(weeks)]
+
+
+def get_training_load(days=60, acute_window=7, chronic_window=28):
+    """Acute:chronic workload ratio series for the last N days"""
+    columns = load_workout_columns()
+    end_day = database.get_today_date().toordinal()
+    start_day = end_day - days + 1
+
+    daily = _daily_volume(columns, start_day - chronic_window + 1, end_day)
+    acute = _rolling_sum(daily, acute_window)[chronic_window - 1:] / acute_window
+    chronic = _rolling_sum(daily, chronic_window)[chronic_window - 1:] / chronic_window
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(chronic > 0, acute / chronic, 0.0)
+
+    series = [{
+        'date': date.fromordinal(start_day + i).strftime('%Y-%m-%d'),
+        'acute': float(acute[i]),
+        'chronic': float(chronic[i]),
+        'ratio': float(ratio[i])
+    } for i in range(days)]
+
+    return {
+        'current_ratio': series[-1]['ratio'] if series else 0,
+        'series': series
+    }
+
+
+def get_muscle_group_breakdown(days=30):
+    """Volume and set counts per muscle group for the last N days"""
+    columns = load_workout_columns()
+    end_day = database.get_today_date().toordinal()
+    start_day = end_day - days + 1
+
+    mask = (columns['day'] >= start_day) & (columns['day'] <= end_day)
+    groups = columns['group_of_exercise'][columns['exercise_id'][mask]]
+    group_count = len(columns['group_names'])
+
+    volume = np.bincount(groups, weights=columns['volume'][mask], minlength=group_count)
+    sets = np.bincount(groups, weights=columns['sets'][mask], minlength=group_count)
+    total = volume.sum()
+
+    breakdown = []
+    for i, group in enumerate(columns['group_names']):
+        if sets[i] == 0:
+            continue
+        breakdown.append({
+            'muscle_group': group,
+            'volume': float(volume[i]),
+            'sets': int(sets[i]),
+            'percent': float(volume[i] / total * 100) if total > 0 else 0
+        })
+
+    breakdown.sort(key=lambda item: item['volume'], reverse=True)
+    return breakdown
+
+
+def estimated_1rm(weight, reps):
+    """Epley estimate of the one-rep max; works on arrays"""
+    return weight * (1 + reps / 30)
+
+
+def _fit_trends(columns, start_day, end_day, exercises=None):
+    """Per-exercise least-squares lines through each session's best e1RM and total volume
+
+    Returns arrays indexed by exercise id: sessions, and for e1rm and volume the
+    slope per day and the fitted value at end_day. exercises (a boolean mask over
+    exercise ids) limits the fit to those exercises; the rest come back as zeros.
+    """
+    count = len(columns['exercise_names'])
+    mask = (columns['day'] >= start_day) & (columns['day'] <= end_day)
+    if exercises is not None:
+        mask &= exercises[columns['exercise_id']]
+
+    # One point per exercise and day: the day's best e1RM and its total volume
+    span = end_day - start_day + 1
+    keys, point = np.unique(columns['exercise_id'][mask] * span + (columns['day'][mask] - start_day),
+                            return_inverse=True)
+    best = np.zeros(len(keys))
+    np.maximum.at(best, point, estimated_1rm(columns['weight'][mask], columns['reps'][mask]))
+    volume = np.bincount(point, weights=columns['volume'][mask], minlength=len(keys))
+
+    # Days relative to end_day, so each intercept is the fitted value today
+    exercise = keys // span
+    t = (keys % span - (span - 1)).astype(np.float64)
+
+    def per_exercise(values):
+        return np.bincount(exercise, weights=values, minlength=count)
+
+    n = np.bincount(exercise, minlength=count).astype(np.float64)
+    sum_t = per_exercise(t)
+    denominator = n * per_exercise(t * t) - sum_t * sum_t
+
+    fits = {'sessions': n}
+    for name, y in (('e1rm', best), ('volume', volume)):
+        sum_y = per_exercise(y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(denominator > 0, (n * per_exercise(t * y) - sum_t * sum_y) / denominator, 0.0)
+            fits[name + '_now'] = np.where(n > 0, (sum_y - slope * sum_t) / n, 0.0)
+        fits[name + '_slope'] = slope
+    return fits
+
+
+def _strength_fits():
+    """Workout columns and fitted trends, refitting only exercises with rows added since the last fit"""
+    global _forecast
+    columns = load_workout_columns()
+    end_day = database.get_today_date().toordinal()
+    start_day = end_day - FORECAST_WINDOW_DAYS + 1
+    rows = len(columns['day'])
+    count = len(columns['exercise_names'])
+
+    cached = _forecast
+    if cached and cached['generation'] == columns['generation'] and cached['end_day'] == end_day:
+        if cached['rows'] == rows:
+            return columns, cached['fits']
+
+        # Appended rows sit after the ones already fitted
+        touched = np.zeros(count, dtype=bool)
+        touched[columns['exercise_id'][cached['rows']:]] = True
+        refit = _fit_trends(columns, start_day, end_day, touched)
+        fits = {}
+        for key, values in refit.items():
+            fits[key] = np.zeros(count)
+            fits[key][:len(cached['fits'][key])] = cached['fits'][key]
+            fits[key][touched] = values[touched]
+    else:
+        fits = _fit_trends(columns, start_day, end_day)
+
+    _forecast = {'generation': columns['generation'], 'end_day': end_day, 'rows': rows, 'fits': fits}
+    return columns, fits
+
+
+def get_strength_forecast(horizon_days=FORECAST_HORIZON_DAYS):
+    """Projected e1RM and session volume per exercise, with a weight to aim for next week"""
+    columns, fits = _strength_fits()
+
+    # Reps of each exercise's most recent row, to turn the projected e1RM into a working weight
+    last_row = np.full(len(columns['exercise_names']), -1)
+    np.maximum.at(last_row, columns['exercise_id'], np.arange(len(columns['day'])))
+    last_reps = np.where(last_row >= 0, columns['reps'][last_row], 0)
+
+    forecast = []
+    for i, name in enumerate(columns['exercise_names']):
+        if fits['sessions'][i] < MIN_FORECAST_SESSIONS:
+            continue
+        e1rm, e1rm_slope = fits['e1rm_now'][i], fits['e1rm_slope'][i]
+        next_week = e1rm + e1rm_slope * 7
+        target = round(next_week / (1 + last_reps[i] / 30) / WEIGHT_INCREMENT) * WEIGHT_INCREMENT
+        forecast.append({
+            'exercise': name,
+            'sessions': int(fits['sessions'][i]),
+            'e1rm': round(float(e1rm), 1),
+            'e1rm_per_week': round(float(e1rm_slope * 7), 2),
+            'projected_e1rm': round(float(e1rm + e1rm_slope * horizon_days), 1),
+            'volume': round(float(fits['volume_now'][i]), 1),
+            'volume_per_week': round(float(fits['volume_slope'][i] * 7), 1),
+            'projected_volume': round(float(fits['volume_now'][i] + fits['volume_slope'][i] * horizon_days), 1),
+            'target_weight': float(target),
+            'target_reps': int(last_reps[i]),
+            'horizon_days': horizon_days
+        })
+
+    forecast.sort(key=lambda item: item['sessions'], reverse=True)
+    return forecast
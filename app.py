@@ -1,10 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, Response, g, render_template, request, redirect, url_for, jsonify
+import admission
 import database
+import assets
+import live
+import scheduler
 app = Flask(__name__)
 app.secret_key = 'nutritrack-secret-key-2024'
 
+# Fingerprinted bundles for templates, gzip for dynamic HTML/JSON
+app.jinja_env.globals['asset_urls'] = assets.asset_urls
+app.after_request(assets.compress_response)
+assets.check_sources()
+
 database.init_db()
 
+# End-of-day finalization and database maintenance run in the background
+scheduler.start()
+
+@app.before_request
+def pin_today():
+    """Work out today's date once per request in the user's timezone"""
+    database.begin_request()
+
+@app.teardown_request
+def unpin_today(exception=None):
+    database.end_request()
+
+# Routes reached with GET (links and fetches from our pages) that still write
+WRITE_ENDPOINTS = {'clear_meals', 'clear_workouts', 'delete_meal_route', 'add_favorite', 'fix_db'}
+admission_control = admission.Admission()
+
+@app.before_request
+def admit_writes():
+    """Turn away writes over the client's rate or beyond what the writer can queue"""
+    if request.method not in ('POST', 'PUT', 'PATCH', 'DELETE') and request.endpoint not in WRITE_ENDPOINTS:
+        return None
+
+    rejection = admission_control.admit(request.remote_addr)
+    if rejection is None:
+        g.write_admitted = True
+        return None
+
+    status, retry_after = rejection
+    message = 'Too many changes, slow down' if status == 429 else 'Server busy, try again shortly'
+    if wants_json():
+        response = jsonify({'success': 'error_busy', 'error': message})
+    else:
+        response = Response(message, mimetype='text/plain')
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.teardown_request
+def release_write(exception=None):
+    if g.pop('write_admitted', False):
+        admission_control.release()
+
+# Meal times offered by the meal forms and the history filter, in order through the day
+MEAL_TIMES = ['Breakfast', 'Mid-morning Snack', 'Lunch', 'Afternoon Snack', 'Pre-workout', 'Dinner', 'Evening Snack']
+
 # Store meals in a list
 Food_database = {
 
@@ -42,46 +96,173 @@ Food_database = {
     'Pear (1 medium)': {'calories': 100, 'protein': 0.6, 'base_Unit': 'piece' , 'grams_per_unit': 180},
 }
 
-@app.route('/')
-def home():
+# Built-in foods by lower-cased name - food names match case-insensitively, like food_catalog's NOCASE names
+FOODS_BY_LOWER_NAME = {name.lower(): info for name, info in Food_database.items()}
 
-    # Check if user needs onboarding
-    if not database.is_user_onboarded():
-        return redirect(url_for('onboarding'))
 
-    theme = database.get_theme()
+def find_food(name):
+    """Nutrition info for a built-in food, or one imported into the catalog by food_import.py"""
+    return FOODS_BY_LOWER_NAME.get(name.lower()) or database.get_catalog_food(name)
+
+
+def calculate_nutrition(food_info, quantity, unit):
+    """Protein and calories for a quantity of a catalog food in the given unit"""
+    # Calculate multiplier based on unit
+    if unit == 'grams':
+        if food_info['base_Unit'] == '100g':
+            multiplier = quantity / 100
+        else:
+            grams_per_unit = food_info.get('grams_per_unit', 100)
+            multiplier = quantity / grams_per_unit
+    elif unit == 'piece':
+        if food_info['base_Unit'] in ['piece', 'slice', 'scoop', 'cup', 'tsp']:
+            multiplier = quantity
+        else:
+            grams_per_unit = food_info.get('grams_per_unit', 100)
+            total_grams = quantity * grams_per_unit
+            multiplier = total_grams / 100
+    else:
+        multiplier = quantity
+
+    return food_info['protein'] * multiplier, food_info['calories'] * multiplier
+
+
+def log_meal(food_name, quantity, protein, calories, meal_time):
+    """Add a meal, returning the new row and whether it just pushed protein or calories past the goal"""
+    goals = database.get_goals()
+    totals = database.get_todays_totals()
+    current_protein = totals['protein']
+    current_calories = totals['calories']
+
+    was_below_protein = (current_protein / goals['protein_goal'] * 100) < 100
+    was_below_calories = (current_calories / goals['calorie_goal'] * 100) < 100
+
+    # Add to database
+    meal_id = database.add_meal(food_name, quantity, protein, calories, meal_time)
+
+    # Check if goal just reached
+    new_protein_pct = ((current_protein + protein) / goals['protein_goal'] * 100)
+    new_calorie_pct = ((current_calories + calories) / goals['calorie_goal'] * 100)
+
+    goal_reached = (was_below_protein and new_protein_pct >= 100) or (was_below_calories and new_calorie_pct >= 100)
+    meal = {
+        'id': meal_id,
+        'food': food_name,
+        'quantity': quantity,
+        'protein': protein,
+        'calories': calories,
+        'meal_time': meal_time
+    }
+    return meal, goal_reached
+
+
+def recipe_nutrition(recipe):
+    """Per-serving (protein, calories) for a recipe, recomputing only if its cache is stale
+
+    Returns None if an ingredient is no longer a known food.
+    """
+    if not recipe['stale']:
+        return recipe['protein_per_serving'], recipe['calories_per_serving']
+
+    total_protein = 0
+    total_calories = 0
+    for item in recipe['ingredients']:
+        food_info = find_food(item['food'])
+        if not food_info:
+            return None
+        protein, calories = calculate_nutrition(food_info, item['quantity'], item['unit'])
+        total_protein += protein
+        total_calories += calories
+
+    protein_per_serving = total_protein / recipe['servings']
+    calories_per_serving = total_calories / recipe['servings']
+    database.update_recipe_nutrition(recipe['id'], protein_per_serving, calories_per_serving)
+    return protein_per_serving, calories_per_serving
+
 
+def nutrition_summary():
+    """Today's totals, goal percentages and streaks, as shown on the dashboard"""
     # Get goals from database
     goals = database.get_goals()
     protein_goal = goals['protein_goal']
     calorie_goal = goals['calorie_goal']
 
-    # Get today's meals from database
-    meals = database.get_todays_meals()
-
-    # Calculate totals from all meals
-    proteinTotal = sum(float(meal['protein']) for meal in meals)
-    caloriesTotal = sum(float(meal['calories']) for meal in meals)
+    # Running totals are kept alongside the cached meals
+    totals = database.get_todays_totals()
+    proteinTotal = totals['protein']
+    caloriesTotal = totals['calories']
 
     # Calculate percentages for progress bars
     protein_percentage = (proteinTotal / protein_goal * 100) if protein_goal > 0 else 0
     calorie_percentage = (caloriesTotal / calorie_goal * 100) if calorie_goal > 0 else 0
 
-    # Check if goals are met
-    protein_met = protein_percentage >= 100
-    calorie_met = calorie_percentage >= 100
+    # today's goal flags are kept current by meal mutations and settled by the scheduler
+
+    return {
+        'proteinTotal': proteinTotal,
+        'caloriesTotal': caloriesTotal,
+        'protein_goal': protein_goal,
+        'calorie_goal': calorie_goal,
+        'protein_percentage': protein_percentage,
+        'calorie_percentage': calorie_percentage,
+        'current_streak': database.get_current_streak(),
+        'best_streak': database.get_best_streak(),
+        'total_days': database.get_total_days_tracked()
+    }
+
+
+def live_events(entities):
+    """SSE payloads for changed entity types - full lists, so a client can just replace what it shows"""
+    events = {}
+    if entities & {'meal', 'goals'}:
+        events['nutrition'] = {'meals': database.get_todays_meals(), 'summary': nutrition_summary()}
+    if 'workout' in entities:
+        events['workouts'] = {'workouts': database.get_todays_workouts(), 'date': database.get_today()}
+    return events
+
+
+# Pushes dashboard and gym changes to every open tab
+live_hub = live.Hub(live_events)
+
+
+def wants_json():
+    """True when the caller (fetch from our pages) asked for JSON instead of a redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
+def respond(page, success, goal_reached=False, **payload):
+    """Finish a mutation: redirect back with a toast code, or answer JSON for in-place updates"""
+    if wants_json():
+        body = {'success': success, 'goal_reached': bool(goal_reached)}
+        body.update(payload)
+        if page == 'home':
+            body['summary'] = nutrition_summary()
+        return jsonify(body), 400 if success.startswith('error') else 200
+
+    if goal_reached:
+        return redirect(url_for(page, success=success, goal_reached='1'))
+    return redirect(url_for(page, success=success))
+
+
+@app.route('/')
+def home():
+
+    # Check if user needs onboarding
+    if not database.is_user_onboarded():
+        return redirect(url_for('onboarding'))
 
-    # Record today's stats
-    database.record_daily_stats(protein_met, calorie_met)
+    theme = database.get_theme()
 
-    # Get streak data
-    current_streak = database.get_current_streak()
-    best_streak = database.get_best_streak()
-    total_days = database.get_total_days_tracked()
+    # Get today's meals from database
+    meals = database.get_todays_meals()
+
+    summary = nutrition_summary()
 
     # Get favorite foods
     favorite_foods = database.get_favorite_foods(limit=5)
 
+    recipes = database.get_recipes()
+
     goal_just_reached = request.args.get('goal_reached') == '1'
 
     # Get success message if exists
@@ -89,20 +270,15 @@ def home():
 
     return render_template('index.html',
                            meals=meals,
-                           proteinTotal=proteinTotal,
-                           caloriesTotal=caloriesTotal,
-                           protein_goal=protein_goal,
-                           calorie_goal=calorie_goal,
-                           protein_percentage=protein_percentage,
-                           calorie_percentage=calorie_percentage,
                            food_database=Food_database,
+                           meal_times=MEAL_TIMES,
                            theme = theme,
                            goal_reached = goal_just_reached,
                            success_message=success_message,
-                           current_streak=current_streak,  # ADD THIS
-                           best_streak=best_streak,        # ADD THIS
-                           total_days=total_days,
-                           favorite_foods=favorite_foods)
+                           favorite_foods=favorite_foods,
+                           recipes=recipes,
+                           live_cursor=database.get_change_cursor(),
+                           **summary)
 
 
 @app.route('/add_custom', methods=['POST'])
@@ -117,13 +293,13 @@ def add_custom():
 
         # Input Validation
         if not food:
-            return redirect(url_for('home', success='error_empty_food'))
+            return respond('home', 'error_empty_food')
         if quantity <= 0 or quantity > 10000:
-            return redirect(url_for('home', success = 'error_quantity'))
+            return respond('home', 'error_quantity')
         if protein_per_unit < 0 or protein_per_unit > 1000:
-            return redirect(url_for('home', success = 'error_protein'))
+            return respond('home', 'error_protein')
         if calories_per_unit < 0 or calories_per_unit > 10000:
-            return redirect(url_for('home', success = 'error_calories'))
+            return respond('home', 'error_calories')
 
         # Calculate totals
         total_protein = protein_per_unit * quantity
@@ -132,39 +308,19 @@ def add_custom():
         # Create food name with unit
         food_name = f"{food} ({quantity} {unit})"
 
-        # Check if this will reach goal
-        goals = database.get_goals()
-        meals = database.get_todays_meals()
-        current_protein = sum(float(meal['protein']) for meal in meals)
-        current_calories = sum(float(meal['calories']) for meal in meals)
-
-        was_below_protein = (current_protein / goals['protein_goal'] * 100) < 100
-        was_below_calories = (current_calories / goals['calorie_goal'] * 100) < 100
-
         # Add to database (not to list!)
-        database.add_meal(food_name, quantity, total_protein, total_calories, meal_time)
+        meal, goal_reached = log_meal(food_name, quantity, total_protein, total_calories, meal_time)
 
         #Track as favorite
         database.add_favorite_food(food, quantity, unit, total_protein, total_calories)
 
-        # Check if goal just reached
-        new_protein = current_protein + total_protein
-        new_calories = current_calories + total_calories
-        new_protein_pct = (new_protein / goals['protein_goal'] * 100)
-        new_calorie_pct = (new_calories / goals['calorie_goal'] * 100)
-
-        goal_reached = (was_below_protein and new_protein_pct >= 100) or (was_below_calories and new_calorie_pct >= 100)
-
-        if goal_reached:
-            return redirect(url_for('home', success='food_logged', goal_reached='1'))
-        else:
-            return redirect(url_for('home', success='food_logged'))
+        return respond('home', 'food_logged', goal_reached=goal_reached, meal=meal)
 
     except ValueError:
-        return redirect(url_for('home', success='error_invalid'))
+        return respond('home', 'error_invalid')
     except Exception as e:
         print(f"Error: {e}")
-        return redirect(url_for('home', success='error'))
+        return respond('home', 'error')
 
 @app.route('/add_from_database', methods=['POST'])
 def add_from_database():
@@ -178,69 +334,29 @@ def add_from_database():
 
         #Validation
         if quantity <= 0 or quantity > 10000:
-            return redirect(url_for('home', success = "error_quantity"))
+            return respond('home', "error_quantity")
         # Get nutrition info from database
-        food_info = Food_database[food]
+        food_info = find_food(food)
         if not food_info:
-            return redirect(url_for('home', success ='error_food_not_found'))
-        # Calculate multiplier based on unit
-        if unit == 'grams':
-            if food_info['base_Unit'] == '100g':
-                multiplier = quantity / 100
-            else:
-                grams_per_unit = food_info.get('grams_per_unit', 100)
-                multiplier = quantity / grams_per_unit
-        elif unit == 'piece':
-            if food_info['base_Unit'] in ['piece', 'slice', 'scoop', 'cup', 'tsp']:
-                multiplier = quantity
-            else:
-                grams_per_unit = food_info.get('grams_per_unit', 100)
-                total_grams = quantity * grams_per_unit
-                multiplier = total_grams / 100
-        else:
-            multiplier = quantity
-
+            return respond('home', 'error_food_not_found')
         # Calculate totals
-        total_protein = food_info['protein'] * multiplier
-        total_calories = food_info['calories'] * multiplier
+        total_protein, total_calories = calculate_nutrition(food_info, quantity, unit)
 
         # Create food name with unit
         food_name = f"{food} ({quantity} {unit})"
 
-
-        # Check if this will reach goal
-        goals = database.get_goals()
-        meals = database.get_todays_meals()
-        current_protein = sum(float(meal['protein']) for meal in meals)
-        current_calories = sum(float(meal['calories']) for meal in meals)
-
-        was_below_protein = (current_protein / goals['protein_goal'] * 100) < 100
-        was_below_calories = (current_calories / goals['calorie_goal'] * 100) < 100
-
-
         # Add to database
-        database.add_meal(food_name, quantity, total_protein, total_calories, meal_time)
+        meal, goal_reached = log_meal(food_name, quantity, total_protein, total_calories, meal_time)
 
         database.add_favorite_food(food, quantity, unit, total_protein, total_calories)
 
-        # Check if goal just reached
-        new_protein = current_protein + total_protein
-        new_calories = current_calories + total_calories
-        new_protein_pct = (new_protein / goals['protein_goal'] * 100)
-        new_calorie_pct = (new_calories / goals['calorie_goal'] * 100)
-
-        goal_reached = (was_below_protein and new_protein_pct >= 100) or (was_below_calories and new_calorie_pct >= 100)
-
-        if goal_reached:
-            return redirect(url_for('home', success='food_logged', goal_reached='1'))
-        else:
-            return redirect(url_for('home', success='food_logged'))
+        return respond('home', 'food_logged', goal_reached=goal_reached, meal=meal)
 
     except ValueError:
-        return redirect(url_for('home', success='error_invalid'))
+        return respond('home', 'error_invalid')
     except Exception as e:
         print(f"Error: {e}")
-        return redirect(url_for('home', success='error'))
+        return respond('home', 'error')
 @app.route('/clear')
 def clear_meals():
     """Clear all logged meals (reset for new day)"""
@@ -258,8 +374,20 @@ def settings():
                            protein_goal=goals['protein_goal'],
                            calorie_goal=goals['calorie_goal'],
                            theme = theme,
+                           timezone=database.get_timezone(),
+                           today=database.get_today(),
                            success_message = success_message)
 
+@app.route('/update_timezone', methods=['POST'])
+def update_timezone():
+    """Update user's timezone"""
+    timezone = request.form.get('timezone', '').strip()
+    try:
+        database.update_timezone(timezone)
+    except Exception:
+        return redirect(url_for('settings', success='error_timezone'))
+    return redirect(url_for('settings', success='timezone_updated'))
+
 @app.route('/update_settings', methods=['POST'])
 def update_settings():
     try:
@@ -345,10 +473,16 @@ def gym_tracker():
     workouts = database.get_todays_workouts()
     theme = database.get_theme()
     success_message = request.args.get('success')
+
+    # Fitted trends are cached in analytics, so this only refits exercises logged since
+    import analytics
     return render_template('gym_tracker.html',
                            workouts=workouts,
+                           last_sessions=database.get_last_sessions(),
+                           forecasts=analytics.get_strength_forecast(),
                            theme= theme,
-                           success_message=success_message)
+                           success_message=success_message,
+                           live_cursor=database.get_change_cursor())
 
 @app.route('/add_workout', methods=['POST'])
 def add_workout():
@@ -362,22 +496,85 @@ def add_workout():
 
         # VALIDATION
         if not exercise:
-            return redirect(url_for('gym_tracker', success='error_empty_exercise'))
+            return respond('gym_tracker', 'error_empty_exercise')
 
         if weight < 0 or weight > 10000:
-            return redirect(url_for('gym_tracker', success='error_weight'))
+            return respond('gym_tracker', 'error_weight')
 
         if reps <= 0 or reps > 1000:
-            return redirect(url_for('gym_tracker', success='error_reps'))
+            return respond('gym_tracker', 'error_reps')
 
         if sets <= 0 or sets > 100:
-            return redirect(url_for('gym_tracker', success='error_sets'))
-
-        database.add_workout(exercise, weight, reps, sets, notes)
-        return redirect(url_for('gym_tracker', success='workout_logged'))
+            return respond('gym_tracker', 'error_sets')
+
+        workout_id = database.add_workout(exercise, weight, reps, sets, notes)
+        workout = {
+            'id': workout_id,
+            'exercise': exercise,
+            'weight': weight,
+            'reps': reps,
+            'sets': sets,
+            'notes': notes
+        }
+        # The day in the user's timezone, which the page files the session under
+        return respond('gym_tracker', 'workout_logged', workout=workout, date=database.get_today())
 
     except ValueError:
-        return redirect(url_for('gym_tracker', success='error_invalid'))
+        return respond('gym_tracker', 'error_invalid')
+
+SESSION_MAX_EXERCISES = 50
+
+
+def parse_session_exercises(exercises):
+    """Validate the exercises of a session; returns them cleaned up or raises ValueError"""
+    if not isinstance(exercises, list) or not 0 < len(exercises) <= SESSION_MAX_EXERCISES:
+        raise ValueError(f'A session needs 1-{SESSION_MAX_EXERCISES} exercises')
+
+    cleaned = []
+    for item in exercises:
+        exercise = str(item.get('exercise') or '').strip()
+        sets = item.get('sets')
+        if not exercise:
+            raise ValueError('Exercise is required')
+        if not isinstance(sets, list) or not 0 < len(sets) <= 100:
+            raise ValueError(f'{exercise} needs 1-100 sets')
+
+        logged = []
+        for logged_set in sets:
+            weight = float(logged_set['weight'])
+            reps = int(logged_set['reps'])
+            if weight < 0 or weight > 10000 or reps <= 0 or reps > 1000:
+                raise ValueError(f'Invalid weight or reps for {exercise}')
+            logged.append({'weight': weight, 'reps': reps})
+        cleaned.append({'exercise': exercise, 'sets': logged, 'notes': str(item.get('notes') or '')})
+    return cleaned
+
+@app.route('/api/workout_sessions', methods=['POST'])
+def log_workout_session():
+    """Log a whole session at once: {"exercises": [{"exercise", "sets": [{"weight", "reps"}], "notes"}], "notes"}"""
+    from flask import jsonify
+    try:
+        data = request.get_json(force=True)
+        exercises = parse_session_exercises(data.get('exercises'))
+        session_id = database.log_workout_session(exercises, str(data.get('notes') or ''))
+        return jsonify(database.get_workout_session(session_id)), 201
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (KeyError, TypeError, AttributeError):
+        return jsonify({'error': 'Invalid session'}), 400
+    except Exception as e:
+        print(f"Error logging workout session: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/workout_sessions/<int:session_id>')
+def get_workout_session(session_id):
+    """Get a logged session with every set"""
+    from flask import jsonify
+    session = database.get_workout_session(session_id)
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session)
 
 @app.route('/clear_workouts')
 def clear_workouts():
@@ -400,10 +597,10 @@ def delete_meal_route(meal_id):
     """Delete a specific meal by ID"""
     try:
         database.delete_meal_by_id(meal_id)
-        return redirect(url_for('home', success='meal_deleted'))
+        return respond('home', 'meal_deleted', deleted_id=meal_id)
     except Exception as e:
         print(f"Error deleting meal: {e}")
-        return redirect(url_for('home', success='error'))
+        return respond('home', 'error')
 
 @app.route('/edit_meal/<int:meal_id>', methods=['POST'])
 def edit_meal(meal_id):
@@ -417,22 +614,30 @@ def edit_meal(meal_id):
 
         # Validation
         if not food_name:
-            return redirect(url_for('home', success='error_empty_food'))
+            return respond('home', 'error_empty_food')
         if quantity <= 0 or quantity > 10000:
-            return redirect(url_for('home', success='error_quantity'))
+            return respond('home', 'error_quantity')
         if protein < 0 or protein > 1000:
-            return redirect(url_for('home', success='error_protein'))
+            return respond('home', 'error_protein')
         if calories < 0 or calories > 10000:
-            return redirect(url_for('home', success='error_calories'))
+            return respond('home', 'error_calories')
 
         database.update_meal(meal_id, food_name, quantity, protein, calories, meal_time)
-        return redirect(url_for('home', success='meal_updated'))
+        meal = {
+            'id': meal_id,
+            'food': food_name,
+            'quantity': quantity,
+            'protein': protein,
+            'calories': calories,
+            'meal_time': meal_time
+        }
+        return respond('home', 'meal_updated', meal=meal)
 
     except ValueError:
-        return redirect(url_for('home', success='error_invalid'))
+        return respond('home', 'error_invalid')
     except Exception as e:
         print(f"Error editing meal: {e}")
-        return redirect(url_for('home', success='error'))
+        return respond('home', 'error')
 
 @app.route('/get_exercise_progress/<exercise_name>')
 def get_exercise_progress(exercise_name):
@@ -457,6 +662,90 @@ def get_all_exercises():
         print(f"Error getting exercises: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/last_sessions')
+def last_sessions():
+    """Get the most recent session of every exercise in one query"""
+    from flask import jsonify
+    try:
+        return jsonify(database.get_last_sessions())
+    except Exception as e:
+        print(f"Error getting last sessions: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admission')
+def admission_stats():
+    """Write admission counters for this worker"""
+    from flask import jsonify
+    return jsonify(admission_control.stats())
+
+@app.route('/api/analytics/<metric>')
+def workout_analytics(metric):
+    """Get vectorized workout analytics (volume, progression, load, muscle_groups, forecast)"""
+    from flask import jsonify
+    import analytics
+    try:
+        if metric == 'volume':
+            days = request.args.get('days', default=90, type=int)
+            window = request.args.get('window', default=7, type=int)
+            if days <= 0 or days > 3660 or window <= 0 or window > 365:
+                return jsonify({'error': 'Invalid days or window'}), 400
+            return jsonify(analytics.get_rolling_volume(days, window))
+        elif metric == 'progression':
+            weeks = request.args.get('weeks', default=12, type=int)
+            if weeks <= 0 or weeks > 520:
+                return jsonify({'error': 'Invalid weeks'}), 400
+            return jsonify(analytics.get_weekly_progression(weeks))
+        elif metric == 'load':
+            days = request.args.get('days', default=60, type=int)
+            if days <= 0 or days > 3660:
+                return jsonify({'error': 'Invalid days'}), 400
+            return jsonify(analytics.get_training_load(days))
+        elif metric == 'muscle_groups':
+            days = request.args.get('days', default=30, type=int)
+            if days <= 0 or days > 3660:
+                return jsonify({'error': 'Invalid days'}), 400
+            return jsonify(analytics.get_muscle_group_breakdown(days))
+        elif metric == 'forecast':
+            horizon = request.args.get('horizon', default=analytics.FORECAST_HORIZON_DAYS, type=int)
+            if horizon <= 0 or horizon > 365:
+                return jsonify({'error': 'horizon must be between 1 and 365'}), 400
+            return jsonify(analytics.get_strength_forecast(horizon))
+        return jsonify({'error': f'Unknown metric: {metric}'}), 404
+    except Exception as e:
+        print(f"Error getting workout analytics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/nutrition/trends')
+def nutrition_trends():
+    """Get protein/calorie trends over a date range from the rollup tables"""
+    from flask import jsonify
+    from datetime import datetime, timedelta
+    try:
+        granularity = request.args.get('granularity', default='week')
+        end_date = request.args.get('end') or database.get_today()
+        start_date = request.args.get('start') or (
+            datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=365)).strftime('%Y-%m-%d')
+
+        # Validate dates
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+        if granularity not in ['day', 'week', 'month']:
+            return jsonify({'error': 'granularity must be day, week or month'}), 400
+
+        trends = database.get_nutrition_trends(start_date, end_date, granularity)
+        return jsonify({
+            'start': start_date,
+            'end': end_date,
+            'granularity': granularity,
+            'goals': database.get_goals(),
+            'trends': trends
+        })
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        print(f"Error getting nutrition trends: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/add_favorite/<food_name>/<quantity>/<unit>/<protein>/<calories>/<meal_time>')
 def add_favorite(food_name, quantity, unit, protein, calories, meal_time):
     """Quick add a favorite food"""
@@ -468,37 +757,405 @@ def add_favorite(food_name, quantity, unit, protein, calories, meal_time):
         # Create food name with unit
         food_display = f"{food_name} ({quantity} {unit})"
 
-        # Check if this will reach goal
-        goals = database.get_goals()
-        meals = database.get_todays_meals()
-        current_protein = sum(float(meal['protein']) for meal in meals)
-        current_calories = sum(float(meal['calories']) for meal in meals)
-
-        was_below_protein = (current_protein / goals['protein_goal'] * 100) < 100
-        was_below_calories = (current_calories / goals['calorie_goal'] * 100) < 100
-
         # Add to database
-        database.add_meal(food_display, quantity, protein, calories, meal_time)
+        meal, goal_reached = log_meal(food_display, quantity, protein, calories, meal_time)
 
         # Update favorite count
         database.add_favorite_food(food_name, quantity, unit, protein, calories)
 
-        # Check if goal just reached
-        new_protein = current_protein + protein
-        new_calories = current_calories + calories
-        new_protein_pct = (new_protein / goals['protein_goal'] * 100)
-        new_calorie_pct = (new_calories / goals['calorie_goal'] * 100)
+        return respond('home', 'food_logged', goal_reached=goal_reached, meal=meal)
 
-        goal_reached = (was_below_protein and new_protein_pct >= 100) or (was_below_calories and new_calorie_pct >= 100)
+    except Exception as e:
+        print(f"Error: {e}")
+        return respond('home', 'error')
 
-        if goal_reached:
-            return redirect(url_for('home', success='food_logged', goal_reached='1'))
-        else:
-            return redirect(url_for('home', success='food_logged'))
+@app.route('/api/foods')
+def search_foods():
+    """Imported catalog foods starting with ?q=, for the quick log search"""
+    from flask import jsonify
+    prefix = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', default=20, type=int), 50)
+    if len(prefix) < 2:
+        return jsonify([])
+    try:
+        return jsonify(database.search_catalog(prefix, limit))
+    except Exception as e:
+        print(f"Error searching foods: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/foods/<path:name>', methods=['PUT'])
+def save_food(name):
+    """Add or change a catalog food: {"calories", "protein", "base_unit", "grams_per_unit"}"""
+    from flask import jsonify
+    if name.lower() in FOODS_BY_LOWER_NAME:
+        return jsonify({'error': 'Built-in foods cannot be changed'}), 400
+    try:
+        data = request.get_json(force=True)
+        calories = float(data['calories'])
+        protein = float(data['protein'])
+        base_unit = data.get('base_unit', '100g')
+        grams_per_unit = float(data['grams_per_unit']) if data.get('grams_per_unit') else None
 
+        # VALIDATION
+        if not name.strip() or len(name) > 200:
+            return jsonify({'error': 'Invalid food name'}), 400
+        if calories < 0 or calories > 10000 or protein < 0 or protein > 1000:
+            return jsonify({'error': 'Invalid nutrition'}), 400
+        if base_unit not in ('100g', 'piece', 'slice', 'scoop', 'cup', 'tsp'):
+            return jsonify({'error': 'Invalid base unit'}), 400
+        if grams_per_unit is not None and not 0 < grams_per_unit <= 2000:
+            return jsonify({'error': 'Invalid grams per unit'}), 400
+
+        # Recipes using this food are marked stale in the same transaction
+        database.save_catalog_food(name, calories, protein, base_unit, grams_per_unit)
+        return jsonify({'name': name, **database.get_catalog_food(name)})
+
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Invalid food'}), 400
+
+@app.route('/api/foods/<path:name>', methods=['DELETE'])
+def delete_food(name):
+    """Remove a catalog food; recipes using it can no longer be logged until edited"""
+    from flask import jsonify
+    if name.lower() in FOODS_BY_LOWER_NAME:
+        return jsonify({'error': 'Built-in foods cannot be removed'}), 400
+    if not database.delete_catalog_food(name):
+        return jsonify({'error': 'Food not found'}), 404
+    return jsonify({'deleted': name})
+
+@app.route('/api/recipes', methods=['GET'])
+def list_recipes():
+    """List saved recipes with cached per-serving nutrition"""
+    from flask import jsonify
+    return jsonify(database.get_recipes())
+
+@app.route('/api/recipes', methods=['POST'])
+def save_recipe():
+    """Create or replace a recipe: {"name", "servings", "ingredients": [{"food", "quantity", "unit"}]}"""
+    from flask import jsonify
+    try:
+        data = request.get_json(force=True)
+        name = (data.get('name') or '').strip()
+        servings = float(data.get('servings', 1))
+        ingredients = data.get('ingredients') or []
+
+        # VALIDATION
+        if not name:
+            return jsonify({'error': 'Recipe name is required'}), 400
+        if servings <= 0 or servings > 100:
+            return jsonify({'error': 'Invalid servings'}), 400
+        if not ingredients or len(ingredients) > 100:
+            return jsonify({'error': 'A recipe needs 1-100 ingredients'}), 400
+
+        total_protein = 0
+        total_calories = 0
+        cleaned = []
+        for item in ingredients:
+            food = item.get('food')
+            quantity = float(item.get('quantity', 0))
+            unit = item.get('unit', 'grams')
+            food_info = find_food(food)
+            if not food_info:
+                return jsonify({'error': f'Unknown food: {food}'}), 400
+            if quantity <= 0 or quantity > 10000:
+                return jsonify({'error': f'Invalid quantity for {food}'}), 400
+
+            protein, calories = calculate_nutrition(food_info, quantity, unit)
+            total_protein += protein
+            total_calories += calories
+            cleaned.append({'food': food, 'quantity': quantity, 'unit': unit})
+
+        # Nutrition is computed once here and cached on the recipe row
+        recipe_id = database.save_recipe(name, servings, cleaned,
+                                         total_protein / servings, total_calories / servings)
+        return jsonify(database.get_recipe(recipe_id, include_ingredients=True)), 201
+
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Invalid recipe'}), 400
+    except Exception as e:
+        print(f"Error saving recipe: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recipes/<int:recipe_id>', methods=['GET'])
+def get_recipe(recipe_id):
+    """Get a recipe with its ingredients"""
+    from flask import jsonify
+    recipe = database.get_recipe(recipe_id, include_ingredients=True)
+    if not recipe:
+        return jsonify({'error': 'Recipe not found'}), 404
+    return jsonify(recipe)
+
+@app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
+def delete_recipe(recipe_id):
+    """Delete a recipe"""
+    from flask import jsonify
+    database.delete_recipe(recipe_id)
+    return jsonify({'deleted': recipe_id})
+
+@app.route('/log_recipe/<int:recipe_id>', methods=['POST'])
+def log_recipe(recipe_id):
+    """Log servings of a saved recipe as a single meal"""
+    try:
+        servings = float(request.form.get('servings', 1))
+        meal_time = request.form['meal_time']
+
+        if servings <= 0 or servings > 100:
+            return respond('home', 'error_quantity')
+
+        recipe = database.get_recipe(recipe_id)
+        if not recipe:
+            return respond('home', 'error_food_not_found')
+
+        nutrition = recipe_nutrition(recipe)
+        if nutrition is None:
+            missing = [item['food'] for item in recipe['ingredients'] if not find_food(item['food'])]
+            return respond('home', 'error_recipe_ingredient',
+                           error=f"Unknown ingredient: {', '.join(missing)}")
+        protein_per_serving, calories_per_serving = nutrition
+
+        food_name = f"{recipe['name']} ({servings} serving)"
+        meal, goal_reached = log_meal(food_name, servings, protein_per_serving * servings,
+                                calories_per_serving * servings, meal_time)
+
+        return respond('home', 'food_logged', goal_reached=goal_reached, meal=meal)
+
+    except ValueError:
+        return respond('home', 'error_invalid')
     except Exception as e:
         print(f"Error: {e}")
-        return redirect(url_for('home', success='error'))
+        return respond('home', 'error')
+
+def parse_history_cursor(value):
+    """'YYYY-MM-DD:id' from a previous page's 'next' -> (date, id); raises ValueError"""
+    from datetime import datetime
+    if not value:
+        return None
+    day, row_id = value.rsplit(':', 1)
+    datetime.strptime(day, '%Y-%m-%d')
+    return day, int(row_id)
+
+
+def history_page(page):
+    """JSON body for a history page, with 'next' encoded back into a cursor string"""
+    if page['next']:
+        page['next'] = f"{page['next'][0]}:{page['next'][1]}"
+    return page
+
+@app.route('/history')
+def history():
+    """Browse past meals and workouts by day"""
+    if not database.is_user_onboarded():
+        return redirect(url_for('onboarding'))
+
+    return render_template('history.html',
+                           theme=database.get_theme(),
+                           meal_times=MEAL_TIMES,
+                           exercises=database.get_all_exercises())
+
+@app.route('/api/history/meals')
+def meal_history():
+    """Past meals, newest first: ?before=<next from the previous page>&limit=N&meal_time=Lunch"""
+    from flask import jsonify
+    try:
+        before = parse_history_cursor(request.args.get('before'))
+        limit = request.args.get('limit', default=50, type=int)
+        if limit <= 0 or limit > 200:
+            return jsonify({'error': 'limit must be 1-200'}), 400
+        page = database.get_meal_history(before, limit, request.args.get('meal_time') or None)
+        return jsonify(history_page(page))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        print(f"Error getting meal history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/workouts')
+def workout_log():
+    """Past workouts, newest first: ?before=<next from the previous page>&limit=N&exercise=Bench"""
+    from flask import jsonify
+    try:
+        before = parse_history_cursor(request.args.get('before'))
+        limit = request.args.get('limit', default=50, type=int)
+        if limit <= 0 or limit > 200:
+            return jsonify({'error': 'limit must be 1-200'}), 400
+        page = database.get_workout_log(before, limit, request.args.get('exercise') or None)
+        return jsonify(history_page(page))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        print(f"Error getting workout history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def highlight(snippet):
+    """HTML for a search snippet - escape the user's text, then mark the matched words"""
+    from markupsafe import escape
+    return str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+@app.route('/api/search')
+def search():
+    """Full-text search: ?q=shoulder twinge&kind=meal|workout&start=&end=&order=relevance|recent&limit=N"""
+    from flask import jsonify
+    from datetime import datetime
+    try:
+        text = request.args.get('q', '').strip()
+        kind = request.args.get('kind') or None
+        start_date = request.args.get('start') or None
+        end_date = request.args.get('end') or None
+        order = request.args.get('order', 'relevance')
+        limit = request.args.get('limit', default=50, type=int)
+
+        # Validation
+        if not text or len(text) > 200:
+            return jsonify({'error': 'q must be 1-200 characters'}), 400
+        if kind not in (None, 'meal', 'workout'):
+            return jsonify({'error': 'kind must be meal or workout'}), 400
+        if order not in ('relevance', 'recent'):
+            return jsonify({'error': 'order must be relevance or recent'}), 400
+        if limit <= 0 or limit > 500:
+            return jsonify({'error': 'limit must be 1-500'}), 400
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+
+        results = database.search_logs(text, kind, start_date, end_date, limit, order)
+        for result in results:
+            result['snippet'] = highlight(result['snippet'])
+        return jsonify({'query': text, 'results': results})
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        print(f"Error searching: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stream')
+def live_stream():
+    """Server-Sent Events: 'nutrition' and 'workouts' updates whenever the data changes"""
+    # EventSource resends the last id it saw when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    response = Response(live_hub.stream(since, entities={'meal', 'goals', 'workout'}),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+SYNC_MAX_OPS = 200
+
+
+def apply_sync_op(op):
+    """Apply one queued offline change; returns the affected row ID or raises ValueError"""
+    from datetime import datetime
+    op_type = op.get('type')
+    op_id = op.get('op_id')
+    if op_type in ('add_meal', 'add_workout', 'add_workout_session') and not op_id:
+        raise ValueError('op_id is required')
+
+    date_logged = op.get('date')
+    if date_logged:
+        # Offline logs may belong to an earlier day, never a later one
+        if datetime.strptime(date_logged, '%Y-%m-%d').strftime('%Y-%m-%d') > database.get_today():
+            raise ValueError('date is in the future')
+
+    if op_type == 'add_meal':
+        quantity = float(op['quantity'])
+        unit = op.get('unit', 'grams')
+        if quantity <= 0 or quantity > 10000:
+            raise ValueError('Invalid quantity')
+
+        # Catalog foods are computed here; custom foods send per-unit nutrition like /add_custom
+        food_info = find_food(op['food']) if 'protein' not in op else None
+        if food_info:
+            protein, calories = calculate_nutrition(food_info, quantity, unit)
+        else:
+            protein = float(op['protein']) * quantity
+            calories = float(op['calories']) * quantity
+            if protein < 0 or calories < 0:
+                raise ValueError('Invalid nutrition')
+
+        food_name = f"{op['food']} ({quantity} {unit})"
+        return database.add_meal(food_name, quantity, protein, calories, op['meal_time'],
+                                 date_logged=date_logged, op_id=op_id)
+
+    if op_type == 'add_workout':
+        weight = float(op['weight'])
+        reps = int(op['reps'])
+        sets = int(op['sets'])
+        if not op.get('exercise'):
+            raise ValueError('Exercise is required')
+        if weight < 0 or weight > 10000 or reps <= 0 or reps > 1000 or sets <= 0 or sets > 100:
+            raise ValueError('Invalid weight, reps or sets')
+        return database.add_workout(op['exercise'], weight, reps, sets, op.get('notes', ''),
+                                    date_logged=date_logged, op_id=op_id)
+
+    if op_type == 'add_workout_session':
+        return database.log_workout_session(parse_session_exercises(op.get('exercises')), str(op.get('notes') or ''),
+                                            date_logged=date_logged, op_id=op_id)
+
+    # Updates and deletes are naturally idempotent
+    if op_type == 'update_meal':
+        meal_id = int(op['id'])
+        database.update_meal(meal_id, op['food_name'], float(op['quantity']),
+                             float(op['protein']), float(op['calories']), op['meal_time'])
+        return meal_id
+
+    if op_type == 'delete_meal':
+        meal_id = int(op['id'])
+        database.delete_meal_by_id(meal_id)
+        return meal_id
+
+    raise ValueError(f'Unknown op type: {op_type}')
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Changes since a cursor: ?since=<cursor from the last sync>&limit=N"""
+    from flask import jsonify
+    since = request.args.get('since', default=0, type=int)
+    limit = request.args.get('limit', default=500, type=int)
+    if since < 0 or limit <= 0 or limit > 5000:
+        return jsonify({'error': 'Invalid since or limit'}), 400
+
+    changes = database.get_changes_since(since, limit)
+    if changes['reset']:
+        # Too far behind for deltas - hand back today's state so the client can start over
+        changes['meals'] = database.get_todays_meals()
+        changes['workouts'] = database.get_todays_workouts()
+        changes['goals'] = database.get_goals()
+    return jsonify(changes)
+
+@app.route('/api/sync', methods=['POST'])
+def sync_upload():
+    """Apply offline-queued changes: {"ops": [{"op_id", "type", ...}], "since": cursor}"""
+    from flask import jsonify
+    data = request.get_json(force=True, silent=True) or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or len(ops) > SYNC_MAX_OPS:
+        return jsonify({'error': f'ops must be a list of at most {SYNC_MAX_OPS} changes'}), 400
+
+    results = []
+    for op in ops:
+        try:
+            if not isinstance(op, dict):
+                raise ValueError('Invalid op')
+            results.append({'op_id': op.get('op_id'), 'status': 'ok', 'id': apply_sync_op(op)})
+        except (KeyError, TypeError, ValueError) as e:
+            results.append({'op_id': op.get('op_id') if isinstance(op, dict) else None,
+                            'status': 'error', 'error': str(e)})
+        except Exception as e:
+            print(f"Error applying sync op: {e}")
+            results.append({'op_id': op.get('op_id'), 'status': 'error', 'error': 'Server error'})
+
+    # Hand back everything since the client's cursor, including its own changes, in one round trip
+    since = data.get('since')
+    body = {'results': results}
+    if isinstance(since, int) and since >= 0:
+        body.update(database.get_changes_since(since))
+    return jsonify(body)
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Serve fingerprinted, precompressed bundles built by assets.py"""
+    return assets.send_asset(filename)
 
 if __name__ == '__main__':
     app.run(debug = True)
\ No newline at end of file
@@ -0,0 +1,261 @@
+"""Static asset pipeline.
+
+    python assets.py vendor   # download pinned third-party files into static/vendor (needs internet once)
+    python assets.py build    # bundle, minify, fingerprint and precompress into static/dist
+
+Templates ask for bundles through asset_urls(). Once built, each bundle is a
+single content-hashed file served from /assets/ with a one year immutable
+Cache-Control and a precompressed .br/.gz variant. Before a build, the source
+files are served from /static/.
+
+The app refuses to start while a bundle source is missing (and not built), so
+a deployment without CDN access never ends up with pages that need one. Set
+TRACKER_ASSETS_CDN=1 to allow the pinned CDN copies of the vendored files instead.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+import urllib.request
+
+from flask import request, send_file, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+ASSET_PREFIX = '/assets/'
+
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+
+# Pinned third-party files: local path under static/ -> download URL
+VENDOR = {
+    'vendor/chart.umd.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+for font in ('fa-solid-900', 'fa-regular-400', 'fa-brands-400', 'fa-v4compatibility'):
+    for extension in ('woff2', 'ttf'):
+        VENDOR[f'vendor/fontawesome/webfonts/{font}.{extension}'] = f'{FONT_AWESOME}/webfonts/{font}.{extension}'
+
+# Same pinned versions, used for missing vendored files only when TRACKER_ASSETS_CDN=1
+ASSETS_CDN = os.environ.get('TRACKER_ASSETS_CDN', '0') == '1'
+CDN_FALLBACKS = {
+    'vendor/chart.umd.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+
+# Bundle name -> source files under static/, concatenated in order
+BUNDLES = {
+    'app.css': ['vendor/fontawesome/css/all.min.css', 'unified_theme.css'],
+    'charts.js': ['vendor/chart.umd.min.js'],
+    'minimal_theme.css': ['minimal_theme.css'],
+    'soft_theme.css': ['soft_theme.css'],
+}
+
+# Types worth compressing at all (fonts like woff2 are already compressed)
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.ttf', '.html')
+CACHE_FOREVER = 'public, max-age=31536000, immutable'
+
+_manifest = None
+_manifest_mtime = None
+
+
+def load_manifest():
+    """Bundle name -> hashed file name, re-read when a new build lands"""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        _manifest, _manifest_mtime = {}, None
+        return _manifest
+
+    if mtime != _manifest_mtime:
+        with open(MANIFEST_PATH) as f:
+            _manifest = json.load(f)
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def asset_urls(bundle):
+    """URLs to include for a bundle - one fingerprinted file once built, the sources otherwise"""
+    manifest = load_manifest()
+    if bundle in manifest:
+        return [ASSET_PREFIX + manifest[bundle]]
+
+    urls = []
+    for source in BUNDLES[bundle]:
+        if os.path.exists(os.path.join(STATIC_DIR, source)):
+            urls.append(url_for('static', filename=source))
+        elif ASSETS_CDN and source in CDN_FALLBACKS:
+            urls.append(CDN_FALLBACKS[source])
+    return urls
+
+
+def check_sources():
+    """Raise at startup if a page would need a file that is neither built nor in static/"""
+    manifest = load_manifest()
+    needed = [source for bundle, sources in BUNDLES.items() if bundle not in manifest for source in sources]
+    if needed:
+        # Unbuilt pages also load what the vendored files reference, like the icon fonts
+        needed += [local for local in VENDOR if local not in needed]
+    missing = [source for source in needed if not os.path.exists(os.path.join(STATIC_DIR, source))]
+    if ASSETS_CDN:
+        # The CDN stylesheet brings its own fonts
+        missing = [source for source in missing if source not in CDN_FALLBACKS and source not in VENDOR]
+    if missing:
+        raise RuntimeError(f"Missing static files {missing} - run 'python assets.py vendor' "
+                           "(or set TRACKER_ASSETS_CDN=1 to load them from the CDN)")
+
+
+def send_asset(filename):
+    """Serve a built asset, picking the precompressed variant the client accepts"""
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=31536000)
+    response.headers['Cache-Control'] = CACHE_FOREVER
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compress_response(response):
+    """after_request hook: gzip dynamic HTML/JSON responses for clients that accept it"""
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('text/html', 'application/json')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+
+    data = response.get_data()
+    if len(data) < 500:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def minify_css(css):
+    """Strip comments and collapse whitespace - enough for our hand-written stylesheets"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+def _fingerprint(name, data):
+    """name.ext -> name.<hash>.ext"""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    base, extension = os.path.splitext(os.path.basename(name))
+    return f'{base}.{digest}{extension}'
+
+
+def _write_asset(name, data):
+    """Write a fingerprinted file plus its precompressed variants; return the hashed name"""
+    hashed = _fingerprint(name, data)
+    path = os.path.join(DIST_DIR, hashed)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    if hashed.endswith(COMPRESSIBLE):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+    return hashed
+
+
+def _rewrite_css_urls(css, source, built):
+    """Point relative url() references at fingerprinted copies of the files they name"""
+    source_dir = os.path.dirname(os.path.join(STATIC_DIR, source))
+
+    def replace(match):
+        target = match.group(2)
+        if target.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+
+        clean = target.split('?')[0].split('#')[0]
+        path = os.path.normpath(os.path.join(source_dir, clean))
+        if not os.path.isfile(path):
+            return match.group(0)
+
+        if path not in built:
+            with open(path, 'rb') as f:
+                built[path] = _write_asset(path, f.read())
+        return f'url({ASSET_PREFIX}{built[path]})'
+
+    return re.sub(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', replace, css)
+
+
+def vendor():
+    """Download the pinned third-party files into static/vendor"""
+    for local, url in VENDOR.items():
+        path = os.path.join(STATIC_DIR, local)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"Downloading {url}")
+        with urllib.request.urlopen(url, timeout=60) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+
+
+def build():
+    """Bundle, minify and fingerprint every bundle into static/dist and write the manifest"""
+    missing = [source for sources in BUNDLES.values() for source in sources
+               if not os.path.exists(os.path.join(STATIC_DIR, source))]
+    if missing:
+        raise SystemExit(f"Missing sources {missing} - run 'python assets.py vendor' first")
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    built = {}
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+                text = f.read()
+            if bundle.endswith('.css'):
+                text = minify_css(_rewrite_css_urls(text, source, built))
+            parts.append(text.strip())
+
+        # JS sources are the vendors' own minified builds, so they are only concatenated
+        separator = '\n' if bundle.endswith('.css') else ';\n'
+        data = separator.join(parts).encode('utf-8')
+        manifest[bundle] = _write_asset(bundle, data)
+        print(f"{bundle} -> {manifest[bundle]} ({len(data)} bytes)")
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+if __name__ == '__main__':
+    commands = {'vendor': vendor, 'build': build}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(__doc__)
+        sys.exit(1)
+    commands[sys.argv[1]]()
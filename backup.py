@@ -0,0 +1,264 @@
+"""Online backups of the tracker database.
+
+    python backup.py create            # back up now (compressed unless TRACKER_BACKUP_COMPRESS=0)
+    python backup.py list              # show existing backups, newest first
+    python backup.py verify <backup>   # integrity check a backup and print its row counts
+    python backup.py restore <backup>  # verify, then copy a backup over the live database
+
+Each backup is a directory holding tracker.db and the archive/tracker-YYYY.db
+files of archived years, so a restore brings back the whole history. Backups
+use the SQLite backup API. On the WAL database this is one pass over
+a read snapshot, so writers carry on while it runs; a rollback-journal
+database is copied a few pages at a time with pauses between steps. The
+scheduler runs create_backup() daily in its background thread, outside the
+request path.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+
+BACKUP_DIR = os.environ.get('TRACKER_BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.environ.get('TRACKER_BACKUP_KEEP', 7))
+BACKUP_COMPRESS = os.environ.get('TRACKER_BACKUP_COMPRESS', '1') != '0'
+
+# Pages copied per backup step, and the pause between steps that lets writers in
+PAGES_PER_STEP = 256
+STEP_PAUSE_SECONDS = 0.005
+
+BACKUP_PREFIX = 'tracker-'
+# Files inside a backup directory
+MAIN_FILE = 'tracker.db'
+ARCHIVE_SUBDIR = 'archive'
+
+
+def backup_dir():
+    """Backup directory, relative paths resolved next to the database"""
+    base_dir = os.path.dirname(os.path.abspath(database.DATABASE_NAME))
+    return os.path.join(base_dir, BACKUP_DIR)
+
+
+def list_backups():
+    """Backup paths, newest first - directories, plus single files from before archives were backed up"""
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    names = [name for name in os.listdir(directory)
+             if name.startswith(BACKUP_PREFIX)
+             and (name.endswith(('.db', '.db.gz')) or os.path.isdir(os.path.join(directory, name)))]
+    # Timestamped names sort chronologically
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+
+def _copy_database(source_path, target_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE_SECONDS):
+    """Copy one SQLite database into another with the backup API"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+
+    # In WAL mode a single step only holds a read snapshot, which never blocks writers,
+    # while paged steps would restart from scratch after every concurrent write.
+    # Rollback-journal databases lock out writers for a step, so keep the steps short.
+    if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+        pages = -1
+
+    def progress(status, remaining, total):
+        # Sleeping between steps releases the source so request threads can write
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+def _check_database(path):
+    """Run an integrity check on a plain database file; return {table: row count}"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    cursor = conn.cursor()
+
+    cursor.execute('PRAGMA integrity_check')
+    result = cursor.fetchone()[0]
+    if result != 'ok':
+        conn.close()
+        raise ValueError(f"Integrity check failed for {path}: {result}")
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+    counts = {}
+    for (table,) in cursor.fetchall():
+        cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+        counts[table] = cursor.fetchone()[0]
+
+    conn.close()
+    return counts
+
+
+def _unpacked(path, directory):
+    """Plain database file for a backup, decompressing .gz backups into directory"""
+    if not path.endswith('.gz'):
+        return path
+
+    target = os.path.join(directory, os.path.basename(path)[:-len('.gz')])
+    with gzip.open(path, 'rb') as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return target
+
+
+def _backup_members(path):
+    """(main database file, {year: archive database file}) of a backup"""
+    if os.path.isfile(path):
+        return path, {}
+
+    def member(name):
+        for candidate in (name, name + '.gz'):
+            if os.path.exists(os.path.join(path, candidate)):
+                return os.path.join(path, candidate)
+        return None
+
+    main_path = member(MAIN_FILE)
+    if main_path is None:
+        raise ValueError(f"No {MAIN_FILE} in backup {path}")
+
+    archives = {}
+    archive_dir = os.path.join(path, ARCHIVE_SUBDIR)
+    if os.path.isdir(archive_dir):
+        for filename in os.listdir(archive_dir):
+            year = filename.replace('.gz', '')[len(BACKUP_PREFIX):-len('.db')]
+            if filename.startswith(BACKUP_PREFIX) and year.isdigit():
+                archives[year] = os.path.join(archive_dir, filename)
+    return main_path, archives
+
+
+def _check_backup(path, directory):
+    """Integrity check every database in a backup, unpacking into directory;
+    returns ({table: row count summed over all files}, main file, {year: archive file})"""
+    main_path, archives = _backup_members(path)
+    main_path = _unpacked(main_path, directory)
+    counts = _check_database(main_path)
+
+    for year in sorted(archives):
+        archive_path = _unpacked(archives[year], directory)
+        archives[year] = archive_path
+        for table, count in _check_database(archive_path).items():
+            counts[table] = counts.get(table, 0) + count
+    return counts, main_path, archives
+
+
+def _pack(path, compress):
+    """Gzip a finished database file in place if compressing; returns the resulting path"""
+    if not compress:
+        return path
+
+    with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+    return path + '.gz'
+
+
+def rotate_backups(keep=None):
+    """Delete all but the newest `keep` backups; returns the removed paths"""
+    if keep is None:
+        keep = BACKUP_KEEP
+
+    removed = []
+    for path in list_backups()[keep:]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def create_backup(compress=None, keep=None):
+    """Back up the live database and its archives without blocking writers; returns the backup directory"""
+    if compress is None:
+        compress = BACKUP_COMPRESS
+
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    final_path = os.path.join(directory, BACKUP_PREFIX + datetime.now().strftime('%Y%m%d-%H%M%S'))
+
+    # Build in a temp directory beside the target so a crash never leaves a half-written backup
+    temp_path = tempfile.mkdtemp(prefix='.partial-', dir=directory)
+    try:
+        main_path = os.path.join(temp_path, MAIN_FILE)
+        _copy_database(database.DATABASE_NAME, main_path)
+        _check_database(main_path)
+        _pack(main_path, compress)
+
+        years = database._archive_years()
+        if years:
+            os.makedirs(os.path.join(temp_path, ARCHIVE_SUBDIR))
+        for year in years:
+            archive_path = os.path.join(temp_path, ARCHIVE_SUBDIR, os.path.basename(database._archive_path(year)))
+            _copy_database(database._archive_path(year), archive_path)
+            _check_database(archive_path)
+            _pack(archive_path, compress)
+
+        os.replace(temp_path, final_path)
+    finally:
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+
+    rotate_backups(keep)
+    return final_path
+
+
+def verify_backup(path):
+    """Integrity check a backup and its archives; returns {table: row count}"""
+    with tempfile.TemporaryDirectory() as directory:
+        return _check_backup(path, directory)[0]
+
+
+def restore_backup(path):
+    """Verify a backup, then copy it and its archives over the live databases; returns its row counts"""
+    with tempfile.TemporaryDirectory() as directory:
+        # Everything is checked before anything is overwritten
+        counts, main_path, archives = _check_backup(path, directory)
+        versions = database.get_log_versions()
+
+        # Archive years the backup does not have hold rows its tracker.db still keeps hot
+        for year in database._archive_years():
+            if year not in archives:
+                os.remove(database._archive_path(year))
+        if archives:
+            os.makedirs(os.path.dirname(database._archive_path(0)), exist_ok=True)
+        for year, archive_path in archives.items():
+            _copy_database(archive_path, database._archive_path(year), pages=-1, pause=0)
+
+        # One step, so other connections see either the old or the restored database
+        _copy_database(main_path, database.DATABASE_NAME, pages=-1, pause=0)
+
+    # The restored version counters may be older than what workers have cached
+    database.advance_log_versions(versions)
+    return counts
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == 'create':
+        print(create_backup())
+    elif len(sys.argv) == 2 and sys.argv[1] == 'list':
+        for backup_path in list_backups():
+            if os.path.isdir(backup_path):
+                size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, names in os.walk(backup_path) for name in names)
+            else:
+                size = os.path.getsize(backup_path)
+            print(f"{backup_path} ({size} bytes)")
+    elif len(sys.argv) == 3 and sys.argv[1] in ('verify', 'restore'):
+        command = verify_backup if sys.argv[1] == 'verify' else restore_backup
+        for table, count in command(sys.argv[2]).items():
+            print(f"{table}: {count}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,13 +1,290 @@
+import json
+import os
+import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.request import pathname2url
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 DATABASE_NAME = 'tracker.db'
 
+# Rows older than the horizon move to per-year archive databases next to DATABASE_NAME
+ARCHIVE_DIR = 'archive'
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('TRACKER_ARCHIVE_DAYS', 365))
+
+# Change log entities: entity -> (table, JSON snapshot of a row for upserts)
+CHANGE_ENTITIES = {
+    'meal': ('meals', '''json_object('id', id, 'food_name', food_name, 'quantity', quantity,
+        'protein', protein, 'calories', calories, 'meal_time', meal_time, 'date_logged', date_logged)'''),
+    'workout': ('workouts', '''json_object('id', id, 'exercise_name', exercise_name, 'weight', weight,
+        'reps', reps, 'sets', sets, 'date_logged', date_logged, 'notes', notes,
+        'set_detail', json((SELECT json_group_array(json_object('weight', weight, 'reps', reps))
+                            FROM (SELECT weight, reps FROM workout_sets
+                                  WHERE workout_id = workouts.id ORDER BY set_number))))'''),
+    'favorite': ('favorite_foods', '''json_object('id', id, 'food_name', food_name, 'quantity', quantity,
+        'unit', unit, 'protein', protein, 'calories', calories, 'times_logged', times_logged)'''),
+    'recipe': ('recipes', '''json_object('id', id, 'name', name, 'servings', servings,
+        'protein_per_serving', protein_per_serving, 'calories_per_serving', calories_per_serving,
+        'stale', nutrition_stale = 1,
+        'ingredients', json((SELECT json_group_array(json_object('food', food_name, 'quantity', quantity, 'unit', unit))
+                             FROM recipe_ingredients WHERE recipe_id = recipes.id)))'''),
+    'goals': ('settings', "json_object('protein_goal', protein_goal, 'calorie_goal', calorie_goal)"),
+    'preferences': ('user_preferences', '''json_object('is_onboarded', is_onboarded,
+        'cuisine', cuisine_preference, 'goal', tracking_goal, 'weight', weight,
+        'activity', activity_level, 'theme', theme, 'timezone', timezone)'''),
+}
+CHANGE_LOG_RETENTION_DAYS = 30
+
+# Reader connections map the database file and keep a bigger page cache
+READ_MMAP_SIZE = int(os.environ.get('TRACKER_MMAP_SIZE', 256 * 1024 * 1024))
+READ_CACHE_KB = int(os.environ.get('TRACKER_READ_CACHE_KB', 32 * 1024))
+WRITE_BUSY_TIMEOUT = 5.0
+
+# Full-text search: table -> (kind, rowid offset, title, notes). Index rowids are id * 2 + offset
+SEARCH_SOURCES = {
+    'meals': ('meal', 0, 'food_name', "''"),
+    'workouts': ('workout', 1, 'exercise_name', "COALESCE(notes, '')"),
+}
+
+# Columns copied to archives and exposed through the history_* views
+ARCHIVED_COLUMNS = {
+    'meals': ('id', 'food_name', 'quantity', 'protein', 'calories', 'meal_time', 'date_logged'),
+    'workouts': ('id', 'exercise_name', 'weight', 'reps', 'sets', 'date_logged', 'notes'),
+    'workout_sessions': ('id', 'date_logged', 'notes'),
+    'workout_sets': ('id', 'workout_id', 'session_id', 'set_number', 'weight', 'reps', 'date_logged'),
+}
+
+# Volume of a workouts row: its logged sets, or weight x reps x sets for rows logged without set detail
+WORKOUT_VOLUME = '''COALESCE(
+    (SELECT SUM(s.weight * s.reps) FROM {sets} s WHERE s.workout_id = {workouts}.id),
+    {workouts}.weight * {workouts}.reps * {workouts}.sets)'''
+
+
+class MealRecord:
+    """One of today's meals, kept in the in-process cache"""
+    __slots__ = ('id', 'food', 'quantity', 'protein', 'calories', 'meal_time')
+
+    def __init__(self, id, food, quantity, protein, calories, meal_time):
+        self.id = id
+        self.food = food
+        self.quantity = quantity
+        self.protein = protein or 0
+        self.calories = calories or 0
+        self.meal_time = meal_time
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'food': self.food,
+            'quantity': self.quantity,
+            'protein': self.protein,
+            'calories': self.calories,
+            'meal_time': self.meal_time
+        }
+
+
+class WorkoutRecord:
+    """One of today's workouts, kept in the in-process cache"""
+    __slots__ = ('id', 'exercise', 'weight', 'reps', 'sets', 'notes', 'volume')
+
+    def __init__(self, id, exercise, weight, reps, sets, notes, volume=None):
+        self.id = id
+        self.exercise = exercise
+        self.weight = weight or 0
+        self.reps = reps or 0
+        self.sets = sets or 0
+        self.notes = notes
+        # Set-level volume when the sets differ; weight x reps x sets otherwise
+        self.volume = volume if volume is not None else self.weight * self.reps * self.sets
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'exercise': self.exercise,
+            'weight': self.weight,
+            'reps': self.reps,
+            'sets': self.sets,
+            'notes': self.notes,
+            'volume': self.volume
+        }
+
+
+class DayLog:
+    """Today's records with running totals, tagged with the date and table version they reflect"""
+    __slots__ = ('date', 'version', 'records', 'protein_total', 'calorie_total', 'volume_total')
+
+    def __init__(self, date, version):
+        self.date = date
+        self.version = version
+        self.records = []
+        self.protein_total = 0.0
+        self.calorie_total = 0.0
+        self.volume_total = 0.0
+
+    def _has(self, record_id):
+        return any(record.id == record_id for record in self.records)
+
+    def add_meal(self, meal):
+        # A reload may already have picked up the row the writer is appending
+        if self._has(meal.id):
+            return
+        self.records.append(meal)
+        self.protein_total += meal.protein
+        self.calorie_total += meal.calories
+
+    def remove_meal(self, meal_id):
+        for i, meal in enumerate(self.records):
+            if meal.id == meal_id:
+                del self.records[i]
+                self.protein_total -= meal.protein
+                self.calorie_total -= meal.calories
+                return meal
+        return None
+
+    def add_workout(self, workout):
+        if self._has(workout.id):
+            return
+        self.records.append(workout)
+        self.volume_total += workout.volume
+
+
+# Per-process cache of today's log. Every meal/workout mutation bumps a version
+# row in log_versions, so a worker notices writes made by other workers and
+# reloads instead of serving stale data.
+_todays_meals = None
+_todays_workouts = None
+_cache_lock = threading.RLock()
+
+# The current day is resolved once per request (in the user's timezone) and
+# pinned here so every query in that request agrees on what "today" is.
+_request_day = threading.local()
+
+# Reads go through one read-only connection per thread. Writes share a single
+# writer connection per process, handed to one caller at a time.
+_readers = threading.local()
+_writer = None
+_writer_lock = threading.RLock()
+_writer_state = threading.local()
+
+
+def _uri(path, mode=None):
+    """SQLite URI for a file path, optionally with a mode (ro, rw, rwc)"""
+    uri = 'file:' + pathname2url(os.path.abspath(path))
+    return f'{uri}?mode={mode}' if mode else uri
+
+
+
+
+class _ReadConnection:
+    """One caller's use of this thread's read-only connection
+
+    The connection itself stays open; close() only closes the cursors this caller
+    opened, ending their statements so later queries read a fresh snapshot.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursors = []
+
+    def cursor(self):
+        cursor = self._conn.cursor()
+        self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.close()
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _WriteConnection:
+    """Checkout of the process-wide writer connection, returned to the pool by close()"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        # Thread holding the writer lock for this checkout, None once it is given back
+        self._owner = threading.get_ident()
+
+    def close(self):
+        # Only the holding thread may release, and only once - release_connections()
+        # may already have given back a checkout its caller never closed
+        if self._owner == threading.get_ident():
+            self._owner = None
+            _release_writer(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _tune_reader(conn, schema='main'):
+    """Memory-map and enlarge the page cache of one read-only database on a connection"""
+    conn.execute(f'PRAGMA {schema}.mmap_size={READ_MMAP_SIZE}')
+    conn.execute(f'PRAGMA {schema}.cache_size=-{READ_CACHE_KB}')
+
+
+def connect_reader():
+    """Read-only (mode=ro), memory-mapped connection for queries"""
+    conn = getattr(_readers, 'connection', None)
+    if conn is None or _readers.database != DATABASE_NAME:
+        conn = sqlite3.connect(_uri(DATABASE_NAME, 'ro'), uri=True)
+        _tune_reader(conn)
+        _readers.connection, _readers.database = conn, DATABASE_NAME
+    return _ReadConnection(conn)
+
+
+def connect_writer():
+    """The process's writer connection; blocks while another thread is using it"""
+    global _writer
+    _writer_lock.acquire()
+
+    if _writer is None or _writer[1] != DATABASE_NAME:
+        conn = sqlite3.connect(DATABASE_NAME, timeout=WRITE_BUSY_TIMEOUT, check_same_thread=False)
+        # WAL only needs a sync at checkpoints to stay durable across crashes
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _writer = (conn, DATABASE_NAME)
+
+    checkout = _WriteConnection(_writer[0])
+    if not hasattr(_writer_state, 'checkouts'):
+        _writer_state.checkouts = []
+    _writer_state.checkouts.append(checkout)
+    return checkout
+
+
+def _release_writer(checkout):
+    """Give the writer back, discarding anything its user did not commit"""
+    _writer_state.checkouts.remove(checkout)
+    if not _writer_state.checkouts and _writer[0].in_transaction:
+        _writer[0].rollback()
+    _writer_lock.release()
+
+
+def release_connections():
+    """Return a writer this thread never closed (after an exception) - called at the end of each request"""
+    checkouts = getattr(_writer_state, 'checkouts', [])
+    # Roll back while the lock is still ours, so an aborted write never reaches the next commit
+    if checkouts and _writer[0].in_transaction:
+        _writer[0].rollback()
+    for checkout in list(reversed(checkouts)):
+        checkout.close()
+
 def init_db():
     """Initializing database and create tables if it doesnt exist"""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
 
+    # WAL lets readers run alongside the writer; checkpoints are done by the scheduler
+    cursor.execute('PRAGMA journal_mode=WAL')
+
+    # New databases get incremental auto-vacuum (existing ones are converted by maintenance)
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
     # Create meals table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS meals (
@@ -81,6 +358,204 @@ def init_db():
         )
     ''')
 
+    # Sessions logged in one go, and the individual sets of their workouts. Each workouts
+    # row keeps its top set and set count, so per-exercise queries work unchanged
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS workout_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_logged TEXT NOT NULL,
+            notes TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS workout_sets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            workout_id INTEGER NOT NULL,
+            session_id INTEGER,
+            set_number INTEGER NOT NULL,
+            weight REAL,
+            reps INTEGER,
+            date_logged TEXT NOT NULL
+        )
+    ''')
+
+    # Nutrition rollups - one row per day/week/month, kept in sync by meal mutations
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_nutrition (
+            date TEXT PRIMARY KEY,
+            protein REAL NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            protein_goal_met INTEGER NOT NULL DEFAULT 0,
+            calorie_goal_met INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table in ('weekly_nutrition', 'monthly_nutrition'):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                period_start TEXT PRIMARY KEY,
+                protein REAL NOT NULL DEFAULT 0,
+                calories REAL NOT NULL DEFAULT 0,
+                meal_count INTEGER NOT NULL DEFAULT 0,
+                days_logged INTEGER NOT NULL DEFAULT 0,
+                protein_goal_days INTEGER NOT NULL DEFAULT 0,
+                calorie_goal_days INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    # Recipes - per-serving nutrition is cached on the recipe row and only
+    # recomputed when its ingredients (or a catalog food they use) change
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            servings REAL NOT NULL DEFAULT 1,
+            protein_per_serving REAL,
+            calories_per_serving REAL,
+            nutrition_stale INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+            food_name TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            unit TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_recipe ON recipe_ingredients (recipe_id)')
+    # Ingredients match catalog foods case-insensitively, like food_catalog.name
+    cursor.execute('DROP INDEX IF EXISTS idx_recipe_ingredients_food')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_food_nocase
+        ON recipe_ingredients (food_name COLLATE NOCASE)
+    ''')
+
+    # Change counters for the in-process caches of today's log
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS log_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Every change to user data, for clients syncing deltas since a cursor
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            data TEXT,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+
+    # Client-generated IDs of uploaded offline logs, so a retried upload is applied once
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS applied_ops (
+            op_id TEXT PRIMARY KEY,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+
+    # Background scheduler - single leader lock and per-job progress
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_lock (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            owner TEXT,
+            expires_at REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO scheduler_lock (id, owner, expires_at) VALUES (1, NULL, 0)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+            name TEXT PRIMARY KEY,
+            last_run TEXT
+        )
+    ''')
+
+    # Exercise names that exist in archives, so clear_todays_workouts knows when to look there
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_exercises (
+            exercise_name TEXT PRIMARY KEY
+        )
+    ''')
+
+    # Foods bulk-loaded by food_import.py, per 100g like the built-in catalog in app.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS food_catalog (
+            name TEXT PRIMARY KEY COLLATE NOCASE,
+            code TEXT,
+            calories REAL NOT NULL,
+            protein REAL NOT NULL,
+            base_unit TEXT NOT NULL DEFAULT '100g',
+            grams_per_unit REAL,
+            source TEXT
+        ) WITHOUT ROWID
+    ''')
+
+    # Resume points for food_import.py, one per source file
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            file_size INTEGER,
+            position INTEGER NOT NULL,
+            imported INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+
+    # Most recent session per exercise (archives included), kept current by add_workout
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS last_sessions (
+            exercise_name TEXT PRIMARY KEY,
+            workout_id INTEGER NOT NULL,
+            weight REAL,
+            reps INTEGER,
+            sets INTEGER,
+            date_logged TEXT NOT NULL
+        )
+    ''')
+
+    # Migration - timezone column for databases created before it existed
+    cursor.execute('PRAGMA table_info(user_preferences)')
+    if 'timezone' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE user_preferences ADD COLUMN timezone TEXT')
+
+    # Indexes for per-day lookups, date range scans and per-exercise history
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_meals_date ON meals (date_logged, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_meals_time_date ON meals (meal_time, date_logged, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workouts_date ON workouts (date_logged, id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workouts_exercise_date
+        ON workouts (exercise_name, date_logged, id)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_sets_workout ON workout_sets (workout_id, set_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_sets_session ON workout_sets (session_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_sets_date ON workout_sets (date_logged, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_sessions_date ON workout_sessions (date_logged, id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_stats_met
+        ON daily_stats (both_goals_met, date)
+    ''')
+
+    # Favorites are listed by popularity and looked up by food, quantity and unit on every log
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_favorite_foods_times ON favorite_foods (times_logged)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_favorite_foods_food ON favorite_foods (food_name, quantity, unit)')
+
+    # Recency order for the gym page, and the retention sweep over applied client ops
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_sessions_date ON last_sessions (date_logged, workout_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_applied_ops_applied ON applied_ops (applied_at)')
+
     # Insert default settings if the table is empty
     cursor.execute('SELECT COUNT(*) FROM settings')
     if cursor.fetchone()[0] == 0:
@@ -93,120 +568,230 @@ def init_db():
         cursor.execute('INSERT INTO user_preferences (id, is_onboarded) VALUES (1, 0)')
         print("DEBUG: Inserted default user_preferences row")
 
+    # Full-text index over meal names, exercise names and workout notes, kept in sync by triggers
+    search_ready = True
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                kind UNINDEXED,
+                date_logged UNINDEXED,
+                title,
+                notes,
+                tokenize = 'porter unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search disabled, SQLite has no FTS5: {e}")
+        search_ready = False
+
+    if search_ready:
+        for table, (kind, offset, title, notes) in SEARCH_SOURCES.items():
+            row = f"new.id * 2 + {offset}, '{kind}', new.date_logged, new.{title}, {notes.replace('notes', 'new.notes')}"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                    INSERT OR REPLACE INTO search_index (rowid, kind, date_logged, title, notes) VALUES ({row});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table} BEGIN
+                    DELETE FROM search_index WHERE rowid = old.id * 2 + {offset};
+                    INSERT INTO search_index (rowid, kind, date_logged, title, notes) VALUES ({row});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                    DELETE FROM search_index WHERE rowid = old.id * 2 + {offset};
+                END
+            ''')
+
+    # Backfill rollups for databases created before the rollup tables existed
+    cursor.execute('SELECT COUNT(*) FROM daily_nutrition')
+    needs_backfill = cursor.fetchone()[0] == 0
+
+    # ...the last-session table...
+    cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM last_sessions) AND EXISTS (SELECT 1 FROM workouts)')
+    needs_sessions_backfill = cursor.fetchone()[0] == 1
+
+    # ...and the search index for databases created before it existed
+    needs_search_backfill = False
+    if search_ready:
+        cursor.execute('SELECT COUNT(*) FROM search_index')
+        if cursor.fetchone()[0] == 0:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM meals) OR EXISTS (SELECT 1 FROM workouts)')
+            needs_search_backfill = cursor.fetchone()[0] == 1
+
     conn.commit()
     conn.close()
 
+    if needs_backfill:
+        rebuild_nutrition_rollups()
+    if needs_sessions_backfill:
+        rebuild_last_sessions()
+    if needs_search_backfill or (search_ready and _archive_years() and not _search_covers_archives()):
+        rebuild_search_index()
 
-def add_meal(food_name, quantity, protein, calories, meal_time):
-    """Add a new meal to the database"""
-    conn = sqlite3.connect(DATABASE_NAME)
+
+def add_meal(food_name, quantity, protein, calories, meal_time, date_logged=None, op_id=None):
+    """Add a new meal to the database and return its ID
+
+    date_logged defaults to today. op_id is a client-generated ID for offline uploads;
+    a meal already added under the same op_id is not added again and its ID is returned.
+    """
+    global _todays_meals
+    conn = connect_writer()
     cursor = conn.cursor()
 
+    existing_id = _applied_op(cursor, op_id)
+    if existing_id is not None:
+        conn.close()
+        return existing_id
+
     #Get today's date
-    date_logged = datetime.now().strftime('%Y-%m-%d')
+    date_logged = date_logged or get_today()
 
     #Insert the meal into the meals table
     cursor.execute('''
         INSERT INTO meals(food_name, quantity, protein, calories, meal_time,date_logged)
         VALUES (?,?,?,?,?,?)
     ''', (food_name, quantity, protein, calories, meal_time, date_logged))
+    meal_id = cursor.lastrowid
 
-    conn.commit()
-    conn.close()
-
-def get_todays_meals():
-
-    """Get all meals logged today"""
-
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-
-    #Get Today's date
-    today = datetime.now().strftime('%Y-%m-%d')
-
-    #Query all meals from today
-    cursor.execute('''
-        SELECT id, food_name, quantity, protein, calories, meal_time
-        FROM meals
-        WHERE date_logged = ?
-    ''', (today,))
+    _apply_meal_delta(cursor, date_logged, protein, calories, 1)
+    _log_change(cursor, 'meal', 'upsert', 'id = ?', (meal_id,))
+    _record_op(cursor, op_id, 'meal', meal_id)
+    version = _bump_log_version(cursor, 'meals')
 
-    #Fetch all results
-    rows = cursor.fetchall()
+    conn.commit()
     conn.close()
 
-    #Convert rows to list to dictornieres
+    with _cache_lock:
+        if _is_next_version(_todays_meals, date_logged, version):
+            _todays_meals.add_meal(MealRecord(meal_id, food_name, quantity, protein, calories, meal_time))
+            _todays_meals.version = version
+        else:
+            _todays_meals = None
 
-    meals = []
-    for row in rows:
-        meals.append({
-            'id': row[0],
-            'food' : row[1],
-            'quantity': row[2],
-            'protein' : row[3],
-            'calories': row[4],
-            'meal_time': row[5]
-        })
+    return meal_id
 
-    return meals
+def get_todays_meals():
+    """Get all meals logged today"""
+    day_log = _load_todays_meals()
+    with _cache_lock:
+        return [meal.to_dict() for meal in day_log.records]
 
 def clear_todays_meals():
     """Delete all meals logged today"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    global _todays_meals
+    conn = connect_writer()
     cursor = conn.cursor()
 
-    today = datetime.now().strftime('%Y-%m-%d')
+    today = get_today()
 
     # Delete all meals from today
+    _log_change(cursor, 'meal', 'delete', 'date_logged = ?', (today,))
     cursor.execute('DELETE FROM meals WHERE date_logged = ?', (today,))
 
+    if cursor.rowcount > 0:
+        _apply_meal_delta(cursor, today, 0, 0, -cursor.rowcount)
+    version = _bump_log_version(cursor, 'meals')
+
     conn.commit()
     conn.close()
 
+    with _cache_lock:
+        _todays_meals = DayLog(today, version)
+
 def delete_meal(food_name, meal_time):
     """Delete a specific meal by food name and meal time for today"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
-    today = datetime.now().strftime('%Y-%m-%d')
+    today = get_today()
 
-    # Delete the specific meal from today
     cursor.execute('''
-        DELETE FROM meals
+        SELECT id, protein, calories FROM meals
         WHERE food_name = ? AND meal_time = ? AND date_logged = ?
         LIMIT 1
     ''', (food_name, meal_time, today))
+    result = cursor.fetchone()
+
+    # Delete the specific meal from today
+    if result:
+        _log_change(cursor, 'meal', 'delete', 'id = ?', (result[0],))
+        cursor.execute('DELETE FROM meals WHERE id = ?', (result[0],))
+        _apply_meal_delta(cursor, today, -(result[1] or 0), -(result[2] or 0), -1)
+        version = _bump_log_version(cursor, 'meals')
 
     conn.commit()
     conn.close()
 
+    if result:
+        _remove_cached_meal(result[0], version)
+
 def delete_meal_by_id(meal_id):
     """Delete a specific meal by ID"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
+    cursor.execute('SELECT protein, calories, date_logged FROM meals WHERE id = ?', (meal_id,))
+    result = cursor.fetchone()
+
+    _log_change(cursor, 'meal', 'delete', 'id = ?', (meal_id,))
     cursor.execute('DELETE FROM meals WHERE id = ?', (meal_id,))
 
+    if result:
+        _apply_meal_delta(cursor, result[2], -(result[0] or 0), -(result[1] or 0), -1)
+        version = _bump_log_version(cursor, 'meals')
+
     conn.commit()
     conn.close()
 
+    if result:
+        _remove_cached_meal(meal_id, version)
+
 def update_meal(meal_id, food_name, quantity, protein, calories, meal_time):
     """Update a specific meal by ID"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    global _todays_meals
+    conn = connect_writer()
     cursor = conn.cursor()
 
+    cursor.execute('SELECT protein, calories, date_logged FROM meals WHERE id = ?', (meal_id,))
+    old = cursor.fetchone()
+
     cursor.execute('''
         UPDATE meals
         SET food_name = ?, quantity = ?, protein = ?, calories = ?, meal_time = ?
         WHERE id = ?
     ''', (food_name, quantity, protein, calories, meal_time, meal_id))
 
+    if old:
+        _apply_meal_delta(cursor, old[2], protein - (old[0] or 0), calories - (old[1] or 0), 0)
+        _log_change(cursor, 'meal', 'upsert', 'id = ?', (meal_id,))
+        version = _bump_log_version(cursor, 'meals')
+
     conn.commit()
     conn.close()
 
+    if not old:
+        return
+
+    with _cache_lock:
+        if not _is_next_version(_todays_meals, old[2], version):
+            _todays_meals = None
+            return
+
+        # Swap the record in place so the meal keeps its position in the list
+        for i, meal in enumerate(_todays_meals.records):
+            if meal.id == meal_id:
+                _todays_meals.protein_total += (protein or 0) - meal.protein
+                _todays_meals.calorie_total += (calories or 0) - meal.calories
+                _todays_meals.records[i] = MealRecord(meal_id, food_name, quantity, protein, calories, meal_time)
+                break
+        _todays_meals.version = version
+
 def get_meal_by_id(meal_id):
     """Get a specific meal by ID"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -231,7 +816,7 @@ def get_meal_by_id(meal_id):
 
 def get_goals():
     """Get user's protein and calorie goals"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('SELECT protein_goal, calorie_goal FROM settings WHERE id = 1')
@@ -246,7 +831,7 @@ def get_goals():
 
 def update_goals(protein_goal, calorie_goal):
     """Update user's goals"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -254,13 +839,17 @@ def update_goals(protein_goal, calorie_goal):
         SET protein_goal = ?, calorie_goal = ?
         WHERE id = 1
     ''', (protein_goal, calorie_goal))
+    _log_change(cursor, 'goals', 'upsert', 'id = 1')
+
+    # Today's flags follow the new goals; finished days keep the goals they had
+    _refresh_day_stats(cursor, get_today())
 
     conn.commit()
     conn.close()
 
 def is_user_onboarded():
     """Check if user has completed onboarding"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('SELECT is_onboarded FROM user_preferences WHERE id = 1')
@@ -274,7 +863,7 @@ def is_user_onboarded():
 
 def save_onboarding(protein_goal, calorie_goal, cuisine, tracking_goal, weight, activity_level):
     """Save onboarding data"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
     # Update preferences
@@ -299,6 +888,9 @@ def save_onboarding(protein_goal, calorie_goal, cuisine, tracking_goal, weight,
 
     print(f"DEBUG: Updated {cursor.rowcount} rows in settings")  # ADD THIS
 
+    _log_change(cursor, 'goals', 'upsert', 'id = 1')
+    _log_change(cursor, 'preferences', 'upsert', 'id = 1')
+
     conn.commit()
     conn.close()
 
@@ -308,7 +900,7 @@ def save_onboarding(protein_goal, calorie_goal, cuisine, tracking_goal, weight,
 
 def get_user_preferences():
     """Get user preferences"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('SELECT cuisine_preference, tracking_goal, weight, activity_level FROM user_preferences WHERE id = 1')
@@ -325,63 +917,181 @@ def get_user_preferences():
         }
     return None
 
-def add_workout(exercise_name, weight, reps, sets, notes =''):
-    """Add a new workout to the database"""
-    conn = sqlite3.connect(DATABASE_NAME)
+def add_workout(exercise_name, weight, reps, sets, notes ='', date_logged=None, op_id=None):
+    """Add a new workout to the database and return its ID (date_logged and op_id as for add_meal)"""
+    global _todays_workouts
+    conn = connect_writer()
     cursor = conn.cursor()
 
-    date_logged = datetime.now().strftime('%Y-%m-%d')
+    existing_id = _applied_op(cursor, op_id)
+    if existing_id is not None:
+        conn.close()
+        return existing_id
+
+    date_logged = date_logged or get_today()
 
     cursor.execute('''
         INSERT INTO workouts (exercise_name, weight, reps, sets, date_logged, notes)
         VALUES (?,?,?,?,?,?)
     ''', (exercise_name, weight,reps, sets, date_logged, notes))
+    workout_id = cursor.lastrowid
+    _update_last_session(cursor, exercise_name, workout_id, weight, reps, sets, date_logged)
+
+    _log_change(cursor, 'workout', 'upsert', 'id = ?', (workout_id,))
+    _record_op(cursor, op_id, 'workout', workout_id)
+    version = _bump_log_version(cursor, 'workouts')
 
     conn.commit()
     conn.close()
 
-def get_todays_workouts():
-    """GET all workouts logged today"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    with _cache_lock:
+        if _is_next_version(_todays_workouts, date_logged, version):
+            _todays_workouts.add_workout(WorkoutRecord(workout_id, exercise_name, weight, reps, sets, notes))
+            _todays_workouts.version = version
+        else:
+            _todays_workouts = None
 
-    today = datetime.now().strftime('%Y-%m-%d')
+    return workout_id
 
+def _update_last_session(cursor, exercise_name, workout_id, weight, reps, sets, date_logged):
+    """Make a new workouts row the exercise's last session"""
+    # Backdated workouts (offline sync) only replace the last session if they are newer
     cursor.execute('''
-        SELECT exercise_name, weight, reps, sets, notes
-        FROM workouts
-        WHERE date_logged = ?
-        ORDER BY id DESC
-    ''', (today,))
+        INSERT INTO last_sessions (exercise_name, workout_id, weight, reps, sets, date_logged)
+        VALUES (?,?,?,?,?,?)
+        ON CONFLICT (exercise_name) DO UPDATE SET
+            workout_id = excluded.workout_id,
+            weight = excluded.weight,
+            reps = excluded.reps,
+            sets = excluded.sets,
+            date_logged = excluded.date_logged
+        WHERE (excluded.date_logged, excluded.workout_id) > (last_sessions.date_logged, last_sessions.workout_id)
+    ''', (exercise_name, workout_id, weight, reps, sets, date_logged))
+
+def log_workout_session(exercises, notes='', date_logged=None, op_id=None):
+    """Log a whole session in one transaction and return its ID
+
+    exercises is a list of {'exercise', 'sets': [{'weight', 'reps'}, ...], 'notes'}.
+    Each exercise becomes a workouts row holding its top set and set count, with
+    every set stored in workout_sets. date_logged and op_id work as for add_meal.
+    """
+    global _todays_workouts
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    existing_id = _applied_op(cursor, op_id)
+    if existing_id is not None:
+        conn.close()
+        return existing_id
+
+    date_logged = date_logged or get_today()
+
+    cursor.execute('INSERT INTO workout_sessions (date_logged, notes) VALUES (?, ?)', (date_logged, notes))
+    session_id = cursor.lastrowid
+
+    records = []
+    set_rows = []
+    for exercise in exercises:
+        sets = exercise['sets']
+        top = max(sets, key=lambda logged: (logged['weight'], logged['reps']))
+        cursor.execute('''
+            INSERT INTO workouts (exercise_name, weight, reps, sets, date_logged, notes)
+            VALUES (?,?,?,?,?,?)
+        ''', (exercise['exercise'], top['weight'], top['reps'], len(sets), date_logged, exercise.get('notes', '')))
+        workout_id = cursor.lastrowid
+        _update_last_session(cursor, exercise['exercise'], workout_id, top['weight'], top['reps'], len(sets),
+                             date_logged)
+
+        set_rows += [(workout_id, session_id, number, logged['weight'], logged['reps'], date_logged)
+                     for number, logged in enumerate(sets, start=1)]
+        records.append(WorkoutRecord(workout_id, exercise['exercise'], top['weight'], top['reps'], len(sets),
+                                     exercise.get('notes', ''),
+                                     sum(logged['weight'] * logged['reps'] for logged in sets)))
+
+    cursor.executemany('''
+        INSERT INTO workout_sets (workout_id, session_id, set_number, weight, reps, date_logged)
+        VALUES (?,?,?,?,?,?)
+    ''', set_rows)
+
+    # Change log snapshots include the sets, so they are taken after the sets are in
+    workout_ids = [record.id for record in records]
+    _log_change(cursor, 'workout', 'upsert', f"id IN ({','.join('?' * len(workout_ids))})", workout_ids)
+    _record_op(cursor, op_id, 'workout_session', session_id)
+    version = _bump_log_version(cursor, 'workouts')
+
+    conn.commit()
+    conn.close()
+
+    with _cache_lock:
+        if _is_next_version(_todays_workouts, date_logged, version):
+            for record in records:
+                _todays_workouts.add_workout(record)
+            _todays_workouts.version = version
+        else:
+            _todays_workouts = None
+
+    return session_id
+
+def get_workout_session(session_id):
+    """Get a logged session with its workouts and their sets"""
+    conn = connect_history(read_only=True)
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT id, date_logged, notes FROM history_workout_sessions WHERE id = ?', (session_id,))
+    session = cursor.fetchone()
+    if not session:
+        conn.close()
+        return None
 
+    cursor.execute('''
+        SELECT w.id, w.exercise_name, w.weight, w.reps, w.sets, w.notes, s.weight, s.reps
+        FROM history_workout_sets s
+        JOIN history_workouts w ON w.id = s.workout_id
+        WHERE s.session_id = ? AND w.date_logged = ?
+        ORDER BY s.workout_id, s.set_number
+    ''', (session_id, session[1]))
     rows = cursor.fetchall()
     conn.close()
 
-    # Convert to list of dictionaries
-    workouts = []
-    for row in rows:
-        workouts.append({
-            'exercise': row[0],
-            'weight': row[1],
-            'reps': row[2],
-            'sets': row[3],
-            'notes': row[4]
-        })
+    workouts = {}
+    for workout_id, exercise, weight, reps, sets, notes, set_weight, set_reps in rows:
+        if workout_id not in workouts:
+            workouts[workout_id] = {
+                'id': workout_id,
+                'exercise': exercise,
+                'weight': weight,
+                'reps': reps,
+                'sets': sets,
+                'notes': notes,
+                'volume': 0,
+                'set_detail': []
+            }
+        workouts[workout_id]['set_detail'].append({'weight': set_weight, 'reps': set_reps})
+        workouts[workout_id]['volume'] += set_weight * set_reps
+
+    return {
+        'id': session[0],
+        'date': session[1],
+        'notes': session[2],
+        'workouts': list(workouts.values())
+    }
 
-    return workouts
+def get_todays_workouts():
+    """GET all workouts logged today"""
+    # Newest first
+    day_log = _load_todays_workouts()
+    with _cache_lock:
+        return [workout.to_dict() for workout in reversed(day_log.records)]
 def get_last_workout(exercise_name):
     """Get the last time you did this exercise"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('''
         SELECT weight, reps, sets, date_logged
-        FROM workouts
+        FROM last_sessions
         WHERE exercise_name = ?
-        ORDER BY date_logged DESC, id DESC
-        LIMIT 1
     ''', (exercise_name,))
-
     result = cursor.fetchone()
     conn.close()
 
@@ -394,27 +1104,89 @@ def get_last_workout(exercise_name):
         }
     return None
 
-def get_workout_history(days=30):
-    """Get workout history for the last N days for progress tracking"""
-    conn = sqlite3.connect(DATABASE_NAME)
+def get_last_sessions():
+    """Get the most recent session of every exercise, most recently trained first"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT exercise_name, weight, reps, sets, date_logged
+        FROM last_sessions
+        ORDER BY date_logged DESC, workout_id DESC
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [
+        {
+            'exercise': row[0],
+            'weight': row[1],
+            'reps': row[2],
+            'sets': row[3],
+            'date': row[4]
+        }
+        for row in rows
+    ]
+
+def _select_last_sessions(source, where='1'):
+    """SELECT of the newest row per exercise in a workouts table or view"""
+    return f'''
+        SELECT exercise_name, id, weight, reps, sets, date_logged
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY exercise_name ORDER BY date_logged DESC, id DESC
+            ) AS position
+            FROM {source}
+            WHERE {where}
+        )
+        WHERE position = 1
+    '''
+
+def rebuild_last_sessions():
+    """Recompute the last session of every exercise, including archived years"""
+    conn = connect_history()
     cursor = conn.cursor()
 
+    cursor.execute('DELETE FROM main.last_sessions')
+    cursor.execute('''
+        INSERT INTO main.last_sessions (exercise_name, workout_id, weight, reps, sets, date_logged)
+    ''' + _select_last_sessions('history_workouts'))
+
+    conn.commit()
+    cursor.execute('SELECT COUNT(*) FROM main.last_sessions')
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def get_workout_history(days=30):
+    """Get workout history for the last N days for progress tracking"""
     # Calculate date range
-    end_date = datetime.now()
+    end_date = get_today_date()
     start_date = end_date - timedelta(days=days)
     start_date_str = start_date.strftime('%Y-%m-%d')
     end_date_str = end_date.strftime('%Y-%m-%d')
 
-    # Get workouts grouped by date
+    # Archives are only attached when the range reaches past the archive horizon
+    conn = connect_history(start_date_str, read_only=True)
+    cursor = conn.cursor()
+
+    # Get workouts grouped by date, with set-level volume summed per workout in one pass
     cursor.execute('''
-        SELECT date_logged, 
+        SELECT w.date_logged,
                COUNT(*) as workout_count,
-               SUM(weight * reps * sets) as total_volume
-        FROM workouts
-        WHERE date_logged >= ? AND date_logged <= ?
-        GROUP BY date_logged
-        ORDER BY date_logged ASC
-    ''', (start_date_str, end_date_str))
+               SUM(COALESCE(s.volume, w.weight * w.reps * w.sets)) as total_volume,
+               SUM(COALESCE(s.set_count, w.sets)) as set_count
+        FROM history_workouts w
+        LEFT JOIN (
+            SELECT workout_id, SUM(weight * reps) AS volume, COUNT(*) AS set_count
+            FROM history_workout_sets
+            WHERE date_logged >= ? AND date_logged <= ?
+            GROUP BY workout_id
+        ) s ON s.workout_id = w.id
+        WHERE w.date_logged >= ? AND w.date_logged <= ?
+        GROUP BY w.date_logged
+        ORDER BY w.date_logged ASC
+    ''', (start_date_str, end_date_str, start_date_str, end_date_str))
 
     rows = cursor.fetchall()
     conn.close()
@@ -424,29 +1196,38 @@ def get_workout_history(days=30):
         history.append({
             'date': row[0],
             'workout_count': row[1],
-            'total_volume': row[2] if row[2] else 0
+            'total_volume': row[2] if row[2] else 0,
+            'set_count': row[3] or 0
         })
 
     return history
 
 def get_exercise_progress(exercise_name, days=30):
     """Get progress for a specific exercise over the last N days"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-
     # Calculate date range
-    end_date = datetime.now()
+    end_date = get_today_date()
     start_date = end_date - timedelta(days=days)
     start_date_str = start_date.strftime('%Y-%m-%d')
     end_date_str = end_date.strftime('%Y-%m-%d')
 
-    # Get workouts for this exercise
+    # Archives are only attached when the range reaches past the archive horizon
+    conn = connect_history(start_date_str, read_only=True)
+    cursor = conn.cursor()
+
+    # Get workouts for this exercise - weight and reps are the top set. Sets are summed per
+    # workout over the date range, which pushes down into every schema of the history view
     cursor.execute('''
-        SELECT date_logged, weight, reps, sets, (weight * reps * sets) as volume
-        FROM workouts
-        WHERE exercise_name = ? AND date_logged >= ? AND date_logged <= ?
-        ORDER BY date_logged ASC
-    ''', (exercise_name, start_date_str, end_date_str))
+        SELECT w.date_logged, w.weight, w.reps, w.sets, COALESCE(s.volume, w.weight * w.reps * w.sets)
+        FROM history_workouts w
+        LEFT JOIN (
+            SELECT workout_id, SUM(weight * reps) AS volume
+            FROM history_workout_sets
+            WHERE date_logged >= ? AND date_logged <= ?
+            GROUP BY workout_id
+        ) s ON s.workout_id = w.id
+        WHERE w.exercise_name = ? AND w.date_logged >= ? AND w.date_logged <= ?
+        ORDER BY w.date_logged ASC
+    ''', (start_date_str, end_date_str, exercise_name, start_date_str, end_date_str))
 
     rows = cursor.fetchall()
     conn.close()
@@ -465,24 +1246,56 @@ def get_exercise_progress(exercise_name, days=30):
 
 def clear_todays_workouts():
     """Delete all workouts logged today"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    global _todays_workouts
+    conn = connect_writer()
     cursor = conn.cursor()
 
-    today = datetime.now().strftime('%Y-%m-%d')
+    today = get_today()
 
+    _log_change(cursor, 'workout', 'delete', 'date_logged = ?', (today,))
     cursor.execute('DELETE FROM workouts WHERE date_logged = ?', (today,))
+    cursor.execute('DELETE FROM workout_sets WHERE date_logged = ?', (today,))
+    cursor.execute('DELETE FROM workout_sessions WHERE date_logged = ?', (today,))
+
+    # Exercises whose last session was today fall back to their previous session
+    cursor.execute('SELECT exercise_name FROM last_sessions WHERE date_logged >= ?', (today,))
+    exercises = [row[0] for row in cursor.fetchall()]
+    if exercises:
+        placeholders = ','.join('?' * len(exercises))
+        cursor.execute(f'DELETE FROM last_sessions WHERE exercise_name IN ({placeholders})', exercises)
+        cursor.execute('''
+            INSERT INTO last_sessions (exercise_name, workout_id, weight, reps, sets, date_logged)
+        ''' + _select_last_sessions('workouts', f'exercise_name IN ({placeholders})'), exercises)
+        cursor.execute(f'''
+            SELECT EXISTS (
+                SELECT 1 FROM archived_exercises
+                WHERE exercise_name IN ({placeholders})
+                  AND exercise_name NOT IN (SELECT exercise_name FROM last_sessions)
+            )
+        ''', exercises)
+        needs_archive_lookup = cursor.fetchone()[0] == 1
+    else:
+        needs_archive_lookup = False
+    version = _bump_log_version(cursor, 'workouts')
 
     conn.commit()
     conn.close()
 
+    # Only done in archived years before today - rare enough to rebuild from the archives
+    if needs_archive_lookup:
+        rebuild_last_sessions()
+
+    with _cache_lock:
+        _todays_workouts = DayLog(today, version)
+
 def get_all_exercises():
     """Get all unique exercise names"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
+    # last_sessions has one row per exercise ever done, archives included
     cursor.execute('''
-        SELECT DISTINCT exercise_name
-        FROM workouts
+        SELECT exercise_name FROM last_sessions
         ORDER BY exercise_name ASC
     ''')
 
@@ -494,7 +1307,7 @@ def get_all_exercises():
 
 def get_theme():
     """Get user's theme preference"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('SELECT theme FROM user_preferences WHERE id = 1')
@@ -506,74 +1319,142 @@ def get_theme():
 
 def update_theme(theme):
     """Update user's theme preference"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
     cursor.execute('UPDATE user_preferences SET theme = ? WHERE id = 1', (theme,))
+    _log_change(cursor, 'preferences', 'upsert', 'id = 1')
+
+    conn.commit()
+    conn.close()
+
+def get_timezone():
+    """Get user's timezone name (None means server local time)"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT timezone FROM user_preferences WHERE id = 1')
+    result = cursor.fetchone()
+
+    conn.close()
+
+    return result[0] if result and result[0] else None
+
+def update_timezone(timezone):
+    """Update user's timezone (IANA name like 'Asia/Kolkata', or empty for server time)"""
+    if timezone:
+        # Raises ZoneInfoNotFoundError / ValueError for unknown names
+        ZoneInfo(timezone)
+
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE user_preferences SET timezone = ? WHERE id = 1', (timezone or None,))
+    _log_change(cursor, 'preferences', 'upsert', 'id = 1')
 
     conn.commit()
     conn.close()
 
+def _compute_today():
+    """Today's date in the user's timezone"""
+    timezone = get_timezone()
+    if timezone:
+        try:
+            return datetime.now(ZoneInfo(timezone)).date()
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return datetime.now().date()
+
+def begin_request():
+    """Resolve today once for the current request"""
+    _request_day.value = _compute_today()
+
+def end_request():
+    """Forget the date pinned by begin_request"""
+    _request_day.value = None
+    release_connections()
+
+def get_today_date():
+    """Today's date in the user's timezone, pinned for the current request if one is active"""
+    pinned = getattr(_request_day, 'value', None)
+    return pinned if pinned is not None else _compute_today()
+
+def get_today():
+    """Today as a YYYY-MM-DD key, matching date_logged"""
+    return get_today_date().isoformat()
+
+
 def record_daily_stats(protein_met, calorie_met):
     """Record whether goals were met today"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
-    today = datetime.now().strftime('%Y-%m-%d')
+    _record_stats(cursor, get_today(), protein_met, calorie_met)
+
+    conn.commit()
+    conn.close()
+
+
+def _record_stats(cursor, date, protein_met, calorie_met):
+    """Insert or update one day's goal flags"""
     both_met = 1 if (protein_met and calorie_met) else 0
 
-    # Insert or update today's stats
     cursor.execute('''
         INSERT INTO daily_stats (date, protein_goal_met, calorie_goal_met, both_goals_met)
         VALUES (?, ?, ?, ?)
         ON CONFLICT(date) DO UPDATE SET
-            protein_goal_met = ?,
-            calorie_goal_met = ?,
-            both_goals_met = ?
-    ''', (today, protein_met, calorie_met, both_met, protein_met, calorie_met, both_met))
+            protein_goal_met = excluded.protein_goal_met,
+            calorie_goal_met = excluded.calorie_goal_met,
+            both_goals_met = excluded.both_goals_met
+    ''', (date, 1 if protein_met else 0, 1 if calorie_met else 0, both_met))
 
-    conn.commit()
-    conn.close()
 
+def _refresh_day_stats(cursor, date):
+    """Re-evaluate one day's goal flags from its rollup against the current goals"""
+    cursor.execute('SELECT protein_goal, calorie_goal FROM settings WHERE id = 1')
+    goals = cursor.fetchone() or (70, 2300)
 
-def get_current_streak():
-    """Get the current streak of consecutive days meeting goals"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    cursor.execute('SELECT protein, calories FROM daily_nutrition WHERE date = ?', (date,))
+    totals = cursor.fetchone() or (0, 0)
+
+    protein_met = 1 if totals[0] >= goals[0] and totals[0] > 0 else 0
+    calorie_met = 1 if totals[1] >= goals[1] and totals[1] > 0 else 0
 
-    # Get all days where both goals were met, ordered by date descending
     cursor.execute('''
-        SELECT date, both_goals_met
-        FROM daily_stats
-        WHERE both_goals_met = 1
-        ORDER BY date DESC
-    ''')
+        UPDATE daily_nutrition SET protein_goal_met = ?, calorie_goal_met = ? WHERE date = ?
+    ''', (protein_met, calorie_met, date))
+    _record_stats(cursor, date, protein_met, calorie_met)
 
-    rows = cursor.fetchall()
-    conn.close()
 
-    if not rows:
-        return 0
+def get_current_streak():
+    """Get the current streak of consecutive days meeting goals"""
+    conn = connect_reader()
+    cursor = conn.cursor()
 
-    # Check for consecutive days
-    streak = 0
-    today = datetime.now().date()
+    today = get_today()
 
-    for i, (date_str, _) in enumerate(rows):
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-        expected_date = today - timedelta(days=i)
+    # Consecutive met days share the same (day number - row number); the
+    # current streak is the run of met days that contains today.
+    cursor.execute('''
+        WITH runs AS (
+            SELECT date, julianday(date) - ROW_NUMBER() OVER (ORDER BY date) AS run
+            FROM daily_stats
+            WHERE both_goals_met = 1 AND date <= ?
+        )
+        SELECT COUNT(*)
+        FROM runs
+        WHERE run = (SELECT run FROM runs WHERE date = ?)
+    ''', (today, today))
 
-        if date_obj == expected_date:
-            streak += 1
-        else:
-            break
+    result = cursor.fetchone()
+    conn.close()
 
-    return streak
+    return result[0] if result else 0
 
 
 def get_total_days_tracked():
     """Get total number of days with any activity"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('SELECT COUNT(*) FROM daily_stats')
@@ -585,44 +1466,31 @@ def get_total_days_tracked():
 
 def get_best_streak():
     """Get the longest streak ever achieved"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
+    # Same run grouping as get_current_streak, longest run wins
     cursor.execute('''
-        SELECT date, both_goals_met
-        FROM daily_stats
-        ORDER BY date ASC
+        SELECT MAX(streak)
+        FROM (
+            SELECT COUNT(*) AS streak
+            FROM (
+                SELECT julianday(date) - ROW_NUMBER() OVER (ORDER BY date) AS run
+                FROM daily_stats
+                WHERE both_goals_met = 1
+            )
+            GROUP BY run
+        )
     ''')
 
-    rows = cursor.fetchall()
+    result = cursor.fetchone()
     conn.close()
 
-    if not rows:
-        return 0
-
-    max_streak = 0
-    current_streak = 0
-    prev_date = None
-
-    for date_str, both_met in rows:
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-
-        if both_met == 1:
-            if prev_date is None or (date_obj - prev_date).days == 1:
-                current_streak += 1
-                max_streak = max(max_streak, current_streak)
-            else:
-                current_streak = 1
-            prev_date = date_obj
-        else:
-            current_streak = 0
-            prev_date = None
-
-    return max_streak
+    return result[0] if result and result[0] else 0
 
 def add_favorite_food(food_name, quantity, unit, protein, calories):
     """Add a food to favorites or increment its count"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
     # Check if this exact combo already exists
@@ -640,12 +1508,16 @@ def add_favorite_food(food_name, quantity, unit, protein, calories):
             SET times_logged = times_logged + 1
             WHERE id = ?
         ''', (result[0],))
+        favorite_id = result[0]
     else:
         # Add new favorite
         cursor.execute('''
             INSERT INTO favorite_foods (food_name, quantity, unit, protein, calories)
             VALUES (?, ?, ?, ?, ?)
         ''', (food_name, quantity, unit, protein, calories))
+        favorite_id = cursor.lastrowid
+
+    _log_change(cursor, 'favorite', 'upsert', 'id = ?', (favorite_id,))
 
     conn.commit()
     conn.close()
@@ -653,7 +1525,7 @@ def add_favorite_food(food_name, quantity, unit, protein, calories):
 
 def get_favorite_foods(limit=5):
     """Get top favorite foods sorted by times logged"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_reader()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -682,13 +1554,1315 @@ def get_favorite_foods(limit=5):
 
 def remove_favorite_food(food_name, quantity, unit):
     """Remove a food from favorites"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect_writer()
     cursor = conn.cursor()
 
+    _log_change(cursor, 'favorite', 'delete', 'food_name = ? AND quantity = ? AND unit = ?',
+                (food_name, quantity, unit))
     cursor.execute('''
         DELETE FROM favorite_foods
         WHERE food_name = ? AND quantity = ? AND unit = ?
     ''', (food_name, quantity, unit))
 
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+
+def get_catalog_food(name):
+    """Get an imported catalog food in the same shape as app.py's Food_database entries"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT calories, protein, base_unit, grams_per_unit
+        FROM food_catalog
+        WHERE name = ?
+    ''', (name,))
+    row = cursor.fetchone()
+    conn.close()
+
+    if not row:
+        return None
+    food_info = {'calories': row[0], 'protein': row[1], 'base_Unit': row[2]}
+    if row[3]:
+        food_info['grams_per_unit'] = row[3]
+    return food_info
+
+
+def save_catalog_food(name, calories, protein, base_unit='100g', grams_per_unit=None):
+    """Add a catalog food or change its nutrition; recipes using it recompute on next use"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO food_catalog (name, calories, protein, base_unit, grams_per_unit, source)
+        VALUES (?, ?, ?, ?, ?, 'manual')
+        ON CONFLICT (name) DO UPDATE SET
+            calories = excluded.calories,
+            protein = excluded.protein,
+            base_unit = excluded.base_unit,
+            grams_per_unit = excluded.grams_per_unit,
+            source = excluded.source
+    ''', (name, calories, protein, base_unit, grams_per_unit))
+    _invalidate_recipes_with_food(cursor, name)
+
+    conn.commit()
+    conn.close()
+
+
+def delete_catalog_food(name):
+    """Remove a catalog food; returns False if there was none. Recipes using it go stale"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM food_catalog WHERE name = ?', (name,))
+    deleted = cursor.rowcount > 0
+    if deleted:
+        _invalidate_recipes_with_food(cursor, name)
+
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def search_catalog(prefix, limit=20):
+    """Imported foods whose name starts with prefix (case-insensitive), in name order"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    # The NOCASE primary key serves LIKE 'prefix%' as an index range
+    pattern = re.sub(r'([\\%_])', r'\\\1', prefix) + '%'
+    cursor.execute('''
+        SELECT name, protein, calories
+        FROM food_catalog
+        WHERE name LIKE ? ESCAPE '\\'
+        ORDER BY name
+        LIMIT ?
+    ''', (pattern, limit))
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [{'name': row[0], 'protein': row[1], 'calories': row[2]} for row in rows]
+
+
+def save_recipe(name, servings, ingredients, protein_per_serving, calories_per_serving):
+    """Create or replace a recipe with its ingredients and cached per-serving nutrition"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO recipes (name, servings, protein_per_serving, calories_per_serving, nutrition_stale)
+        VALUES (?, ?, ?, ?, 0)
+        ON CONFLICT(name) DO UPDATE SET
+            servings = excluded.servings,
+            protein_per_serving = excluded.protein_per_serving,
+            calories_per_serving = excluded.calories_per_serving,
+            nutrition_stale = 0
+    ''', (name, servings, protein_per_serving, calories_per_serving))
+
+    cursor.execute('SELECT id FROM recipes WHERE name = ?', (name,))
+    recipe_id = cursor.fetchone()[0]
+
+    # Replace the ingredient list
+    cursor.execute('DELETE FROM recipe_ingredients WHERE recipe_id = ?', (recipe_id,))
+    cursor.executemany('''
+        INSERT INTO recipe_ingredients (recipe_id, food_name, quantity, unit)
+        VALUES (?, ?, ?, ?)
+    ''', [(recipe_id, item['food'], item['quantity'], item['unit']) for item in ingredients])
+    _log_change(cursor, 'recipe', 'upsert', 'id = ?', (recipe_id,))
+
+    conn.commit()
+    conn.close()
+
+    return recipe_id
+
+
+def get_recipes():
+    """Get all saved recipes with their cached per-serving nutrition"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, name, servings, protein_per_serving, calories_per_serving, nutrition_stale
+        FROM recipes
+        ORDER BY name ASC
+    ''')
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    recipes = []
+    for row in rows:
+        recipes.append({
+            'id': row[0],
+            'name': row[1],
+            'servings': row[2],
+            'protein_per_serving': row[3],
+            'calories_per_serving': row[4],
+            'stale': row[5] == 1
+        })
+
+    return recipes
+
+
+def get_recipe(recipe_id, include_ingredients=False):
+    """Get a recipe by ID, optionally with its ingredient list"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, name, servings, protein_per_serving, calories_per_serving, nutrition_stale
+        FROM recipes
+        WHERE id = ?
+    ''', (recipe_id,))
+    result = cursor.fetchone()
+
+    if not result:
+        conn.close()
+        return None
+
+    recipe = {
+        'id': result[0],
+        'name': result[1],
+        'servings': result[2],
+        'protein_per_serving': result[3],
+        'calories_per_serving': result[4],
+        'stale': result[5] == 1
+    }
+
+    # Ingredients are only needed to (re)compute nutrition, not to log a serving
+    if include_ingredients or recipe['stale']:
+        cursor.execute('''
+            SELECT food_name, quantity, unit
+            FROM recipe_ingredients
+            WHERE recipe_id = ?
+            ORDER BY id ASC
+        ''', (recipe_id,))
+        recipe['ingredients'] = [{'food': row[0], 'quantity': row[1], 'unit': row[2]}
+                                 for row in cursor.fetchall()]
+
+    conn.close()
+    return recipe
+
+
+def update_recipe_nutrition(recipe_id, protein_per_serving, calories_per_serving):
+    """Store freshly computed per-serving nutrition for a recipe"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        UPDATE recipes
+        SET protein_per_serving = ?, calories_per_serving = ?, nutrition_stale = 0
+        WHERE id = ?
+    ''', (protein_per_serving, calories_per_serving, recipe_id))
+    _log_change(cursor, 'recipe', 'upsert', 'id = ?', (recipe_id,))
+
+    conn.commit()
+    conn.close()
+
+
+def invalidate_recipes_with_food(food_name):
+    """Mark every recipe using a catalog food as needing its nutrition recomputed"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+    _invalidate_recipes_with_food(cursor, food_name)
+    conn.commit()
+    conn.close()
+
+
+def _invalidate_recipes_with_food(cursor, food_name):
+    """invalidate_recipes_with_food inside the caller's transaction"""
+    cursor.execute('''
+        UPDATE recipes
+        SET nutrition_stale = 1
+        WHERE id IN (SELECT recipe_id FROM recipe_ingredients WHERE food_name = ? COLLATE NOCASE)
+    ''', (food_name,))
+    _log_change(cursor, 'recipe', 'upsert',
+                'id IN (SELECT recipe_id FROM recipe_ingredients WHERE food_name = ? COLLATE NOCASE)', (food_name,))
+
+
+def delete_recipe(recipe_id):
+    """Delete a recipe and its ingredients"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    _log_change(cursor, 'recipe', 'delete', 'id = ?', (recipe_id,))
+    cursor.execute('DELETE FROM recipe_ingredients WHERE recipe_id = ?', (recipe_id,))
+    cursor.execute('DELETE FROM recipes WHERE id = ?', (recipe_id,))
+
+    conn.commit()
+    conn.close()
+
+def _week_start(date_str):
+    """Monday of the week containing date_str"""
+    date_obj = date.fromisoformat(date_str)
+    return (date_obj - timedelta(days=date_obj.weekday())).strftime('%Y-%m-%d')
+
+
+def _month_start(date_str):
+    """First day of the month containing date_str"""
+    return date_str[:8] + '01'
+
+
+def _apply_meal_delta(cursor, date_logged, protein, calories, meal_count, record_stats=True):
+    """Fold a change to one day's meals into the daily, weekly and monthly rollups (and daily_stats)"""
+    cursor.execute('''
+        SELECT protein, calories, meal_count, protein_goal_met, calorie_goal_met
+        FROM daily_nutrition
+        WHERE date = ?
+    ''', (date_logged,))
+    old = cursor.fetchone() or (0, 0, 0, 0, 0)
+
+    new_count = old[2] + meal_count
+    if new_count > 0:
+        new_protein = old[0] + protein
+        new_calories = old[1] + calories
+    else:
+        # Day is empty again - reset exactly instead of carrying float drift
+        new_count, new_protein, new_calories = 0, 0, 0
+
+    cursor.execute('SELECT protein_goal, calorie_goal FROM settings WHERE id = 1')
+    goals = cursor.fetchone() or (70, 2300)
+    protein_met = 1 if new_count > 0 and new_protein >= goals[0] else 0
+    calorie_met = 1 if new_count > 0 and new_calories >= goals[1] else 0
+
+    if new_count > 0:
+        cursor.execute('''
+            INSERT INTO daily_nutrition (date, protein, calories, meal_count, protein_goal_met, calorie_goal_met)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                protein = excluded.protein,
+                calories = excluded.calories,
+                meal_count = excluded.meal_count,
+                protein_goal_met = excluded.protein_goal_met,
+                calorie_goal_met = excluded.calorie_goal_met
+        ''', (date_logged, new_protein, new_calories, new_count, protein_met, calorie_met))
+    else:
+        cursor.execute('DELETE FROM daily_nutrition WHERE date = ?', (date_logged,))
+
+    if record_stats:
+        _record_stats(cursor, date_logged, protein_met, calorie_met)
+
+    # Push the day's net change up into its week and month
+    delta = (
+        new_protein - old[0],
+        new_calories - old[1],
+        new_count - old[2],
+        (1 if new_count > 0 else 0) - (1 if old[2] > 0 else 0),
+        protein_met - old[3],
+        calorie_met - old[4],
+    )
+    for table, period_start in (('weekly_nutrition', _week_start(date_logged)),
+                                ('monthly_nutrition', _month_start(date_logged))):
+        cursor.execute(f'''
+            INSERT INTO {table} (period_start, protein, calories, meal_count,
+                                 days_logged, protein_goal_days, calorie_goal_days)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(period_start) DO UPDATE SET
+                protein = protein + excluded.protein,
+                calories = calories + excluded.calories,
+                meal_count = meal_count + excluded.meal_count,
+                days_logged = days_logged + excluded.days_logged,
+                protein_goal_days = protein_goal_days + excluded.protein_goal_days,
+                calorie_goal_days = calorie_goal_days + excluded.calorie_goal_days
+        ''', (period_start,) + delta)
+        cursor.execute(f'DELETE FROM {table} WHERE period_start = ? AND days_logged <= 0', (period_start,))
+
+
+def rebuild_nutrition_rollups():
+    """Recompute all nutrition rollups from the meals table and the archived years"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    # The DELETEs open the write transaction, so no meal can be committed between the read and the rebuild
+    cursor.execute('DELETE FROM daily_nutrition')
+    cursor.execute('DELETE FROM weekly_nutrition')
+    cursor.execute('DELETE FROM monthly_nutrition')
+
+    history = connect_history(read_only=True)
+    history_cursor = history.cursor()
+    history_cursor.execute('''
+        SELECT date_logged, SUM(protein), SUM(calories), COUNT(*)
+        FROM history_meals
+        WHERE date_logged IS NOT NULL
+        GROUP BY date_logged
+    ''')
+    days = history_cursor.fetchall()
+    history.close()
+
+    for date_logged, protein, calories, meal_count in days:
+        # daily_stats keeps the goals that applied at the time, so leave it alone
+        _apply_meal_delta(cursor, date_logged, protein or 0, calories or 0, meal_count, record_stats=False)
+
+    conn.commit()
+    conn.close()
+
+
+def get_nutrition_trends(start_date, end_date, granularity='week'):
+    """Get nutrition totals and averages between two dates, bucketed by day, week or month"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    if granularity == 'day':
+        cursor.execute('''
+            SELECT date, protein, calories, meal_count, 1, protein_goal_met, calorie_goal_met
+            FROM daily_nutrition
+            WHERE date >= ? AND date <= ?
+            ORDER BY date ASC
+        ''', (start_date, end_date))
+    else:
+        if granularity == 'week':
+            table, first_period = 'weekly_nutrition', _week_start(start_date)
+        elif granularity == 'month':
+            table, first_period = 'monthly_nutrition', _month_start(start_date)
+        else:
+            conn.close()
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        cursor.execute(f'''
+            SELECT period_start, protein, calories, meal_count,
+                   days_logged, protein_goal_days, calorie_goal_days
+            FROM {table}
+            WHERE period_start >= ? AND period_start <= ?
+            ORDER BY period_start ASC
+        ''', (first_period, end_date))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    trends = []
+    for row in rows:
+        days_logged = row[4] or 1
+        trends.append({
+            'period_start': row[0],
+            'protein': row[1],
+            'calories': row[2],
+            'meal_count': row[3],
+            'days_logged': row[4],
+            'avg_protein': row[1] / days_logged,
+            'avg_calories': row[2] / days_logged,
+            'protein_goal_days': row[5],
+            'calorie_goal_days': row[6]
+        })
+
+    return trends
+
+
+def get_first_log_date():
+    """Date of the earliest meal or workout, archives included; None for an empty log"""
+    conn = connect_history(read_only=True)
+    cursor = conn.cursor()
+
+    # One indexed MIN per table and schema - MIN over the UNION ALL views would scan them
+    cursor.execute('PRAGMA database_list')
+    schemas = [row[1] for row in cursor.fetchall() if row[1] == 'main' or row[1].startswith('archive_')]
+    dates = []
+    for schema in schemas:
+        for table in ('meals', 'workouts'):
+            cursor.execute(f'SELECT MIN(date_logged) FROM {schema}.{table}')
+            dates.append(cursor.fetchone()[0])
+    conn.close()
+
+    dates = [day for day in dates if day]
+    return min(dates) if dates else None
+
+
+def get_period_report(start_date, end_date):
+    """Summarize nutrition, goal adherence, streaks, training volume and PRs between two dates"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(protein), 0), COALESCE(SUM(calories), 0), COALESCE(SUM(meal_count), 0)
+        FROM daily_nutrition
+        WHERE date >= ? AND date <= ?
+    ''', (start_date, end_date))
+    days_logged, protein, calories, meal_count = cursor.fetchone()
+
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(protein_goal_met), 0), COALESCE(SUM(calorie_goal_met), 0),
+               COALESCE(SUM(both_goals_met), 0)
+        FROM daily_stats
+        WHERE date >= ? AND date <= ?
+    ''', (start_date, end_date))
+    days_tracked, protein_goal_days, calorie_goal_days, both_goals_days = cursor.fetchone()
+
+    # Streak runs as in get_best_streak: the longest inside the period, and the one still going at its end
+    cursor.execute('''
+        WITH runs AS (
+            SELECT date, julianday(date) - ROW_NUMBER() OVER (ORDER BY date) AS run
+            FROM daily_stats
+            WHERE both_goals_met = 1 AND date <= ?
+        )
+        SELECT
+            (SELECT MAX(streak) FROM (
+                SELECT COUNT(*) AS streak FROM runs WHERE date >= ? GROUP BY run
+            )),
+            (SELECT COUNT(*) FROM runs WHERE run = (SELECT run FROM runs WHERE date = ?))
+    ''', (end_date, start_date, end_date))
+    best_streak, streak_at_end = cursor.fetchone()
+    conn.close()
+
+    conn = connect_history(start_date, read_only=True)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT w.exercise_name, COUNT(*), SUM(COALESCE(s.volume, w.weight * w.reps * w.sets)) AS volume,
+               MAX(w.weight), COUNT(DISTINCT w.date_logged)
+        FROM history_workouts w
+        LEFT JOIN (
+            SELECT workout_id, SUM(weight * reps) AS volume
+            FROM history_workout_sets
+            WHERE date_logged >= ? AND date_logged <= ?
+            GROUP BY workout_id
+        ) s ON s.workout_id = w.id
+        WHERE w.date_logged >= ? AND w.date_logged <= ?
+        GROUP BY w.exercise_name
+        ORDER BY volume DESC
+    ''', (start_date, end_date, start_date, end_date))
+    exercise_rows = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT COUNT(DISTINCT date_logged)
+        FROM history_workouts
+        WHERE date_logged >= ? AND date_logged <= ?
+    ''', (start_date, end_date))
+    sessions = cursor.fetchone()[0]
+    conn.close()
+
+    # A PR beats the best weight before the period, so the query needs every archived year
+    previous_best = {}
+    if exercise_rows:
+        conn = connect_history(read_only=True)
+        cursor = conn.cursor()
+        placeholders = ','.join('?' * len(exercise_rows))
+        cursor.execute(f'''
+            SELECT exercise_name, MAX(weight)
+            FROM history_workouts
+            WHERE exercise_name IN ({placeholders}) AND date_logged < ?
+            GROUP BY exercise_name
+        ''', [row[0] for row in exercise_rows] + [start_date])
+        previous_best = dict(cursor.fetchall())
+        conn.close()
+
+    exercises = []
+    for name, entries, volume, top_weight, days in exercise_rows:
+        before = previous_best.get(name)
+        exercises.append({
+            'exercise': name,
+            'entries': entries,
+            'days': days,
+            'volume': volume or 0,
+            'top_weight': top_weight,
+            'previous_best': before,
+            'is_pr': before is not None and top_weight is not None and top_weight > before
+        })
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'nutrition': {
+            'days_logged': days_logged,
+            'protein': protein,
+            'calories': calories,
+            'meal_count': meal_count,
+            'avg_protein': protein / days_logged if days_logged else 0,
+            'avg_calories': calories / days_logged if days_logged else 0
+        },
+        'adherence': {
+            'days_tracked': days_tracked,
+            'protein_goal_days': protein_goal_days,
+            'calorie_goal_days': calorie_goal_days,
+            'both_goals_days': both_goals_days,
+            'best_streak': best_streak or 0,
+            'streak_at_end': streak_at_end or 0
+        },
+        'workouts': {
+            'sessions': sessions,
+            'volume': sum(exercise['volume'] for exercise in exercises),
+            'exercises': exercises,
+            'prs': [exercise['exercise'] for exercise in exercises if exercise['is_pr']]
+        }
+    }
+
+
+def _get_log_version(cursor, name):
+    """Current change counter for a logged table"""
+    cursor.execute('SELECT version FROM log_versions WHERE name = ?', (name,))
+    result = cursor.fetchone()
+    return result[0] if result else 0
+
+
+def _bump_log_version(cursor, name):
+    """Increment a table's change counter inside the caller's transaction and return it"""
+    cursor.execute('''
+        INSERT INTO log_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+    return _get_log_version(cursor, name)
+
+
+def get_log_versions():
+    """Current change counter of every table"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+    cursor.execute('SELECT name, version FROM log_versions')
+    versions = dict(cursor.fetchall())
+    conn.close()
+    return versions
+
+
+def advance_log_versions(previous):
+    """After the database was replaced underneath us, push every counter past both the old
+    and the new value so no worker keeps serving a cache built from the old data"""
+    global _todays_meals, _todays_workouts
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    names = set(previous) | set(get_log_versions())
+    for name in names:
+        cursor.execute('''
+            INSERT INTO log_versions (name, version) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version - 1) + 1
+        ''', (name, previous.get(name, 0) + 1))
+
+    conn.commit()
+    conn.close()
+
+    with _cache_lock:
+        _todays_meals = None
+        _todays_workouts = None
+
+
+def _log_change(cursor, entity, op, where, params=()):
+    """Append upsert (with a JSON snapshot) or delete entries for the matching rows to the
+    change log, inside the caller's transaction - deletes must be logged before the DELETE"""
+    table, snapshot = CHANGE_ENTITIES[entity]
+    data = snapshot if op == 'upsert' else 'NULL'
+    cursor.execute(f'''
+        INSERT INTO change_log (entity, entity_id, op, data)
+        SELECT ?, id, ?, {data} FROM {table} WHERE {where}
+    ''', (entity, op) + tuple(params))
+
+
+def _applied_op(cursor, op_id):
+    """Entity ID created by an already applied client op, or None"""
+    if not op_id:
+        return None
+    cursor.execute('SELECT entity_id FROM applied_ops WHERE op_id = ?', (op_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def _record_op(cursor, op_id, entity, entity_id):
+    """Remember a client op inside the transaction that applied it"""
+    if op_id:
+        cursor.execute('INSERT INTO applied_ops (op_id, entity, entity_id) VALUES (?, ?, ?)',
+                       (op_id, entity, entity_id))
+
+
+def _is_next_version(day_log, date_logged, version):
+    """True if day_log is current for date_logged and version is the very next write"""
+    return day_log is not None and day_log.date == date_logged and day_log.version == version - 1
+
+
+def _remove_cached_meal(meal_id, version):
+    """Drop a deleted meal from the cache, or invalidate it if we missed a write"""
+    global _todays_meals
+    with _cache_lock:
+        if _todays_meals is not None and _todays_meals.version == version - 1:
+            _todays_meals.remove_meal(meal_id)
+            _todays_meals.version = version
+        else:
+            _todays_meals = None
+
+
+def _load_todays_meals():
+    """Return today's cached meals, reloading after midnight or another worker's write"""
+    global _todays_meals
+    today = get_today()
+
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    # Read the version and the rows in one snapshot, so the cache never holds rows newer
+    # than its version (the writer would append them a second time)
+    cursor.execute('BEGIN')
+    version = _get_log_version(cursor, 'meals')
+    with _cache_lock:
+        day_log = _todays_meals
+        if day_log is not None and day_log.date == today and day_log.version == version:
+            conn.commit()
+            conn.close()
+            return day_log
+
+    cursor.execute('''
+        SELECT id, food_name, quantity, protein, calories, meal_time
+        FROM meals
+        WHERE date_logged = ?
+        ORDER BY id ASC
+    ''', (today,))
+    rows = cursor.fetchall()
+    conn.commit()
+    conn.close()
+
+    day_log = DayLog(today, version)
+    for row in rows:
+        day_log.add_meal(MealRecord(*row))
+
+    with _cache_lock:
+        _todays_meals = day_log
+    return day_log
+
+
+def _load_todays_workouts():
+    """Return today's cached workouts, reloading after midnight or another worker's write"""
+    global _todays_workouts
+    today = get_today()
+
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('BEGIN')
+    version = _get_log_version(cursor, 'workouts')
+    with _cache_lock:
+        day_log = _todays_workouts
+        if day_log is not None and day_log.date == today and day_log.version == version:
+            conn.commit()
+            conn.close()
+            return day_log
+
+    cursor.execute(f'''
+        SELECT id, exercise_name, weight, reps, sets, notes,
+               {WORKOUT_VOLUME.format(sets='workout_sets', workouts='workouts')}
+        FROM workouts
+        WHERE date_logged = ?
+        ORDER BY id ASC
+    ''', (today,))
+    rows = cursor.fetchall()
+    conn.commit()
+    conn.close()
+
+    day_log = DayLog(today, version)
+    for row in rows:
+        day_log.add_workout(WorkoutRecord(*row))
+
+    with _cache_lock:
+        _todays_workouts = day_log
+    return day_log
+
+
+def get_todays_totals():
+    """Get running protein/calorie totals for today's meals"""
+    day_log = _load_todays_meals()
+    with _cache_lock:
+        return {'protein': day_log.protein_total, 'calories': day_log.calorie_total}
+
+
+def acquire_scheduler_lock(owner, lease_seconds):
+    """Take or renew the scheduler leader lease; True if owner is now the leader"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    now = time.time()
+    cursor.execute('''
+        UPDATE scheduler_lock
+        SET owner = ?, expires_at = ?
+        WHERE id = 1 AND (owner = ? OR owner IS NULL OR expires_at < ?)
+    ''', (owner, now + lease_seconds, owner, now))
+    is_leader = cursor.rowcount == 1
+
+    conn.commit()
+    conn.close()
+    return is_leader
+
+
+def release_scheduler_lock(owner):
+    """Give up the leader lease so another worker can take over immediately"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        UPDATE scheduler_lock SET owner = NULL, expires_at = 0 WHERE id = 1 AND owner = ?
+    ''', (owner,))
+
+    conn.commit()
+    conn.close()
+
+
+def get_job_last_run(name):
+    """When (or up to which day) a scheduler job last ran"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT last_run FROM scheduler_jobs WHERE name = ?', (name,))
+    result = cursor.fetchone()
+
+    conn.close()
+    return result[0] if result else None
+
+
+def set_job_last_run(name, last_run):
+    """Record a scheduler job's progress"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO scheduler_jobs (name, last_run) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_run = excluded.last_run
+    ''', (name, last_run))
+
+    conn.commit()
+    conn.close()
+
+
+def finalize_day(date):
+    """Settle a finished day's goal flags from its nutrition rollup"""
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    # Only days that saw activity get a daily_stats row, as before
+    cursor.execute('''
+        SELECT EXISTS (SELECT 1 FROM daily_nutrition WHERE date = ?)
+            OR EXISTS (SELECT 1 FROM daily_stats WHERE date = ?)
+    ''', (date, date))
+    if cursor.fetchone()[0]:
+        _refresh_day_stats(cursor, date)
+
+    conn.commit()
+    conn.close()
+
+
+def run_maintenance():
+    """Refresh planner statistics, reclaim free pages and truncate the WAL"""
+    conn = sqlite3.connect(DATABASE_NAME, isolation_level=None)
+    cursor = conn.cursor()
+
+    cursor.execute('ANALYZE')
+    cursor.execute('PRAGMA optimize')
+
+    # Databases created before auto_vacuum was enabled need one full VACUUM to switch
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.execute('VACUUM')
+    else:
+        cursor.execute('PRAGMA incremental_vacuum')
+        cursor.fetchall()
+
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    result = cursor.fetchone()
+
+    conn.close()
+    return result
+
+
+def checkpoint_wal():
+    """Copy committed WAL pages into the database without blocking readers or writers"""
+    conn = sqlite3.connect(DATABASE_NAME, isolation_level=None)
+    cursor = conn.cursor()
+
+    cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+    result = cursor.fetchone()
+
+    conn.close()
+    return result
+
+
+def _archive_path(year):
+    """Archive database file for one year"""
+    base_dir = os.path.dirname(os.path.abspath(DATABASE_NAME))
+    return os.path.join(base_dir, ARCHIVE_DIR, f'tracker-{year}.db')
+
+
+def _archive_years(start_date=None):
+    """Years that have an archive file, optionally only those on or after start_date"""
+    archive_dir = os.path.dirname(_archive_path(0))
+    if not os.path.isdir(archive_dir):
+        return []
+
+    years = []
+    for filename in os.listdir(archive_dir):
+        if filename.startswith('tracker-') and filename.endswith('.db'):
+            year = filename[len('tracker-'):-len('.db')]
+            if year.isdigit() and (start_date is None or year >= start_date[:4]):
+                years.append(year)
+    return sorted(years)
+
+
+def connect_history(start_date=None, read_only=False):
+    """Open a connection with history_meals / history_workouts views over hot and archived rows
+
+    Only archive years on or after start_date are attached (read-only), so queries
+    over recent dates never touch the archive files. read_only opens the main
+    database read-only too, tuned like the per-thread readers, for callers that never write.
+    """
+    conn = sqlite3.connect(_uri(DATABASE_NAME, 'ro' if read_only else None), uri=True)
+    cursor = conn.cursor()
+    if read_only:
+        _tune_reader(conn)
+
+    years = _archive_years(start_date)
+    # SQLite caps attached databases (10 by default) - keep the most recent years
+    max_attached = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    if len(years) > max_attached:
+        print(f"WARNING: {len(years)} archive years, only attaching the latest {max_attached}")
+        years = years[-max_attached:]
+
+    archived_tables = {}
+    for year in years:
+        cursor.execute(f'ATTACH DATABASE ? AS archive_{year}', (_uri(_archive_path(year), 'ro'),))
+        # Archives written before a table existed do not have it
+        cursor.execute(f"SELECT name FROM archive_{year}.sqlite_master WHERE type = 'table'")
+        archived_tables[year] = {row[0] for row in cursor.fetchall()}
+        if read_only:
+            _tune_reader(conn, f'archive_{year}')
+
+    for table, columns in ARCHIVED_COLUMNS.items():
+        column_list = ', '.join(columns)
+        parts = [f'SELECT {column_list} FROM main.{table}']
+        parts += [f'SELECT {column_list} FROM archive_{year}.{table}' for year in years
+                  if table in archived_tables[year]]
+        cursor.execute(f'CREATE TEMP VIEW history_{table} AS ' + ' UNION ALL '.join(parts))
+
+    return conn
+
+
+def archive_old_rows(horizon_days=None):
+    """Move meals and workouts older than the horizon into per-year archive databases"""
+    if horizon_days is None:
+        horizon_days = ARCHIVE_HORIZON_DAYS
+    cutoff = (get_today_date() - timedelta(days=horizon_days)).isoformat()
+
+    os.makedirs(os.path.dirname(_archive_path(0)), exist_ok=True)
+
+    conn = sqlite3.connect(_uri(DATABASE_NAME), uri=True)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT substr(date_logged, 1, 4) FROM meals WHERE date_logged < ?
+        UNION
+        SELECT substr(date_logged, 1, 4) FROM workouts WHERE date_logged < ?
+    ''', (cutoff, cutoff))
+    years = [row[0] for row in cursor.fetchall() if row[0] and row[0].isdigit()]
+
+    moved = 0
+    for year in years:
+        cursor.execute('ATTACH DATABASE ? AS archive', (_uri(_archive_path(year), 'rwc'),))
+
+        # Same table definitions as the hot database, plus the indexes history queries use
+        for table in ARCHIVED_COLUMNS:
+            cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            create_sql = cursor.fetchone()[0]
+            cursor.execute(create_sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE IF NOT EXISTS archive.{table}', 1))
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_meals_date ON meals (date_logged, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_meals_time_date ON meals (meal_time, date_logged, id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS archive.idx_workouts_exercise_date
+            ON workouts (exercise_name, date_logged, id)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_workouts_date ON workouts (date_logged, id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS archive.idx_workout_sets_workout
+            ON workout_sets (workout_id, set_number)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_workout_sets_session ON workout_sets (session_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_workout_sets_date ON workout_sets (date_logged, id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS archive.idx_workout_sessions_date
+            ON workout_sessions (date_logged, id)
+        ''')
+
+        year_start = f'{year}-01-01'
+        year_end = min(cutoff, f'{int(year) + 1}-01-01')
+
+        cursor.execute('''
+            INSERT OR IGNORE INTO archived_exercises (exercise_name)
+            SELECT DISTINCT exercise_name FROM workouts
+            WHERE date_logged >= ? AND date_logged < ?
+        ''', (year_start, year_end))
+
+        # Copy then delete in one transaction; OR REPLACE makes a retried run idempotent
+        for table, columns in ARCHIVED_COLUMNS.items():
+            column_list = ', '.join(columns)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({column_list})
+                SELECT {column_list} FROM main.{table}
+                WHERE date_logged >= ? AND date_logged < ?
+            ''', (year_start, year_end))
+            cursor.execute(f'DELETE FROM main.{table} WHERE date_logged >= ? AND date_logged < ?',
+                           (year_start, year_end))
+            moved += cursor.rowcount
+
+            # The delete trigger dropped these rows from the search index - index the archived copies
+            if table in SEARCH_SOURCES:
+                _index_search_rows(cursor, 'archive.', table, 'date_logged >= ? AND date_logged < ?',
+                                   (year_start, year_end))
+
+        _bump_log_version(cursor, 'archive')
+        conn.commit()
+        cursor.execute('DETACH DATABASE archive')
+
+    conn.close()
+    return moved
+
+
+def get_changes_since(since=0, limit=500):
+    """Changes after cursor `since`, collapsed to the latest entry per row
+
+    reset is True when entries the client has not seen were already pruned, so it
+    has to reload everything instead of applying deltas, then carry on from cursor.
+    """
+    conn = connect_reader()
+    cursor = conn.cursor()
+
+    # Separate subqueries, so each is a single b-tree lookup rather than a scan
+    cursor.execute('SELECT (SELECT MIN(seq) FROM change_log), (SELECT MAX(seq) FROM change_log)')
+    oldest, newest = cursor.fetchone()
+
+    # Resume from the newest entry once the client has reloaded
+    if oldest is not None and since + 1 < oldest:
+        conn.close()
+        return {'cursor': newest, 'has_more': False, 'reset': True, 'changes': []}
+
+    cursor.execute('''
+        SELECT seq, entity, entity_id, op, data
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq ASC
+        LIMIT ?
+    ''', (since, limit + 1))
+    rows = cursor.fetchall()
+    conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Later entries for the same row replace earlier ones
+    latest = {}
+    for seq, entity, entity_id, op, data in rows:
+        latest.pop((entity, entity_id), None)
+        latest[(entity, entity_id)] = {
+            'entity': entity,
+            'id': entity_id,
+            'op': op,
+            'data': json.loads(data) if data else None
+        }
+
+    return {
+        'cursor': rows[-1][0] if rows else since,
+        'has_more': has_more,
+        'reset': False,
+        'changes': list(latest.values())
+    }
+
+
+def get_change_cursor():
+    """Sequence number of the newest change log entry (0 before any change)"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log')
+    result = cursor.fetchone()[0]
+    conn.close()
+    return result
+
+
+def get_changed_entities(since):
+    """Entity types with change log entries after cursor `since`"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT entity FROM change_log WHERE seq > ?', (since,))
+    entities = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return entities
+
+
+def prune_change_log(days=None):
+    """Drop change log entries and applied client ops older than the retention window"""
+    if days is None:
+        days = CHANGE_LOG_RETENTION_DAYS
+    conn = connect_writer()
+    cursor = conn.cursor()
+
+    # Always keep the newest entry so MIN(seq) still tells clients what was pruned
+    cursor.execute('''
+        DELETE FROM change_log
+        WHERE changed_at < datetime('now', ?)
+          AND seq < (SELECT MAX(seq) FROM change_log)
+    ''', (f'-{days} days',))
+    pruned = cursor.rowcount
+    cursor.execute("DELETE FROM applied_ops WHERE applied_at < datetime('now', ?)", (f'-{days} days',))
+
+    conn.commit()
+    conn.close()
+    return pruned
+
+
+def _history_sources():
+    """Connection for browsing history, the tables to page through newest first (the hot
+    table, then each archive year from the newest) and the prefix for whole-history queries"""
+    years = _archive_years()
+    if not years:
+        return connect_reader(), [('', None)], ''
+    sources = [('main.', None)] + [(f'archive_{year}.', year) for year in reversed(years)]
+    return connect_history(read_only=True), sources, 'history_'
+
+
+def _keyset_page(cursor, query, sources, filters, params, before, limit):
+    """One newest-first page of a (date_logged, id) keyset query; returns (rows, next cursor)
+
+    query selects id first and date_logged last, with {table} and {where} placeholders.
+    """
+    conditions = ['date_logged IS NOT NULL'] + filters
+    params = list(params)
+    if before:
+        # Seek straight past the last row of the previous page - no OFFSET scan
+        conditions.append('(date_logged, id) < (?, ?)')
+        params += [before[0], before[1]]
+
+    rows = []
+    for prefix, year in sources:
+        # Archive years hold strictly older days, so stop once the page is full before them
+        if year and len(rows) > limit and rows[limit][-1] > f'{year}-12-31':
+            break
+        cursor.execute(query.format(table=prefix, where=' AND '.join(conditions)), params + [limit + 1])
+        rows.extend(cursor.fetchall())
+        rows.sort(key=lambda row: (row[-1], row[0]), reverse=True)
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][-1], rows[-1][0])
+    return rows, None
+
+
+def get_meal_history(before=None, limit=50, meal_time=None):
+    """One page of past meals grouped by day, newest first
+
+    before is the (date_logged, id) cursor returned as 'next' by the previous page.
+    Day totals come from the nutrition rollup, so they cover the whole day even when
+    its meals are split across pages or filtered by meal_time.
+    """
+    conn, sources, _ = _history_sources()
+    cursor = conn.cursor()
+
+    filters, params = [], []
+    if meal_time:
+        filters.append('meal_time = ?')
+        params.append(meal_time)
+
+    rows, next_cursor = _keyset_page(cursor, '''
+        SELECT id, food_name, quantity, protein, calories, meal_time, date_logged
+        FROM {table}meals
+        WHERE {where}
+        ORDER BY date_logged DESC, id DESC
+        LIMIT ?
+    ''', sources, filters, params, before, limit)
+
+    dates = sorted({row[6] for row in rows}, reverse=True)
+    totals = {}
+    if dates:
+        cursor.execute(f'''
+            SELECT date, protein, calories, meal_count
+            FROM daily_nutrition
+            WHERE date IN ({', '.join('?' * len(dates))})
+        ''', dates)
+        totals = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.close()
+
+    days = []
+    for day in dates:
+        protein, calories, meal_count = totals.get(day, (0, 0, 0))
+        days.append({
+            'date': day,
+            'protein': protein,
+            'calories': calories,
+            'meal_count': meal_count,
+            'meals': [{
+                'id': row[0],
+                'food': row[1],
+                'quantity': row[2],
+                'protein': row[3],
+                'calories': row[4],
+                'meal_time': row[5]
+            } for row in rows if row[6] == day]
+        })
+
+    return {'days': days, 'next': next_cursor}
+
+
+def get_workout_log(before=None, limit=50, exercise_name=None):
+    """One page of past workouts grouped by day, newest first (cursor as for get_meal_history)"""
+    conn, sources, prefix = _history_sources()
+    cursor = conn.cursor()
+
+    filters, params = [], []
+    if exercise_name:
+        filters.append('exercise_name = ?')
+        params.append(exercise_name)
+
+    rows, next_cursor = _keyset_page(cursor, '''
+        SELECT id, exercise_name, weight, reps, sets, notes, date_logged
+        FROM {table}workouts
+        WHERE {where}
+        ORDER BY date_logged DESC, id DESC
+        LIMIT ?
+    ''', sources, filters, params, before, limit)
+
+    # Whole-day totals (for the same filter), even when a day continues on the next page
+    dates = sorted({row[6] for row in rows}, reverse=True)
+    totals = {}
+    if dates:
+        placeholders = ', '.join('?' * len(dates))
+        # Volume from the logged sets, as in get_workout_history
+        cursor.execute(f'''
+            SELECT w.date_logged, COUNT(*), SUM(COALESCE(s.volume, w.weight * w.reps * w.sets))
+            FROM {prefix}workouts w
+            LEFT JOIN (
+                SELECT workout_id, SUM(weight * reps) AS volume
+                FROM {prefix}workout_sets
+                WHERE date_logged IN ({placeholders})
+                GROUP BY workout_id
+            ) s ON s.workout_id = w.id
+            WHERE w.date_logged IN ({placeholders})
+            {'AND w.exercise_name = ?' if exercise_name else ''}
+            GROUP BY w.date_logged
+        ''', dates + dates + params)
+        totals = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.close()
+
+    days = []
+    for day in dates:
+        workout_count, volume = totals.get(day, (0, 0))
+        days.append({
+            'date': day,
+            'workout_count': workout_count,
+            'total_volume': volume or 0,
+            'workouts': [{
+                'id': row[0],
+                'exercise': row[1],
+                'weight': row[2],
+                'reps': row[3],
+                'sets': row[4],
+                'notes': row[5]
+            } for row in rows if row[6] == day]
+        })
+
+    return {'days': days, 'next': next_cursor}
+
+
+def _index_search_rows(cursor, schema, table, where='1', params=()):
+    """Add rows of a meals/workouts table (in any attached schema) to the search index"""
+    kind, offset, title, notes = SEARCH_SOURCES[table]
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO main.search_index (rowid, kind, date_logged, title, notes)
+        SELECT id * 2 + {offset}, '{kind}', date_logged, {title}, {notes}
+        FROM {schema}{table}
+        WHERE {where}
+    ''', params)
+
+
+def _search_covers_archives():
+    """Whether the search index already has rows older than the oldest hot row"""
+    conn = connect_reader()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT (SELECT MIN(date_logged) FROM search_index) <
+               (SELECT MIN(date_logged) FROM (SELECT date_logged FROM meals UNION ALL SELECT date_logged FROM workouts))
+    ''')
+    result = cursor.fetchone()[0]
+    conn.close()
+    return bool(result)
+
+
+def rebuild_search_index():
+    """Re-index every meal and workout, including archived years"""
+    conn = connect_history()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM main.search_index')
+    cursor.execute('PRAGMA database_list')
+    schemas = [row[1] for row in cursor.fetchall() if row[1] == 'main' or row[1].startswith('archive_')]
+    for schema in schemas:
+        for table in SEARCH_SOURCES:
+            _index_search_rows(cursor, f'{schema}.', table)
+
+    # Merge the index b-trees so queries touch as few segments as possible
+    cursor.execute("INSERT INTO main.search_index (search_index) VALUES ('optimize')")
+
+    conn.commit()
+    cursor.execute('SELECT COUNT(*) FROM main.search_index')
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+
+def _fts_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+
+def search_logs(text, kind=None, start_date=None, end_date=None, limit=50, order='relevance'):
+    """Full-text search over meals and workouts, best match (or newest, order='recent') first
+
+    Snippets wrap matched words in char(2) ... char(3) so the caller can escape, then highlight.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+
+    conditions = ['search_index MATCH ?']
+    params = [query]
+    if kind:
+        conditions.append('kind = ?')
+        params.append(kind)
+    if start_date:
+        conditions.append('date_logged >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append('date_logged <= ?')
+        params.append(end_date)
+    order_by = 'date_logged DESC, rowid DESC' if order == 'recent' else 'rank'
+
+    conn = connect_reader()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT kind, rowid >> 1, date_logged, title, notes,
+               snippet(search_index, -1, char(2), char(3), '…', 12)
+        FROM search_index
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by}
+        LIMIT ?
+    ''', params + [limit])
+    rows = cursor.fetchall()
+    conn.close()
+
+    results = []
+    for row in rows:
+        results.append({
+            'kind': row[0],
+            'id': row[1],
+            'date': row[2],
+            'title': row[3],
+            'notes': row[4],
+            'snippet': row[5]
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    commands = {
+        'rebuild-search': rebuild_search_index,
+        'rebuild-rollups': rebuild_nutrition_rollups,
+        'rebuild-last-sessions': rebuild_last_sessions,
+        'archive': archive_old_rows,
+    }
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"usage: python database.py {{{'|'.join(commands)}}}")
+        sys.exit(1)
+    init_db()
+    print(commands[sys.argv[1]]())
@@ -0,0 +1,294 @@
+"""Bulk-load a nutrition dump into the food catalog.
+
+    python food_import.py <file> [--workers N]   # import, resuming from the last checkpoint
+    python food_import.py <file> --restart       # forget the checkpoint and start over
+
+Reads Open Food Facts style exports: tab-separated CSV (the official dump),
+comma-separated CSV with one record per line, or JSON Lines, optionally
+gzipped. Each record is normalized to per-100g calories and protein, the
+shape calculate_nutrition() in app.py expects, with the serving size as
+grams_per_unit so "piece" quantities work. Names are deduplicated
+case-insensitively; the first record seen for a name wins.
+
+The file is streamed in chunks. Worker processes parse and normalize chunks
+in parallel while this process writes them in file order, one transaction
+per chunk, together with a checkpoint of how far the file has been loaded.
+Memory stays bounded by the chunks in flight, and an interrupted import picks
+up after the last committed chunk.
+"""
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+
+import database
+
+# Bytes of a plain file (or lines of a gzipped one) parsed per chunk
+CHUNK_BYTES = 8 * 1024 * 1024
+CHUNK_LINES = 20000
+
+# Chunks parsed ahead of the writer, per worker
+CHUNKS_AHEAD = 2
+
+# Upper bounds for plausible per-100g values and serving sizes
+MAX_CALORIES = 900
+MAX_PROTEIN = 100
+MAX_SERVING_GRAMS = 2000
+MAX_NAME_LENGTH = 200
+
+KJ_PER_KCAL = 4.184
+
+# Lines longer than the csv module's default field limit turn up in real dumps
+csv.field_size_limit(2 ** 31 - 1)
+
+
+def _number(value):
+    """Float from a CSV cell or JSON value, None if missing or not a number"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number else None
+
+
+def normalize(record):
+    """(name, code, calories, protein, grams_per_unit) for a raw record, or None to skip it"""
+    name = ' '.join(str(record.get('product_name') or '').split())
+    if not name:
+        return None
+
+    brand = str(record.get('brands') or '').split(',')[0].strip()
+    if brand and brand.lower() not in name.lower():
+        name = f"{name} ({brand})"
+    if len(name) > MAX_NAME_LENGTH:
+        return None
+
+    # JSONL exports nest nutrients; the CSV flattens them into columns
+    nutriments = record.get('nutriments') or record
+
+    calories = _number(nutriments.get('energy-kcal_100g'))
+    if calories is None:
+        kilojoules = _number(nutriments.get('energy-kj_100g', nutriments.get('energy_100g')))
+        calories = kilojoules / KJ_PER_KCAL if kilojoules is not None else None
+    protein = _number(nutriments.get('proteins_100g'))
+
+    if calories is None or protein is None:
+        return None
+    if not 0 <= calories <= MAX_CALORIES or not 0 <= protein <= MAX_PROTEIN:
+        return None
+
+    serving = _number(record.get('serving_quantity'))
+    grams_per_unit = round(serving, 1) if serving and 0 < serving <= MAX_SERVING_GRAMS else None
+
+    code = str(record.get('code') or '') or None
+    return name, code, round(calories, 1), round(protein, 2), grams_per_unit
+
+
+def _record_parser(path, header):
+    """Function turning one line of the file into a record dict"""
+    if header is None:
+        return json.loads
+
+    # The official dump is tab-separated and unquoted
+    delimiter = '\t' if '\t' in header else ','
+    quoting = csv.QUOTE_NONE if delimiter == '\t' else csv.QUOTE_MINIMAL
+    columns = next(csv.reader([header], delimiter=delimiter, quoting=quoting))
+
+    # Without quoting, a plain split is the same parse at a fraction of the cost
+    if quoting == csv.QUOTE_NONE:
+        def parse(line):
+            return dict(zip(columns, line.split(delimiter)))
+    else:
+        def parse(line):
+            return dict(zip(columns, next(csv.reader([line], delimiter=delimiter, quoting=quoting))))
+    return parse
+
+
+def _normalize_lines(lines, parse):
+    """Normalized rows for raw lines, and how many lines were skipped"""
+    rows = []
+    skipped = 0
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        try:
+            row = normalize(parse(line))
+        except (ValueError, StopIteration, AttributeError, csv.Error):
+            row = None
+        if row:
+            rows.append(row)
+        else:
+            skipped += 1
+    return rows, skipped
+
+
+def _parse_range(path, header, start, end):
+    """Worker: normalize the lines starting inside [start, end) of a plain file"""
+    parse = _record_parser(path, header)
+    lines = []
+    with open(path, 'rb') as f:
+        # Back up one byte so a line starting exactly at `start` is kept
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8', errors='replace'))
+    return _normalize_lines(lines, parse)
+
+
+def _parse_lines(path, header, lines):
+    """Worker: normalize a block of lines read from a compressed file"""
+    return _normalize_lines(lines, _record_parser(path, header))
+
+
+def _is_jsonl(path):
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    return name.endswith(('.jsonl', '.ndjson', '.json'))
+
+
+def _read_header(path):
+    """CSV header line (None for JSON Lines) and the byte offset of the first record"""
+    if _is_jsonl(path):
+        return None, 0
+    with open(path, 'rb') as f:
+        raw = gzip.GzipFile(fileobj=f) if path.endswith('.gz') else f
+        line = raw.readline()
+        return line.decode('utf-8', errors='replace').rstrip('\r\n'), len(line)
+
+
+def _range_tasks(path, header, position):
+    """(position after the chunk, worker function, args) for a plain file from a byte offset"""
+    size = os.path.getsize(path)
+    while position < size:
+        end = min(position + CHUNK_BYTES, size)
+        yield end, _parse_range, (path, header, position, end)
+        position = end
+
+
+def _line_tasks(path, header, position):
+    """Same for a gzipped file, where the position is a count of records read"""
+    with gzip.open(path, 'rt', encoding='utf-8', errors='replace', newline='\n') as f:
+        if header is not None:
+            f.readline()
+        for _ in range(position):
+            if not f.readline():
+                return
+        while True:
+            lines = [line for line in (f.readline() for _ in range(CHUNK_LINES)) if line]
+            if not lines:
+                return
+            position += len(lines)
+            yield position, _parse_lines, (path, header, lines)
+
+
+def _results(tasks, workers):
+    """Run tasks on a process pool, yielding (position, result) in file order"""
+    if workers <= 1:
+        for position, function, args in tasks:
+            yield position, function(*args)
+        return
+
+    with Pool(workers) as pool:
+        pending = deque()
+        for position, function, args in tasks:
+            pending.append((position, pool.apply_async(function, args)))
+            # Parse ahead of the writer, but only a few chunks, so memory stays flat
+            if len(pending) >= workers * CHUNKS_AHEAD:
+                position, result = pending.popleft()
+                yield position, result.get()
+        while pending:
+            position, result = pending.popleft()
+            yield position, result.get()
+
+
+def import_foods(path, workers=None, restart=False, progress=None):
+    """Stream a nutrition dump into food_catalog; returns {imported, skipped, duplicates}"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    source = os.path.realpath(path)
+    file_size = os.path.getsize(path)
+    header, first_record = _read_header(path)
+    compressed = path.endswith('.gz')
+
+    database.init_db()
+    conn = sqlite3.connect(database.DATABASE_NAME, timeout=database.WRITE_BUSY_TIMEOUT)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    cursor = conn.cursor()
+
+    # Resume only if the file is the one the checkpoint was taken from
+    cursor.execute('SELECT file_size, position, imported, skipped FROM import_checkpoints WHERE source = ?',
+                   (source,))
+    checkpoint = cursor.fetchone()
+    if checkpoint and checkpoint[0] == file_size and not restart:
+        position, imported, skipped = checkpoint[1:]
+    else:
+        position, imported, skipped = (0 if compressed else first_record), 0, 0
+
+    tasks = (_line_tasks if compressed else _range_tasks)(path, header, position)
+    duplicates = 0
+    try:
+        for position, (rows, chunk_skipped) in _results(tasks, workers):
+            before = conn.total_changes
+            cursor.executemany('''
+                INSERT INTO food_catalog (name, code, calories, protein, base_unit, grams_per_unit, source)
+                VALUES (?, ?, ?, ?, '100g', ?, ?)
+                ON CONFLICT (name) DO NOTHING
+            ''', [row + (os.path.basename(path),) for row in rows])
+            added = conn.total_changes - before
+
+            imported += added
+            duplicates += len(rows) - added
+            skipped += chunk_skipped
+
+            # Rows and checkpoint commit together, so a resumed run never loads a chunk twice
+            cursor.execute('''
+                INSERT OR REPLACE INTO import_checkpoints
+                    (source, file_size, position, imported, skipped, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (source, file_size, position, imported, skipped, datetime.now().isoformat()))
+            conn.commit()
+
+            if progress:
+                progress(position, imported, skipped)
+    finally:
+        conn.close()
+
+    return {'imported': imported, 'skipped': skipped, 'duplicates': duplicates}
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    restart_import = '--restart' in arguments
+    worker_count = None
+    if '--workers' in arguments:
+        index = arguments.index('--workers')
+        worker_count = int(arguments[index + 1])
+        del arguments[index:index + 2]
+    arguments = [argument for argument in arguments if argument != '--restart']
+
+    if len(arguments) != 1 or not os.path.isfile(arguments[0]):
+        print(__doc__)
+        sys.exit(1)
+
+    started = time.time()
+    dump_path = arguments[0]
+    total = os.path.getsize(dump_path)
+
+    def report(position, imported, skipped):
+        where = f"{position * 100 // total}%" if not dump_path.endswith('.gz') else f"{position} records"
+        print(f"\r{where} - {imported} imported, {skipped} skipped", end='', flush=True)
+
+    counts = import_foods(dump_path, worker_count, restart_import, report)
+    print(f"\nDone in {time.time() - started:.1f}s: {counts['imported']} imported, "
+          f"{counts['skipped']} skipped, {counts['duplicates']} duplicates")
@@ -0,0 +1,131 @@
+"""Live dashboard and gym updates over Server-Sent Events.
+
+One hub thread per worker polls the change log (which every worker writes to),
+builds each update once and wakes every connected stream. Streams only wait on
+a shared condition between updates, so an idle connection costs no queries and
+the home() query set runs once per change instead of once per open tab. Under
+a gevent worker (gunicorn -k gevent) those waits are greenlets, which is what
+keeps thousands of idle connections cheap.
+"""
+import json
+import threading
+from collections import deque
+
+import database
+
+POLL_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+# Generations whose changed entity types are remembered for streams that fall behind
+BACKLOG_GENERATIONS = 32
+
+
+def format_event(name, data, event_id=None):
+    """Encode one SSE message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class Hub:
+    """Fan-out of change log updates to every open event stream in this worker"""
+
+    def __init__(self, build_events, poll_seconds=POLL_SECONDS, keepalive_seconds=KEEPALIVE_SECONDS):
+        # build_events(entities) -> {event name: data} for the changed entity types
+        self.build_events = build_events
+        self.poll_seconds = poll_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self._condition = threading.Condition()
+        self._cursor = None
+        self._message = ''
+        self._generation = 0
+        # (generation, changed entity types) of the latest updates, oldest first
+        self._backlog = deque(maxlen=BACKLOG_GENERATIONS)
+        self._subscribers = 0
+        self._thread = None
+
+    def _encode(self, events, cursor):
+        return ''.join(format_event(name, data, cursor) for name, data in events.items())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Nobody listening - sleep until someone subscribes
+                while self._subscribers == 0:
+                    self._condition.wait()
+
+            try:
+                cursor = database.get_change_cursor()
+                if self._cursor is None:
+                    self._cursor = cursor
+                elif cursor != self._cursor:
+                    entities = database.get_changed_entities(self._cursor)
+                    message = self._encode(self.build_events(entities), cursor)
+                    with self._condition:
+                        self._cursor = cursor
+                        if message:
+                            self._message = message
+                            self._generation += 1
+                            self._backlog.append((self._generation, set(entities)))
+                            self._condition.notify_all()
+            except Exception as e:
+                print(f"Live update error: {e}")
+                database.release_connections()
+
+            with self._condition:
+                self._condition.wait(self.poll_seconds)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='tracker-live-hub', daemon=True)
+            self._thread.start()
+
+    def _missed(self, seen, entities):
+        """Entity types changed in every generation after `seen` - all of `entities` if the
+        backlog no longer reaches back that far. Call with the condition held."""
+        missed = [changed for generation, changed in self._backlog if generation > seen]
+        if len(missed) < self._generation - seen:
+            return set(entities or ())
+        return set().union(*missed)
+
+    def stream(self, since=None, entities=None):
+        """Generator of SSE text for one client
+
+        A client that reconnects (or loaded its page) at an older cursor first gets a
+        snapshot of `entities`, then the shared updates. A stream that falls more than
+        one update behind gets the merged events of everything it missed instead.
+        """
+        with self._condition:
+            self._subscribers += 1
+            self._ensure_started()
+            self._condition.notify_all()
+            seen = self._generation
+
+        try:
+            yield f'retry: {RETRY_MILLISECONDS}\n\n'
+
+            cursor = database.get_change_cursor()
+            if since is not None and since < cursor and entities:
+                yield self._encode(self.build_events(set(entities)), cursor)
+
+            while True:
+                missed = None
+                with self._condition:
+                    self._condition.wait_for(lambda: self._generation != seen, self.keepalive_seconds)
+                    if self._generation == seen:
+                        message = ': keepalive\n\n'
+                    elif self._generation - seen == 1:
+                        message, seen = self._message, self._generation
+                    else:
+                        missed, cursor, seen = self._missed(seen, entities), self._cursor, self._generation
+                if missed is not None:
+                    # Built outside the lock - it runs queries
+                    message = self._encode(self.build_events(missed), cursor) if missed else ''
+                if message:
+                    yield message
+        finally:
+            with self._condition:
+                self._subscribers -= 1
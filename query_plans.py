@@ -0,0 +1,364 @@
+"""Query plan guard for database.py.
+
+    python query_plans.py check     # exit 1 on a full scan or temp sort that is not allow-listed
+    python query_plans.py show      # print every statement's plan and each function's timing
+
+Builds a populated scratch database (two years of meals and workouts, some
+logged set by set, one year archived, plus favorites, recipes, catalog
+foods and change log), runs ANALYZE like the maintenance job does, then
+calls every public function in database.py. Each statement they execute is planned with
+EXPLAIN QUERY PLAN on the connection that runs it, with the same
+parameters, so attached archives and temp views plan as they do live.
+
+A table SCAN or a TEMP B-TREE in a plan fails the check unless ALLOWED
+lists it for that function with the reason it is acceptable. Public
+functions missing from CALLS fail too, so new queries get planned.
+tests/test_query_plans.py runs the check with the rest of the test suite.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import database
+
+# Tables that stay a handful of rows by design - the planner rightly scans them
+SMALL_TABLES = {
+    'settings', 'user_preferences', 'log_versions', 'scheduler_lock', 'scheduler_jobs',
+    'last_sessions', 'archived_exercises', 'sqlite_master',
+}
+
+# (function, plan detail prefix) -> why the scan or sort is fine
+ALLOWED = {
+    ('get_total_days_tracked', 'SCAN daily_stats USING COVERING INDEX'): 'COUNT(*) over one row per day',
+    ('get_best_streak', 'USE TEMP B-TREE FOR GROUP BY'): 'grouping by the computed run number',
+    ('get_period_report', 'USE TEMP B-TREE FOR GROUP BY'): 'run numbers, and per-exercise maxima over the history views',
+    ('get_period_report', 'USE TEMP B-TREE FOR count(DISTINCT)'): "distinct days within one period's workouts",
+    ('get_period_report', 'USE TEMP B-TREE FOR ORDER BY'): 'sorting the per-exercise totals, one row per exercise',
+    ('get_favorite_foods', 'SCAN favorite_foods USING INDEX idx_favorite_foods_times'):
+        'walks the popularity index from the top and stops at LIMIT',
+    ('get_recipes', 'SCAN recipes USING INDEX'): 'lists every recipe, in name order straight from the index',
+    ('get_changed_entities', 'USE TEMP B-TREE FOR DISTINCT'): 'at most one row per entity type',
+    ('get_workout_history', 'USE TEMP B-TREE FOR GROUP BY'): 'summing the sets in range per workout',
+    ('get_exercise_progress', 'USE TEMP B-TREE FOR GROUP BY'): 'summing the sets in range per workout',
+    ('get_workout_session', 'USE TEMP B-TREE FOR ORDER BY'): 'the sets of one session, in logged order',
+    ('get_workout_log', 'USE TEMP B-TREE FOR GROUP BY'): 'totals for the days on one page, over the history views',
+    ('search_logs', 'USE TEMP B-TREE FOR ORDER BY'): 'date order of the full-text matches, limited',
+    ('invalidate_recipes_with_food', 'SCAN recipes'): 'planner prefers a pass over the small recipes table',
+    ('save_catalog_food', 'SCAN recipes'): 'marks recipes stale like invalidate_recipes_with_food',
+    ('delete_catalog_food', 'SCAN recipes'): 'marks recipes stale like invalidate_recipes_with_food',
+    ('archive_old_rows', 'UNION USING TEMP B-TREE'): 'distinct years of the rows being archived',
+    ('clear_todays_workouts', 'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY'): 'newest row per cleared exercise',
+    ('rebuild_last_sessions', 'SCAN'): 'rebuilds read every workout',
+    ('rebuild_last_sessions', 'USE TEMP B-TREE'): 'rebuilds read every workout',
+    ('rebuild_search_index', 'SCAN'): 'rebuilds read every meal and workout',
+    ('rebuild_nutrition_rollups', 'SCAN'): 'rebuilds read every meal, archived years included',
+    ('rebuild_nutrition_rollups', 'USE TEMP B-TREE FOR GROUP BY'): 'one group per day across the history views',
+}
+
+# Functions that run no queries of their own, or only DDL
+NOT_PLANNED = {
+    'connect_reader', 'connect_writer', 'connect_history', 'release_connections', 'init_db',
+    'begin_request', 'end_request', 'get_today_date', 'get_today', 'run_maintenance', 'checkpoint_wal',
+}
+
+MEALS_PER_DAY = 4
+HISTORY_DAYS = 730
+EXERCISES = ['Bench Press', 'Squat', 'Deadlift', 'Overhead Press', 'Barbell Row', 'Pull Up', 'Lunge', 'Curl']
+MEAL_TIMES = ['Breakfast', 'Lunch', 'Afternoon Snack', 'Dinner']
+CATALOG_FOODS = 50000
+
+
+def populate(path, days=HISTORY_DAYS):
+    """Fill a fresh database with a realistic amount of history"""
+    random.seed(42)
+    database.DATABASE_NAME = path
+    database.init_db()
+    database.save_onboarding(150, 2500, 'Any', 'Build muscle', 80, 'Active')
+
+    today = date.today()
+    dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days, -1, -1)]
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO meals (food_name, quantity, protein, calories, meal_time, date_logged)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(f'Food {random.randint(1, 300)} (100.0 grams)', 100, random.uniform(5, 50),
+           random.uniform(100, 900), meal_time, day)
+          for day in dates for meal_time in MEAL_TIMES[:MEALS_PER_DAY]])
+    cursor.executemany('''
+        INSERT INTO workouts (exercise_name, weight, reps, sets, date_logged, notes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(exercise, random.uniform(50, 300), random.randint(3, 12), random.randint(1, 5), day,
+           random.choice(['', 'felt strong', 'shoulder twinge', 'easy day']))
+          for index, day in enumerate(dates) if index % 2 == 0
+          for exercise in random.sample(EXERCISES, 4)])
+
+    # Every other training day is logged set by set as a session
+    training_days = sorted({day for (day,) in cursor.execute('SELECT DISTINCT date_logged FROM workouts')})
+    for day in training_days[::2]:
+        cursor.execute('INSERT INTO workout_sessions (date_logged, notes) VALUES (?, ?)', (day, ''))
+        session_id = cursor.lastrowid
+        workouts = cursor.execute('SELECT id, weight, reps, sets FROM workouts WHERE date_logged = ?',
+                                  (day,)).fetchall()
+        cursor.executemany('''
+            INSERT INTO workout_sets (workout_id, session_id, set_number, weight, reps, date_logged)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(workout_id, session_id, number, weight - 5 * (sets - number), reps, day)
+              for workout_id, weight, reps, sets in workouts for number in range(1, sets + 1)])
+    cursor.executemany('''
+        INSERT INTO daily_stats (date, protein_goal_met, calorie_goal_met, both_goals_met)
+        VALUES (?, ?, ?, ?)
+    ''', [(day, met, met, met) for day in dates for met in [int(random.random() < 0.6)]])
+    cursor.executemany('''
+        INSERT INTO favorite_foods (food_name, quantity, unit, protein, calories, times_logged)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(f'Food {index}', 100, 'grams', 20, 300, random.randint(1, 500)) for index in range(300)])
+    cursor.executemany('''
+        INSERT INTO food_catalog (name, calories, protein, base_unit, grams_per_unit)
+        VALUES (?, ?, ?, '100g', ?)
+    ''', [(f'Catalog Food {index}', random.uniform(0, 900), random.uniform(0, 100), 30)
+          for index in range(CATALOG_FOODS)])
+    cursor.executemany('''
+        INSERT INTO change_log (entity, entity_id, op, data, changed_at)
+        VALUES ('meal', ?, 'upsert', '{}', datetime('now', ?))
+    ''', [(index, f'-{index % 40} days') for index in range(20000)])
+    conn.commit()
+    conn.close()
+
+    for index in range(50):
+        database.save_recipe(f'Recipe {index}', 2, [{'food': 'Chicken', 'quantity': 200, 'unit': 'grams'},
+                                                   {'food': f'Food {index}', 'quantity': 100, 'unit': 'grams'}],
+                             30, 400)
+
+    database.rebuild_nutrition_rollups()
+    database.archive_old_rows(365)
+    database.rebuild_search_index()
+    database.rebuild_last_sessions()
+    database.run_maintenance()
+    database.release_connections()
+
+
+def _calls():
+    """(function name, call) for every public function, read-only ones first"""
+    today = database.get_today()
+    month_ago = (date.fromisoformat(today) - timedelta(days=30)).isoformat()
+    two_years_ago = (date.fromisoformat(today) - timedelta(days=700)).isoformat()
+    return [
+        ('get_todays_meals', lambda: database.get_todays_meals()),
+        ('get_todays_workouts', lambda: database.get_todays_workouts()),
+        ('get_todays_totals', lambda: database.get_todays_totals()),
+        ('get_meal_by_id', lambda: database.get_meal_by_id(1)),
+        ('get_goals', lambda: database.get_goals()),
+        ('is_user_onboarded', lambda: database.is_user_onboarded()),
+        ('get_user_preferences', lambda: database.get_user_preferences()),
+        ('get_theme', lambda: database.get_theme()),
+        ('get_timezone', lambda: database.get_timezone()),
+        ('get_last_workout', lambda: database.get_last_workout('Squat')),
+        ('get_last_sessions', lambda: database.get_last_sessions()),
+        ('get_workout_history', lambda: database.get_workout_history(30)),
+        ('get_exercise_progress', lambda: database.get_exercise_progress('Squat', 400)),
+        ('get_workout_session', lambda: database.get_workout_session(3)),
+        ('get_all_exercises', lambda: database.get_all_exercises()),
+        ('get_current_streak', lambda: database.get_current_streak()),
+        ('get_total_days_tracked', lambda: database.get_total_days_tracked()),
+        ('get_best_streak', lambda: database.get_best_streak()),
+        ('get_favorite_foods', lambda: database.get_favorite_foods(5)),
+        ('get_catalog_food', lambda: database.get_catalog_food('Catalog Food 123')),
+        ('search_catalog', lambda: database.search_catalog('catalog food 12', 20)),
+        ('get_recipes', lambda: database.get_recipes()),
+        ('get_recipe', lambda: database.get_recipe(1, include_ingredients=True)),
+        ('get_nutrition_trends', lambda: database.get_nutrition_trends(month_ago, today, 'day')),
+        ('get_nutrition_trends', lambda: database.get_nutrition_trends(two_years_ago, today, 'week')),
+        ('get_nutrition_trends', lambda: database.get_nutrition_trends(two_years_ago, today, 'month')),
+        ('get_first_log_date', lambda: database.get_first_log_date()),
+        ('get_period_report', lambda: database.get_period_report(month_ago, today)),
+        ('get_log_versions', lambda: database.get_log_versions()),
+        ('get_job_last_run', lambda: database.get_job_last_run('maintenance')),
+        ('get_change_cursor', lambda: database.get_change_cursor()),
+        ('get_changes_since', lambda: database.get_changes_since(15000, 500)),
+        ('get_changed_entities', lambda: database.get_changed_entities(15000)),
+        ('get_meal_history', lambda: database.get_meal_history(None, 50)),
+        ('get_meal_history', lambda: database.get_meal_history((two_years_ago, 10 ** 9), 50, 'Lunch')),
+        ('get_workout_log', lambda: database.get_workout_log(None, 50)),
+        ('get_workout_log', lambda: database.get_workout_log((two_years_ago, 10 ** 9), 50, 'Squat')),
+        ('search_logs', lambda: database.search_logs('shoulder', limit=20)),
+        ('search_logs', lambda: database.search_logs('food', 'meal', month_ago, today, 20, 'recent')),
+
+        ('add_meal', lambda: database.add_meal('Chicken (200.0 grams)', 200, 62, 330, 'Lunch')),
+        ('update_meal', lambda: database.update_meal(1, 'Rice (100.0 grams)', 100, 3, 130, 'Dinner')),
+        ('delete_meal', lambda: database.delete_meal('Chicken (200.0 grams)', 'Lunch')),
+        ('delete_meal_by_id', lambda: database.delete_meal_by_id(2)),
+        ('clear_todays_meals', lambda: database.clear_todays_meals()),
+        ('add_workout', lambda: database.add_workout('Squat', 225, 5, 5, 'heavy')),
+        ('log_workout_session', lambda: database.log_workout_session(
+            [{'exercise': 'Squat', 'sets': [{'weight': 225, 'reps': 5}, {'weight': 235, 'reps': 3}]},
+             {'exercise': 'Curl', 'sets': [{'weight': 30, 'reps': 12}]}], 'quick one')),
+        ('clear_todays_workouts', lambda: database.clear_todays_workouts()),
+        ('rebuild_last_sessions', lambda: database.rebuild_last_sessions()),
+        ('update_goals', lambda: database.update_goals(160, 2600)),
+        ('save_onboarding', lambda: database.save_onboarding(160, 2600, 'Any', 'Build muscle', 80, 'Active')),
+        ('update_theme', lambda: database.update_theme('dark')),
+        ('update_timezone', lambda: database.update_timezone('UTC')),
+        ('record_daily_stats', lambda: database.record_daily_stats(True, False)),
+        ('add_favorite_food', lambda: database.add_favorite_food('Food 7', 100, 'grams', 20, 300)),
+        ('remove_favorite_food', lambda: database.remove_favorite_food('Food 8', 100, 'grams')),
+        ('save_recipe', lambda: database.save_recipe('Recipe X', 1, [{'food': 'Chicken', 'quantity': 1,
+                                                                      'unit': 'grams'}], 1, 1)),
+        ('update_recipe_nutrition', lambda: database.update_recipe_nutrition(1, 31, 410)),
+        ('invalidate_recipes_with_food', lambda: database.invalidate_recipes_with_food('Chicken')),
+        ('save_catalog_food', lambda: database.save_catalog_food('Catalog Food 7', 120, 20)),
+        ('delete_catalog_food', lambda: database.delete_catalog_food('Catalog Food 8')),
+        ('delete_recipe', lambda: database.delete_recipe(2)),
+        ('finalize_day', lambda: database.finalize_day(month_ago)),
+        ('advance_log_versions', lambda: database.advance_log_versions(database.get_log_versions())),
+        ('acquire_scheduler_lock', lambda: database.acquire_scheduler_lock('query-plans', 60)),
+        ('release_scheduler_lock', lambda: database.release_scheduler_lock('query-plans')),
+        ('set_job_last_run', lambda: database.set_job_last_run('maintenance', str(time.time()))),
+        ('prune_change_log', lambda: database.prune_change_log(30)),
+        ('rebuild_nutrition_rollups', lambda: database.rebuild_nutrition_rollups()),
+        ('archive_old_rows', lambda: database.archive_old_rows(300)),
+        ('rebuild_search_index', lambda: database.rebuild_search_index()),
+    ]
+
+
+class _Recorder:
+    """Collects (function, sql, plan rows) for statements while a function runs"""
+
+    def __init__(self):
+        self.function = None
+        self.statements = []
+
+    def record(self, conn, sql, params):
+        if self.function is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE',
+                                                                          'DELETE', 'REPLACE')):
+            return
+        try:
+            plan = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error as e:
+            plan = [(0, 0, 0, f'UNPLANNED ({e})')]
+        self.statements.append((self.function, ' '.join(sql.split()), [row[3] for row in plan]))
+
+
+recorder = _Recorder()
+
+
+class _PlannedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        recorder.record(self.connection, sql, params)
+        return super().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if seq_of_params:
+            recorder.record(self.connection, sql, seq_of_params[0])
+        return super().executemany(sql, seq_of_params)
+
+
+class _PlannedConnection(sqlite3.Connection):
+    def cursor(self, factory=_PlannedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+
+def problems(plan, tables):
+    """Plan lines that are a full scan of one of tables, a temp b-tree, or a failed plan"""
+    found = []
+    for detail in plan:
+        words = detail.split()
+        if 'TEMP B-TREE' in detail or words[0] == 'UNPLANNED':
+            found.append(detail)
+        # Scans of views, CTEs and subqueries walk intermediate results, not tables
+        elif words[0] == 'SCAN' and words[1].split('.')[-1] in tables - SMALL_TABLES:
+            if 'VIRTUAL TABLE INDEX' not in detail:
+                found.append(detail)
+    return found
+
+
+def _allowed(function, detail):
+    return any(function == allowed_function and detail.startswith(prefix)
+               for allowed_function, prefix in ALLOWED)
+
+
+def run(verbose=False):
+    """Populate a scratch database and plan every statement; returns the number of failures"""
+    original_connect = sqlite3.connect
+    previous_name = database.DATABASE_NAME
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        populate(os.path.join(directory, 'plans.db'))
+        conn = sqlite3.connect(database.DATABASE_NAME)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        tables.add('sqlite_master')
+        conn.close()
+
+        def planned_connect(*args, **kwargs):
+            kwargs.setdefault('factory', _PlannedConnection)
+            return original_connect(*args, **kwargs)
+
+        # Cached connections were opened unpatched - drop them so every query goes through the recorder
+        database.release_connections()
+        database._readers.connection = None
+        database._writer = None
+        sqlite3.connect = planned_connect
+        timings = {}
+        try:
+            for function, call in _calls():
+                # Today's logs are cached in-process; clear them so their queries run too
+                database._todays_meals = database._todays_workouts = None
+                recorder.function = function
+                started = time.perf_counter()
+                call()
+                timings[function] = timings.get(function, 0) + time.perf_counter() - started
+                recorder.function = None
+                database.release_connections()
+        finally:
+            sqlite3.connect = original_connect
+            recorder.function = None
+            database._readers.connection = None
+            database._writer = None
+            database.DATABASE_NAME = previous_name
+
+    seen = set()
+    for function, sql, plan in recorder.statements:
+        if (function, sql) in seen:
+            continue
+        seen.add((function, sql))
+        bad = [detail for detail in problems(plan, tables) if not _allowed(function, detail)]
+        failures += len(bad)
+        if verbose or bad:
+            print(f"{function}: {sql[:160]}")
+            for detail in plan:
+                print(f"    {'!! ' if detail in bad else ''}{detail}")
+
+    public = {name for name, value in vars(database).items()
+              if callable(value) and not name.startswith('_') and getattr(value, '__module__', None) == 'database'
+              and not isinstance(value, type)}
+    missing = sorted(public - NOT_PLANNED - set(timings))
+    for name in missing:
+        print(f"!! {name} is not in query_plans.CALLS")
+    failures += len(missing)
+
+    if verbose:
+        print('\nTimings:')
+        for function, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            print(f"    {seconds * 1000:9.2f} ms  {function}")
+    return failures
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ('check', 'show'):
+        print(__doc__)
+        sys.exit(1)
+
+    failure_count = run(verbose=sys.argv[1] == 'show')
+    if sys.argv[1] == 'check':
+        print(f"{failure_count} plan problems" if failure_count else 'All query plans OK')
+    sys.exit(1 if failure_count else 0)
@@ -0,0 +1,155 @@
+"""Weekly and monthly summary reports, written as static JSON and HTML.
+
+    python reports.py [--backfill] [--workers N] [database ...]
+
+Each database file is one user's tracker; with none given, the app's own
+database is used. Reports cover the last finished week and month, or with
+--backfill every finished period since the first log that has no report
+yet. They are written to reports/<database name>/ next to the database,
+e.g. week-2026-10-12.json and week-2026-10-12.html.
+
+Databases are spread over a process pool, and every worker reads through
+its own read-only connections, so report runs never take the write lock.
+The scheduler regenerates the app's own reports daily.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+from jinja2 import Environment, FileSystemLoader
+
+import database
+
+REPORT_DIR = os.environ.get('TRACKER_REPORT_DIR', 'reports')
+KINDS = ('week', 'month')
+
+_templates = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=True,
+)
+
+
+def report_dir(db_path):
+    """Report directory for one database, relative paths resolved next to it"""
+    base_dir = os.path.dirname(os.path.abspath(db_path))
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(base_dir, REPORT_DIR, name)
+
+
+def _periods(kind, today, first_date=None):
+    """(start, end) of finished periods, newest first: the latest only, or all back to first_date"""
+    if kind == 'week':
+        start = date.fromisoformat(database._week_start(today.isoformat())) - timedelta(days=7)
+    else:
+        start = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+    while True:
+        if kind == 'week':
+            end = start + timedelta(days=6)
+        else:
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        yield start.isoformat(), end.isoformat()
+
+        if first_date is None or start.isoformat() <= first_date:
+            return
+        start = start - timedelta(days=7) if kind == 'week' else (start - timedelta(days=1)).replace(day=1)
+
+
+def _write_atomic(path, text):
+    """Write a file via a temp file beside it, so readers never see half a report"""
+    fd, temp_path = tempfile.mkstemp(prefix='.partial-', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def generate_reports(db_path=None, backfill=False):
+    """Write the reports for one database; returns the paths written
+
+    Points database.DATABASE_NAME at db_path for the duration, so reports for
+    other databases belong in a process of their own, as main() arranges.
+    """
+    previous = database.DATABASE_NAME
+    database.DATABASE_NAME = db_path or previous
+    try:
+        first_date = database.get_first_log_date()
+        if first_date is None:
+            return []
+
+        directory = report_dir(database.DATABASE_NAME)
+        os.makedirs(directory, exist_ok=True)
+        html_template = _templates.get_template('report.html')
+
+        written = []
+        today = database.get_today_date()
+        for kind in KINDS:
+            for index, (start, end) in enumerate(_periods(kind, today, first_date if backfill else None)):
+                base_path = os.path.join(directory, f'{kind}-{start}')
+                # The latest period is always rewritten; older ones only when missing
+                if index > 0 and os.path.exists(base_path + '.json'):
+                    continue
+
+                report = database.get_period_report(start, end)
+                report['kind'] = kind
+                _write_atomic(base_path + '.json', json.dumps(report, indent=2))
+                _write_atomic(base_path + '.html', html_template.render(report=report))
+                written.append(base_path + '.html')
+        return written
+    finally:
+        database.DATABASE_NAME = previous
+
+
+def _generate_one(task):
+    """Pool worker: (db_path, paths, error) so one bad database does not stop the run"""
+    db_path, backfill = task
+    try:
+        return db_path, generate_reports(db_path, backfill), None
+    except Exception as e:
+        return db_path, [], str(e)
+
+
+def generate_all(db_paths, backfill=False, workers=None):
+    """Generate reports for many databases in parallel; yields (db_path, paths, error)"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = [(db_path, backfill) for db_path in db_paths]
+
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(_generate_one, tasks)
+        return
+
+    # Hand out databases in small batches to keep every worker busy to the end
+    chunksize = max(1, len(tasks) // (workers * 8))
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(_generate_one, tasks, chunksize=chunksize)
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    backfill_reports = '--backfill' in arguments
+    worker_count = None
+    if '--workers' in arguments:
+        index = arguments.index('--workers')
+        worker_count = int(arguments[index + 1])
+        del arguments[index:index + 2]
+    paths = [argument for argument in arguments if argument != '--backfill'] or [database.DATABASE_NAME]
+
+    if any(path.startswith('-') or not os.path.isfile(path) for path in paths):
+        print(__doc__)
+        sys.exit(1)
+
+    started = time.time()
+    reports_written = failures = 0
+    for path, written_paths, error in generate_all(paths, backfill_reports, worker_count):
+        if error:
+            failures += 1
+            print(f"{path}: {error}")
+        reports_written += len(written_paths)
+
+    print(f"{reports_written} reports for {len(paths) - failures} databases in {time.time() - started:.1f}s"
+          + (f", {failures} failed" if failures else ''))
+    sys.exit(1 if failures else 0)
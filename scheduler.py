@@ -0,0 +1,125 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+import backup
+import database
+import reports
+
+# How often the scheduler wakes up, and how long a leader lease lasts without renewal.
+# The lease is renewed after every job, so each single job must finish within it
+TICK_SECONDS = 30
+LEASE_SECONDS = 90
+
+MAINTENANCE_INTERVAL = 24 * 60 * 60
+CHECKPOINT_INTERVAL = 5 * 60
+ARCHIVE_INTERVAL = 24 * 60 * 60
+BACKUP_INTERVAL = 24 * 60 * 60
+CHANGE_LOG_PRUNE_INTERVAL = 24 * 60 * 60
+REPORT_INTERVAL = 24 * 60 * 60
+
+# Longest gap of unfinalized days to catch up on after downtime
+MAX_CATCH_UP_DAYS = 366
+
+
+def finalize_days():
+    """Settle every finished day since the last run, up to yesterday in the user's timezone"""
+    yesterday = database.get_today_date() - timedelta(days=1)
+    last_run = database.get_job_last_run('finalize_day')
+
+    if last_run:
+        day = date.fromisoformat(last_run) + timedelta(days=1)
+    else:
+        day = yesterday
+    day = max(day, yesterday - timedelta(days=MAX_CATCH_UP_DAYS))
+
+    while day <= yesterday:
+        database.finalize_day(day.isoformat())
+        database.set_job_last_run('finalize_day', day.isoformat())
+        day += timedelta(days=1)
+
+
+def _interval_job(name, interval, run):
+    """Wrap run() so it only fires once every interval seconds across all workers"""
+    def job():
+        last_run = database.get_job_last_run(name)
+        if last_run and time.time() - float(last_run) < interval:
+            return
+        run()
+        database.set_job_last_run(name, str(time.time()))
+    job.__name__ = name
+    return job
+
+
+JOBS = [
+    finalize_days,
+    _interval_job('maintenance', MAINTENANCE_INTERVAL, database.run_maintenance),
+    _interval_job('wal_checkpoint', CHECKPOINT_INTERVAL, database.checkpoint_wal),
+    _interval_job('archive', ARCHIVE_INTERVAL, database.archive_old_rows),
+    _interval_job('backup', BACKUP_INTERVAL, backup.create_backup),
+    _interval_job('prune_change_log', CHANGE_LOG_PRUNE_INTERVAL, database.prune_change_log),
+    _interval_job('reports', REPORT_INTERVAL, reports.generate_reports),
+]
+
+
+class Scheduler:
+    """Background thread that runs JOBS in whichever worker currently holds the leader lock"""
+
+    def __init__(self, jobs=None, tick_seconds=TICK_SECONDS, lease_seconds=LEASE_SECONDS):
+        self.jobs = jobs if jobs is not None else JOBS
+        self.tick_seconds = tick_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='tracker-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        database.release_scheduler_lock(self.owner)
+
+    def run_once(self):
+        """Run every job once if this worker is (or becomes) the leader; returns leadership"""
+        if not database.acquire_scheduler_lock(self.owner, self.lease_seconds):
+            return False
+
+        for job in self.jobs:
+            try:
+                job()
+            except Exception as e:
+                print(f"Scheduler job {job.__name__} failed: {e}")
+            finally:
+                database.release_connections()
+
+            # Renew after each job, so the run as a whole may outlast one lease;
+            # if another worker took over meanwhile, leave the remaining jobs to it
+            if not database.acquire_scheduler_lock(self.owner, self.lease_seconds):
+                return False
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Scheduler error: {e}")
+            self._stop.wait(self.tick_seconds)
+
+
+scheduler = Scheduler()
+
+
+def start():
+    """Start the background scheduler unless TRACKER_SCHEDULER=0"""
+    if os.environ.get('TRACKER_SCHEDULER', '1') != '0':
+        scheduler.start()
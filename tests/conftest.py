@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['TRACKER_SCHEDULER'] = '0'
+# Pages render without the vendored files, which only deployments need
+os.environ['TRACKER_ASSETS_CDN'] = '1'
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """database pointed at a fresh file, with today's caches cleared"""
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'tracker.db'))
+    monkeypatch.setattr(database, '_todays_meals', None)
+    monkeypatch.setattr(database, '_todays_workouts', None)
+    database.init_db()
+    yield database
+    database.release_connections()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    # Importing app runs init_db, so it must happen after DATABASE_NAME is patched
+    import admission
+    import app
+    monkeypatch.setattr(app, 'admission_control', admission.Admission())
+    return app.app.test_client()
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+import analytics
+
+
+def test_volume_includes_archived_years(db):
+    old_day = (db.get_today_date() - timedelta(days=400)).isoformat()
+    db.log_workout_session([{'exercise': 'Squat', 'sets': [{'weight': 100, 'reps': 5},
+                                                           {'weight': 120, 'reps': 3}]}],
+                           date_logged=old_day)
+    db.add_workout('Squat', 100, 5, 1)
+    assert sum(day['volume'] for day in analytics.get_rolling_volume(500)) == 860 + 500
+
+    # The old session moves to the archive and must still count
+    db.archive_old_rows(365)
+    db.add_workout('Squat', 100, 5, 1)
+    assert sum(day['volume'] for day in analytics.get_rolling_volume(500)) == 860 + 1000
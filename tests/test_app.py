@@ -0,0 +1,75 @@
+def test_write_endpoints_exist(client):
+    import app
+    missing = app.WRITE_ENDPOINTS - set(app.app.view_functions)
+    assert not missing, f'WRITE_ENDPOINTS names unknown endpoints: {missing}'
+
+
+def test_get_delete_goes_through_admission(client, db):
+    import app
+    meal_id = db.add_meal('Rice (100.0 grams)', 100, 3, 130, 'Lunch')
+    admitted = app.admission_control.stats()['admitted']
+
+    client.get(f'/delete_meal/{meal_id}')
+
+    assert app.admission_control.stats()['admitted'] == admitted + 1
+    assert db.get_meal_by_id(meal_id) is None
+
+
+def test_changing_an_ingredient_recomputes_recipes(client, db):
+    import app
+    db.save_catalog_food('Oats', 400, 10)
+    response = client.post('/api/recipes', json={'name': 'Porridge', 'servings': 1,
+                                                  'ingredients': [{'food': 'Oats', 'quantity': 100, 'unit': 'grams'}]})
+    recipe_id = response.get_json()['id']
+    assert app.recipe_nutrition(db.get_recipe(recipe_id)) == (10, 400)
+
+    assert client.put('/api/foods/Oats', json={'calories': 380, 'protein': 13}).status_code == 200
+    assert app.recipe_nutrition(db.get_recipe(recipe_id)) == (13, 380)
+
+
+def test_recipe_with_removed_ingredient_is_rejected(client, db):
+    db.save_catalog_food('Oats', 400, 10)
+    recipe_id = client.post('/api/recipes', json={'name': 'Porridge', 'servings': 1, 'ingredients': [
+        {'food': 'Oats', 'quantity': 100, 'unit': 'grams'}]}).get_json()['id']
+    assert client.delete('/api/foods/Oats').status_code == 200
+
+    response = client.post(f'/log_recipe/{recipe_id}', data={'servings': 1, 'meal_time': 'Lunch'},
+                           headers={'Accept': 'application/json'})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unknown ingredient: Oats'
+
+
+def test_logged_workout_carries_the_users_date(client, db):
+    response = client.post('/add_workout', data={'exercise': 'Squat', 'weight': 100, 'reps': 5, 'sets': 3},
+                           headers={'Accept': 'application/json'})
+
+    assert response.get_json()['date'] == db.get_today()
+
+
+def test_history_filters_by_every_meal_time(client, db):
+    db.save_onboarding(150, 2500, 'Any', 'Build muscle', 80, 'Active')
+    db.add_meal('Apple', '1', 0.5, 95, 'Afternoon Snack')
+
+    page = client.get('/history').get_data(as_text=True)
+    assert '<option value="Afternoon Snack">' in page
+    assert '<option value="Afternoon Snack">' in client.get('/').get_data(as_text=True)
+
+    days = client.get('/api/history/meals?meal_time=Afternoon Snack').get_json()['days']
+    assert [meal['food'] for meal in days[0]['meals']] == ['Apple']
+
+
+def test_ingredients_match_catalog_foods_case_insensitively(client, db):
+    import app
+    db.save_catalog_food('Oats', 400, 10)
+    recipe_id = client.post('/api/recipes', json={'name': 'Porridge', 'servings': 1, 'ingredients': [
+        {'food': 'oats', 'quantity': 100, 'unit': 'grams'}]}).get_json()['id']
+    assert app.recipe_nutrition(db.get_recipe(recipe_id)) == (10, 400)
+
+    client.put('/api/foods/Oats', json={'calories': 380, 'protein': 13})
+    assert app.recipe_nutrition(db.get_recipe(recipe_id)) == (13, 380)
+
+    client.delete('/api/foods/OATS')
+    response = client.post(f'/log_recipe/{recipe_id}', data={'servings': 1, 'meal_time': 'Lunch'},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 400
@@ -0,0 +1,30 @@
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, 'STATIC_DIR', str(tmp_path))
+    monkeypatch.setattr(assets, 'MANIFEST_PATH', str(tmp_path / 'dist' / 'manifest.json'))
+    monkeypatch.setattr(assets, 'ASSETS_CDN', False)
+    for source in [source for sources in assets.BUNDLES.values() for source in sources] + list(assets.VENDOR):
+        (tmp_path / source).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / source).write_text('')
+    return tmp_path
+
+
+def test_missing_vendored_file_fails_startup(static_dir, monkeypatch):
+    assets.check_sources()
+
+    (static_dir / 'vendor' / 'fontawesome' / 'webfonts' / 'fa-solid-900.woff2').unlink()
+    with pytest.raises(RuntimeError, match='fa-solid-900.woff2'):
+        assets.check_sources()
+
+    (static_dir / 'vendor' / 'chart.umd.min.js').unlink()
+    with pytest.raises(RuntimeError, match='chart.umd.min.js'):
+        assets.check_sources()
+
+    # Only an explicit opt-in falls back to the CDN
+    monkeypatch.setattr(assets, 'ASSETS_CDN', True)
+    assets.check_sources()
@@ -0,0 +1,23 @@
+import os
+from datetime import timedelta
+
+import backup
+
+
+def test_restore_brings_back_archived_years(db):
+    old_day = (db.get_today_date() - timedelta(days=400)).isoformat()
+    db.add_meal('Oats', '100g', 10, 100, 'Breakfast', date_logged=old_day)
+    db.add_meal('Eggs', '2', 12, 150, 'Breakfast', date_logged=old_day)
+    db.add_meal('Rice', '200g', 5, 260, 'Lunch')
+    db.archive_old_rows(365)
+
+    path = backup.create_backup(compress=True)
+    assert backup.verify_backup(path)['meals'] == 3
+
+    db.add_meal('Toast', '1', 3, 80, 'Breakfast')
+    for year in db._archive_years():
+        os.remove(db._archive_path(year))
+
+    assert backup.restore_backup(path)['meals'] == 3
+    days = db.get_meal_history(limit=10)['days']
+    assert sum(len(day['meals']) for day in days) == 3
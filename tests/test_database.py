@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+
+def test_uneven_sets_count_set_by_set(db):
+    db.log_workout_session([
+        {'exercise': 'Squat', 'sets': [{'weight': 100, 'reps': 5}, {'weight': 120, 'reps': 3}]},
+    ])
+    db.add_workout('Bench Press', 50, 10, 3)
+    expected = 100 * 5 + 120 * 3 + 50 * 10 * 3
+
+    assert db.get_workout_log()['days'][0]['total_volume'] == expected
+    assert db.get_workout_log(exercise_name='Squat')['days'][0]['total_volume'] == 860
+    assert db.get_workout_history(1)[-1]['total_volume'] == expected
+    assert db.get_exercise_progress('Squat', 1)[-1]['volume'] == 860
+
+
+def test_todays_cache_reads_version_and_rows_in_one_snapshot(db, monkeypatch):
+    import threading
+    db.add_meal('Oats', '100g', 10, 100, 'Breakfast')
+    read_version = db._get_log_version
+    writes = []
+
+    def version_then_concurrent_write(cursor, name):
+        version = read_version(cursor, name)
+        if not writes:
+            # Another thread commits a meal between the version read and the row read
+            writes.append(threading.Thread(target=db.add_meal, args=('Eggs', '2', 20, 200, 'Lunch')))
+            writes[0].start()
+            writes[0].join()
+        return version
+
+    monkeypatch.setattr(db, '_get_log_version', version_then_concurrent_write)
+    day_log = db._load_todays_meals()
+    assert [meal.food for meal in day_log.records] == ['Oats']
+
+    monkeypatch.setattr(db, '_get_log_version', read_version)
+    assert db.get_todays_totals() == {'protein': 30, 'calories': 300}
+
+
+def test_cached_append_skips_a_row_already_loaded(db):
+    meal_id = db.add_meal('Oats', '100g', 10, 100, 'Breakfast')
+    day_log = db._load_todays_meals()
+    day_log.add_meal(db.MealRecord(meal_id, 'Oats', '100g', 10, 100, 'Breakfast'))
+    assert len(day_log.records) == 1
+    assert day_log.protein_total == 10
+
+
+def test_rebuilding_rollups_keeps_archived_days(db):
+    old_day = (db.get_today_date() - timedelta(days=400)).isoformat()
+    db.add_meal('Oats', '100g', 10, 100, 'Breakfast', date_logged=old_day)
+    db.add_meal('Rice', '200g', 5, 260, 'Lunch')
+    db.archive_old_rows(365)
+
+    db.rebuild_nutrition_rollups()
+    days = db.get_nutrition_trends(old_day, db.get_today(), 'day')
+    assert [day['protein'] for day in days] == [10, 5]
+
+
+def test_history_reads_use_read_only_connections(db, monkeypatch):
+    old_day = (db.get_today_date() - timedelta(days=400)).isoformat()
+    db.add_meal('Oats', '100g', 10, 100, 'Breakfast', date_logged=old_day)
+    db.add_workout('Squat', 100, 5, 3, date_logged=old_day)
+    db.archive_old_rows(365)
+
+    opened = []
+    connect_history = db.connect_history
+
+    def spy(start_date=None, read_only=False):
+        opened.append(read_only)
+        conn = connect_history(start_date, read_only)
+        if read_only:
+            assert conn.execute(f'PRAGMA archive_{old_day[:4]}.cache_size').fetchone()[0] == -db.READ_CACHE_KB
+        return conn
+
+    monkeypatch.setattr(db, 'connect_history', spy)
+    db.get_workout_history(500)
+    db.get_exercise_progress('Squat', 500)
+    db.get_meal_history()
+    db.get_workout_log()
+    assert opened == [True] * 4
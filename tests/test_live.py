@@ -0,0 +1,38 @@
+import live
+
+
+def publish(hub, entities):
+    """What the hub thread does for one change"""
+    with hub._condition:
+        hub._message = hub._encode(hub.build_events(entities), 0)
+        hub._generation += 1
+        hub._backlog.append((hub._generation, set(entities)))
+        hub._condition.notify_all()
+
+
+def test_stream_behind_by_several_updates_gets_all_of_them(db):
+    hub = live.Hub(lambda entities: {name: {} for name in sorted(entities)}, keepalive_seconds=0)
+    hub._thread = 'not started'
+    stream = hub.stream(entities={'meal', 'workout'})
+    next(stream)
+
+    publish(hub, {'meal'})
+    publish(hub, {'workout'})
+    message = next(stream)
+
+    assert 'event: meal' in message
+    assert 'event: workout' in message
+
+
+def test_stream_behind_the_backlog_gets_a_snapshot(db):
+    hub = live.Hub(lambda entities: {name: {} for name in sorted(entities)}, keepalive_seconds=0)
+    hub._thread = 'not started'
+    stream = hub.stream(entities={'meal', 'workout'})
+    next(stream)
+
+    publish(hub, {'meal'})
+    for _ in range(live.BACKLOG_GENERATIONS):
+        publish(hub, {'workout'})
+    message = next(stream)
+
+    assert 'event: meal' in message
@@ -0,0 +1,7 @@
+import query_plans
+
+
+def test_query_plans(db, capsys):
+    # Plans every statement of every public database function against a populated scratch copy
+    failures = query_plans.run()
+    assert failures == 0, capsys.readouterr().out
@@ -0,0 +1,35 @@
+import scheduler
+
+
+def fake_clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(scheduler.database.time, 'time', lambda: clock[0])
+    return clock
+
+
+def test_lease_is_renewed_between_jobs(db, monkeypatch):
+    clock = fake_clock(monkeypatch)
+
+    def job():
+        clock[0] += 60
+
+    leader = scheduler.Scheduler(jobs=[job, job, job], lease_seconds=90)
+    assert leader.run_once()
+
+    # 180 seconds of jobs under a 90 second lease, still held after the last one
+    assert not db.acquire_scheduler_lock('other-worker', 90)
+
+
+def test_lost_lease_stops_the_run(db, monkeypatch):
+    clock = fake_clock(monkeypatch)
+    ran = []
+
+    def stuck_job():
+        ran.append('stuck')
+        clock[0] += 120
+        assert db.acquire_scheduler_lock('other-worker', 90)
+
+    leader = scheduler.Scheduler(jobs=[stuck_job, lambda: ran.append('next')], lease_seconds=90)
+
+    assert not leader.run_once()
+    assert ran == ['stuck']